@@ -1,8 +1,12 @@
 import os
+import json
+import shutil
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import List, Optional, Any, Dict
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi import BackgroundTasks, FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
@@ -13,17 +17,44 @@ from src.document_ingestion.data_ingestion import (
     ChatIngestor
 )
 
-from src.document_analyzer.data_analysis import DocumentAnalyzer
-from src.document_compare.document_compare import DocumentCompareLLM
+from src.document_analyzer.data_analysis import DocumentAnalyzer, analysis_cache_key
+from src.document_compare.document_compare import DocumentCompareLLM, comparison_cache_key, comparison_tag
 from src.document_chat.retrieval import ConversationalRAG
 from utils.document_ops import FastAPIFileAdapter, read_pdf_handler
+from utils.file_io import UploadTooLargeError, upload_sha256
+from utils.model_loader import init_model_registry, close_model_registry
+from utils.vectorstore_cache import VECTORSTORE_CACHE
+from utils.embedding_cache import get_embedding_cache
+from utils.embedding_scheduler import EMBEDDING_METRICS
+from utils.text_cache import get_text_cache
+from utils.query_rewrite import REWRITE_METRICS
+from utils.chat_memory import get_chat_memory
+from utils.answer_cache import get_answer_cache
+from utils.result_cache import get_result_cache
+from utils.hybrid_retriever import RETRIEVAL_METRICS
+from utils.context_packer import PACKING_METRICS
+from utils.concurrency import run_cpu, run_io, shutdown_executors
+from utils.pdf_extract import shutdown_pool
+from utils.config_loader import load_config_cached
+from logger.custom_logger import CustomLogger
 #from logger import GLOBAL_LOGGER as log
 
+log = CustomLogger().get_logger(__name__)
+
 FAISS_BASE = os.getenv("FAISS_BASE", "faiss_index")
 UPLOAD_BASE = os.getenv("UPLOAD_BASE", "data")
 FAISS_INDEX_NAME = os.getenv("FAISS_INDEX_NAME", "index")  # <--- keep consistent with save_local()
 
-app = FastAPI(title="Document Portal API", version="1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared model clients on startup and release them on shutdown."""
+    app.state.model_registry = init_model_registry()
+    yield
+    await close_model_registry()
+    shutdown_executors()
+    shutdown_pool()
+
+app = FastAPI(title="Document Portal API", version="1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -37,6 +68,13 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 
+def _raise_if_too_large(e: BaseException):
+    """Surface an oversized upload anywhere in the cause chain as HTTP 413."""
+    while e is not None:
+        if isinstance(e, UploadTooLargeError):
+            raise HTTPException(status_code=413, detail=str(e)) from e
+        e = e.__cause__  # type: ignore[assignment]
+
 @app.get("/", response_class=HTMLResponse)
 async def serve_ui(request: Request):
     """Render Index.html
@@ -60,10 +98,43 @@ def health() -> Dict[str, str]:
     return { "status": "ok", "service": "document_portal" }
 
 
+@app.get("/stats")
+def stats() -> Dict[str, Any]:
+    """In-process cache counters
+
+    Returns:
+        Dict[str, Any]: Hit/miss/eviction counters per cache.
+    """
+    stats = {
+        "vectorstore_cache": VECTORSTORE_CACHE.stats(),
+        "embedding_cache": get_embedding_cache().stats(),
+        "embedding_scheduler": EMBEDDING_METRICS.stats(),
+        "text_cache": get_text_cache().stats(),
+        "question_rewrite": REWRITE_METRICS.stats(),
+        "chat_memory": get_chat_memory().stats(),
+        "retrieval": RETRIEVAL_METRICS.stats(),
+        "context_packing": PACKING_METRICS.stats(),
+    }
+    answer_cache = get_answer_cache()
+    if answer_cache is not None:
+        stats["answer_cache"] = answer_cache.stats()
+    result_cache = get_result_cache()
+    if result_cache is not None:
+        stats["result_cache"] = result_cache.stats()
+    registry = getattr(app.state, "model_registry", None)
+    if registry is not None:
+        stats["model_registry"] = registry.stats()
+    return stats
+
+
 @app.post("/analyze")
 async def analyze_document(file: UploadFile = File(...)) -> Any:
     """Analyze Document Action
 
+    A PDF analyzed before with the same prompts and model is answered from the
+    result cache, skipping the text extraction and the LLM call. The cache key uses
+    the digest computed while saving, so the upload is read only once.
+
     Args:
         file (UploadFile, optional): _description_. Defaults to File(...).
 
@@ -75,16 +146,56 @@ async def analyze_document(file: UploadFile = File(...)) -> Any:
     """
     try:
         dh = DocHandler()
-        saved_path = dh.save_pdf(FastAPIFileAdapter(file))
-        text = read_pdf_handler(dh, saved_path)
+        saved_path = await run_io(dh.save_pdf, FastAPIFileAdapter(file))
+        cache = get_result_cache()
+        if cache is not None:
+            pdf_sha256 = dh.content_hashes[saved_path]
+            key = analysis_cache_key(pdf_sha256)
+            result = await run_io(cache.get, "analysis", key)
+            if result is not None:
+                # Nothing else will read this copy of the upload.
+                await run_io(shutil.rmtree, dh.session_path, True)
+                return JSONResponse(content=result)
+
+        text = await run_cpu(read_pdf_handler, dh, saved_path)
         analyzer = DocumentAnalyzer()
-        result = analyzer.analyze_document(text)
+        result = await analyzer.aanalyze_document(text)
+        if cache is not None:
+            await run_io(cache.put, "analysis", key, result, pdf_sha256)
         return JSONResponse(content=result)
     except Exception as e:
         #log.info(f"Document analysis failed. {str(e)}")
+        _raise_if_too_large(e)
         raise HTTPException(status_code=500, detail=f"Document analysis failed: {e}") from e
 
 
+@app.post("/analyze/cache/invalidate")
+async def invalidate_analysis_cache(
+    file: Optional[UploadFile] = File(None),
+    sha256: Optional[str] = Form(None),
+) -> Dict[str, Any]:
+    """Drop cached analyses of one PDF (given as the file or its sha256), or of all PDFs
+
+    Args:
+        file (Optional[UploadFile]): The PDF whose analyses should be dropped.
+        sha256 (Optional[str]): sha256 hex digest of the PDF, instead of the file.
+
+    Returns:
+        Dict[str, Any]: Number of cached results removed.
+    """
+    cache = get_result_cache()
+    if cache is None:
+        return {"invalidated": 0, "enabled": False}
+    try:
+        if file is not None:
+            sha256 = await run_io(upload_sha256, FastAPIFileAdapter(file))
+        invalidated = await run_io(cache.invalidate, "analysis", sha256)
+        return {"invalidated": invalidated, "sha256": sha256, "enabled": True}
+    except Exception as e:
+        _raise_if_too_large(e)
+        raise HTTPException(status_code=500, detail=f"Cache invalidation failed: {e}") from e
+
+
 @app.post("/compare")
 async def compare_documents(
     reference: UploadFile = File(...), 
@@ -92,6 +203,11 @@ async def compare_documents(
     ) -> Any:
     """_summary_
 
+    A pair compared before (same file contents, prompt and model) is answered from
+    the result cache, skipping extraction and the LLM; `cached` tells which happened.
+    The cache key uses the digests computed while saving, so each upload is read once.
+    Results with pages the LLM did not describe (raw-diff fallback) are not cached.
+
     Args:
         reference (UploadFile, optional): _description_. Defaults to File(...).
         actual (UploadFile, optional): _description_. Defaults to File(...).
@@ -104,18 +220,71 @@ async def compare_documents(
     """
     try:
         dc = DocumentComparator()
-        ref_path, act_path = dc.save_uploaded_files(
-            FastAPIFileAdapter(reference), FastAPIFileAdapter(actual)
-        )
-        _ = ref_path, act_path
-        combined_text = dc.combine_documents()
+        ref_path, act_path = await run_io(dc.save_uploaded_files, FastAPIFileAdapter(reference),
+                                          FastAPIFileAdapter(actual))
+        cache = get_result_cache()
+        key = tag = None
+        if cache is not None:
+            ref_sha256, act_sha256 = dc.content_hashes[str(ref_path)], dc.content_hashes[str(act_path)]
+            key, tag = comparison_cache_key(ref_sha256, act_sha256), comparison_tag(ref_sha256, act_sha256)
+            rows = await run_io(cache.get, "compare", key)
+            if rows is not None:
+                # Nothing else will read this copy of the uploads.
+                await run_io(shutil.rmtree, dc.session_path, True)
+                return {"rows": rows, "session_id": None, "cached": True}
+
+        ref_pages = await run_cpu(dc.read_pages, ref_path)
+        act_pages = await run_cpu(dc.read_pages, act_path)
         comp = DocumentCompareLLM()
-        df = comp.compare_document(combined_text)
-        return {"rows": df.to_dict(orient="records"), "session_id": dc.session_id}
+        df = await comp.acompare_pages(ref_pages, act_pages)
+        rows = df.to_dict(orient="records")
+        if cache is not None and not df.attrs.get("fallback_pages"):
+            await run_io(cache.put, "compare", key, rows, tag)
+        return {"rows": rows, "session_id": dc.session_id, "cached": False}
 
     except Exception as e:
+        _raise_if_too_large(e)
         raise HTTPException(status_code=500, detail=f"Document comparison failed: {e}") from e
 
+
+@app.post("/compare/cache/invalidate")
+async def invalidate_compare_cache(
+    reference: Optional[UploadFile] = File(None),
+    actual: Optional[UploadFile] = File(None),
+    reference_sha256: Optional[str] = Form(None),
+    actual_sha256: Optional[str] = Form(None),
+) -> Dict[str, Any]:
+    """Drop cached comparisons of one document pair (given as files or sha256s), or of all pairs
+
+    Args:
+        reference (Optional[UploadFile]): Reference PDF of the pair.
+        actual (Optional[UploadFile]): Actual PDF of the pair.
+        reference_sha256 (Optional[str]): sha256 hex digest of the reference PDF, instead of the file.
+        actual_sha256 (Optional[str]): sha256 hex digest of the actual PDF, instead of the file.
+
+    Returns:
+        Dict[str, Any]: Number of cached results removed.
+    """
+    cache = get_result_cache()
+    if cache is None:
+        return {"invalidated": 0, "enabled": False}
+    try:
+        if reference is not None:
+            reference_sha256 = await run_io(upload_sha256, FastAPIFileAdapter(reference))
+        if actual is not None:
+            actual_sha256 = await run_io(upload_sha256, FastAPIFileAdapter(actual))
+        if bool(reference_sha256) != bool(actual_sha256):
+            raise HTTPException(status_code=400, detail="Give both documents of the pair, or neither.")
+        tag = comparison_tag(reference_sha256, actual_sha256) if reference_sha256 else None
+        invalidated = await run_io(cache.invalidate, "compare", tag)
+        return {"invalidated": invalidated, "reference_sha256": reference_sha256,
+                "actual_sha256": actual_sha256, "enabled": True}
+    except HTTPException:
+        raise
+    except Exception as e:
+        _raise_if_too_large(e)
+        raise HTTPException(status_code=500, detail=f"Cache invalidation failed: {e}") from e
+
 @app.post("/chat/index")
 async def chat_build_index(
     files: List[UploadFile] = File(...),
@@ -151,17 +320,25 @@ async def chat_build_index(
         )
         # NOTE: ensure your ChatIngestor saves with index_name="index" or FAISS_INDEX_NAME
         # e.g., if it calls FAISS.save_local(dir, index_name=FAISS_INDEX_NAME)
-        ci.built_retriver(
+        await ci.abuilt_retriver(
             wrapped, chunk_size=chunk_size, chunk_overlap=chunk_overlap, k=k
         )
-        return {"session_id": ci.session_id, "k": k, "use_session_dirs": use_session_dirs}
+        return {
+            "session_id": ci.session_id,
+            "k": k,
+            "use_session_dirs": use_session_dirs,
+            "chunks_added": ci.ingest_stats["added"],
+            "chunks_skipped": ci.ingest_stats["skipped"],
+        }
     
     except Exception as e:
+        _raise_if_too_large(e)
         raise HTTPException(status_code=500, detail=f"Indexing failed: {e}") from e
     
 
 @app.post("/chat/query")
 async def chat_query(
+    background_tasks: BackgroundTasks,
     question: str = Form(...),
     session_id: Optional[str] = Form(None),
     use_session_dirs: bool = Form(True),
@@ -169,7 +346,11 @@ async def chat_query(
     ) -> Any:
     """Generate Response to user Chat Query
 
+    Chat history is kept server-side per session_id; requests without a
+    session_id are answered statelessly.
+
     Args:
+        background_tasks (BackgroundTasks): Runs history compaction after the response.
         question (str, optional): _description_. Defaults to Form(...).
         session_id (Optional[str], optional): _description_. Defaults to Form(None).
         use_session_dirs (bool, optional): _description_. Defaults to Form(True).
@@ -183,22 +364,16 @@ async def chat_query(
     Returns:
         Any: _description_
     """
+    index_dir = _resolve_index_dir(session_id, use_session_dirs)
     try:
-        if use_session_dirs and not session_id:
-            raise HTTPException(status_code=400,
-                                detail="session_id is required when use_session_dirs=True")
-
-        # Prepare FAISS Index Path
-        index_dir = os.path.join(FAISS_BASE, session_id) if use_session_dirs else FAISS_BASE  # type: ignore
-
-        if not os.path.isdir(index_dir):
-            raise HTTPException(status_code=404, 
-                                detail=f"FAISS index not found at: {index_dir}")
-
         # Initialize LCEL-style RAG pipeline
         rag = ConversationalRAG(session_id=session_id)
-        rag.load_retriever_from_faiss(index_dir, k=k, index_name=FAISS_INDEX_NAME)  # build retriever + chain
-        response = rag.invoke(question, chat_history=[])
+        # build retriever + chain (index load is disk/CPU work, keep it off the event loop)
+        await run_io(rag.load_retriever_from_faiss, index_dir, k=k, index_name=FAISS_INDEX_NAME)
+        history = await _load_history(session_id)
+        response = await rag.ainvoke(question, chat_history=history)
+        if await _remember(session_id, question, response):
+            background_tasks.add_task(_compact_history, rag, session_id)
 
         return {
             "answer": response,
@@ -210,6 +385,149 @@ async def chat_query(
         raise HTTPException(status_code=500, detail=f"Query failed: {e}") from e
 
 
+@app.post("/chat/query/stream")
+async def chat_query_stream(
+    question: str = Form(...),
+    session_id: Optional[str] = Form(None),
+    use_session_dirs: bool = Form(True),
+    k: int = Form(5),
+    ) -> StreamingResponse:
+    """Stream the answer to a chat query as Server-Sent Events
+
+    Emits `token` events ({"text": ...}) as the LLM generates them, then one `done`
+    event with the full answer, timing and sources, or an `error` event. The turn is
+    stored before `done` is sent; history compaction runs after the stream closes.
+
+    Args:
+        question (str, optional): User question. Defaults to Form(...).
+        session_id (Optional[str], optional): Chat session. Defaults to Form(None).
+        use_session_dirs (bool, optional): Per-session FAISS dirs. Defaults to Form(True).
+        k (int, optional): Chunks to retrieve. Defaults to Form(5).
+
+    Raises:
+        HTTPException: Missing session_id (400), missing index (404) or load failure (500).
+
+    Returns:
+        StreamingResponse: text/event-stream response.
+    """
+    index_dir = _resolve_index_dir(session_id, use_session_dirs)
+    try:
+        rag = ConversationalRAG(session_id=session_id)
+        await run_io(rag.load_retriever_from_faiss, index_dir, k=k, index_name=FAISS_INDEX_NAME)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Query failed: {e}") from e
+
+    background_tasks = BackgroundTasks()
+
+    async def events():
+        try:
+            history = await _load_history(session_id)
+            async for event in rag.astream(question, chat_history=history):
+                if event["type"] == "token":
+                    yield _sse("token", {"text": event["text"]})
+                else:
+                    # Clients close the stream on `done`, so store the turn first.
+                    if await _remember(session_id, question, event["answer"]):
+                        background_tasks.add_task(_compact_history, rag, session_id)
+                    yield _sse("done", {**event, "session_id": session_id, "k": k, "engine": "LCEL-RAG"})
+        except Exception as e:
+            yield _sse("error", {"detail": f"Query failed: {e}"})
+
+    return StreamingResponse(events(), media_type="text/event-stream", background=background_tasks,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/chat/query/batch")
+async def chat_query_batch(
+    questions: List[str] = Form(...),
+    session_id: Optional[str] = Form(None),
+    use_session_dirs: bool = Form(True),
+    k: int = Form(5),
+    max_concurrency: Optional[int] = Form(None),
+    ) -> Any:
+    """Answer many independent questions against one chat index
+
+    The index is loaded once, the questions are embedded in one batched call and
+    answered with a bounded number of concurrent LLM calls. Chat memory is neither
+    read nor written.
+
+    Args:
+        questions (List[str], optional): One form field per question. Defaults to Form(...).
+        session_id (Optional[str], optional): Chat session. Defaults to Form(None).
+        use_session_dirs (bool, optional): Per-session FAISS dirs. Defaults to Form(True).
+        k (int, optional): Chunks to retrieve per question. Defaults to Form(5).
+        max_concurrency (Optional[int], optional): LLM calls in flight; config default if None.
+
+    Raises:
+        HTTPException: Too many questions (400), missing index (404) or failure (500).
+
+    Returns:
+        Any: Per-question answers, sources and timing, in input order.
+    """
+    batch_cfg = load_config_cached().get("chat_batch", {})
+    max_questions = int(batch_cfg.get("max_questions", 100))
+    if len(questions) > max_questions:
+        raise HTTPException(status_code=400, detail=f"At most {max_questions} questions per batch")
+    index_dir = _resolve_index_dir(session_id, use_session_dirs)
+    try:
+        start = time.perf_counter()
+        rag = ConversationalRAG(session_id=session_id)
+        await run_io(rag.load_retriever_from_faiss, index_dir, k=k, index_name=FAISS_INDEX_NAME)
+        results = await rag.abatch(
+            questions, max_concurrency=max_concurrency or int(batch_cfg.get("max_concurrency", 4))
+        )
+        return {
+            "results": results,
+            "session_id": session_id,
+            "k": k,
+            "engine": "LCEL-RAG",
+            "total_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch query failed: {e}") from e
+
+
+def _resolve_index_dir(session_id: Optional[str], use_session_dirs: bool) -> str:
+    """FAISS index directory for a chat request, or a 400/404 HTTPException."""
+    if use_session_dirs and not session_id:
+        raise HTTPException(status_code=400,
+                            detail="session_id is required when use_session_dirs=True")
+
+    index_dir = os.path.join(FAISS_BASE, session_id) if use_session_dirs else FAISS_BASE  # type: ignore
+
+    if not os.path.isdir(index_dir):
+        raise HTTPException(status_code=404,
+                            detail=f"FAISS index not found at: {index_dir}")
+    return index_dir
+
+
+async def _load_history(session_id: Optional[str]) -> list:
+    return await run_io(get_chat_memory().history, session_id) if session_id else []
+
+
+async def _remember(session_id: Optional[str], question: str, answer: str) -> bool:
+    """Store the turn; True when the session's history is due for compaction."""
+    if not session_id:
+        return False
+    memory = get_chat_memory()
+    await run_io(memory.append, session_id, question, answer)
+    return await run_io(memory.needs_compaction, session_id)
+
+
+async def _compact_history(rag: ConversationalRAG, session_id: str):
+    """Background task: a failed compaction is logged, the response is already sent."""
+    try:
+        memory = get_chat_memory()
+        max_words = memory.summary_max_words()
+        await memory.acompact(session_id, lambda s, m: rag.asummarize_history(s, m, max_words))
+    except Exception as e:
+        log.error("Chat history compaction failed", session_id=session_id, error=str(e))
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 # To execute fast API
 # uvicorn api.main:app --reload
 # uvicorn api.main:app --host 0.0.0.0 --port 8083 --reload
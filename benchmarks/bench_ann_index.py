@@ -0,0 +1,61 @@
+"""
+Recall@k vs query latency for each FAISS index type built by utils.ann_index.
+
+Usage:
+    python -m benchmarks.bench_ann_index [--n 50000] [--dim 768] [--queries 200] [--k 10]
+
+Vectors are synthetic and clustered (like chunk embeddings of a few documents);
+ground truth comes from the exact flat index. Index parameters are the ones in
+the faiss_db block of config/config.yaml.
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from utils.ann_index import INDEX_TYPES, ann_settings, build_index, index_type_of
+
+
+def clustered_vectors(n: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    return centers[labels] + 0.35 * rng.normal(size=(n, dim)).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    data = clustered_vectors(args.n, args.dim, args.clusters, rng)
+    queries = clustered_vectors(args.queries, args.dim, args.clusters, rng)
+    settings = ann_settings()
+
+    truth = None
+    print(f"vectors: {args.n}  dim: {args.dim}  queries: {args.queries}  k: {args.k}")
+    print(f"{'type':10} {'built as':10} {'build s':>9} {'ms/query':>9} {'recall@k':>9} {'MB':>8}")
+    for kind in INDEX_TYPES:
+        start = time.perf_counter()
+        index = build_index(kind, data, settings)
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, ids = index.search(queries, args.k)
+        query_ms = 1000 * (time.perf_counter() - start) / args.queries
+
+        if truth is None:  # "flat" comes first: exact search is the ground truth
+            truth = ids
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(ids, truth)])
+        size_mb = len(faiss.serialize_index(index)) / 1e6
+        print(f"{kind:10} {index_type_of(index):10} {build_s:9.2f} {query_ms:9.3f} {recall:9.3f} {size_mb:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
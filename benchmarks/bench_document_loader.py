@@ -0,0 +1,52 @@
+"""
+PyMuPDF page loader vs LangChain's PyPDFLoader on the same PDFs.
+
+Usage:
+    python -m benchmarks.bench_document_loader [PDF_PATH ...] [--repeat 3]
+
+Without arguments every PDF in notebook/data is loaded.
+"""
+import argparse
+import time
+from pathlib import Path
+
+from langchain_community.document_loaders import PyPDFLoader
+
+from utils.document_loader import iter_pdf_pages
+
+SAMPLE_DIR = Path(__file__).resolve().parents[1] / "notebook" / "data"
+
+
+def best_of(repeat: int, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    pdfs = [Path(p) for p in args.pdfs] or sorted(SAMPLE_DIR.glob("*.pdf"))
+
+    total_pages = pypdf_total = pymupdf_total = 0.0
+    print(f"{'file':<28}{'pages':>6}{'pypdf s':>10}{'pymupdf s':>11}{'speedup':>9}")
+    for pdf in pdfs:
+        list(iter_pdf_pages(pdf, use_cache=False))  # warm-up: large PDFs start the extraction pool once
+        pypdf_s, docs = best_of(args.repeat, lambda: PyPDFLoader(str(pdf)).load())
+        pymupdf_s, _ = best_of(args.repeat, lambda: list(iter_pdf_pages(pdf, use_cache=False)))
+        total_pages += len(docs)
+        pypdf_total += pypdf_s
+        pymupdf_total += pymupdf_s
+        print(f"{pdf.name[:27]:<28}{len(docs):>6}{pypdf_s:>10.3f}{pymupdf_s:>11.3f}{pypdf_s / pymupdf_s:>8.1f}x")
+
+    print(f"\nthroughput: PyPDFLoader {total_pages / pypdf_total:.1f} pages/s, "
+          f"PyMuPDF {total_pages / pymupdf_total:.1f} pages/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Serial vs process-pool PDF text extraction.
+
+Usage:
+    python -m benchmarks.bench_pdf_extract [PDF_PATH] [--pages 1000] [--workers 4] [--repeat 3]
+
+Without PDF_PATH a synthetic PDF of --pages pages is built from notebook/data/*.pdf.
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+from utils.pdf_extract import extract_pages
+
+SAMPLE_DIR = Path(__file__).resolve().parents[1] / "notebook" / "data"
+
+
+def build_sample_pdf(target_pages: int, out: Path) -> Path:
+    sources = sorted(SAMPLE_DIR.glob("*.pdf"))
+    with fitz.open() as merged:
+        while merged.page_count < target_pages:
+            for src in sources:
+                with fitz.open(src) as doc:
+                    merged.insert_pdf(doc)
+                if merged.page_count >= target_pages:
+                    break
+        merged.select(list(range(target_pages)))
+        merged.save(str(out))
+    return out
+
+
+def best_of(repeat: int, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", nargs="?")
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = Path(args.pdf) if args.pdf else build_sample_pdf(args.pages, Path(tmp) / "sample.pdf")
+
+        # Warm the pool so process start-up is not billed to the first parallel run.
+        extract_pages(pdf, max_workers=args.workers, min_pages_parallel=0)
+
+        serial_s, serial = best_of(args.repeat, lambda: extract_pages(pdf, max_workers=1))
+        parallel_s, parallel = best_of(
+            args.repeat, lambda: extract_pages(pdf, max_workers=args.workers, min_pages_parallel=0))
+
+        assert serial == parallel, "parallel extraction must match serial output page for page"
+        pages = len(serial)
+        print(f"file: {pdf.name}  pages: {pages}  workers: {args.workers}")
+        print(f"serial:   {serial_s:8.3f}s  {pages / serial_s:10.1f} pages/s")
+        print(f"parallel: {parallel_s:8.3f}s  {pages / parallel_s:10.1f} pages/s  speedup x{serial_s / parallel_s:.2f}")
+
+
+if __name__ == "__main__":
+    main()
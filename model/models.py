@@ -20,6 +20,19 @@ class Metadata(BaseModel):
     PageCount: Union[int, str]
     Sentimenttone: str
 
+class SectionNotes(BaseModel):
+    """
+        Partial metadata extracted from one section of a long document (map step)
+    """
+    Summary: List[str] = Field(default_factory=list, description="Key points of this section")
+    Title: Optional[str] = None
+    Author: Optional[str] = None
+    DateCreated: Optional[str] = None
+    LastModifiedDate: Optional[str] = None
+    Publisher: Optional[str] = None
+    Language: Optional[str] = None
+    Sentimenttone: Optional[str] = None
+
 class ChangeFormat(BaseModel):
     """
         Document Comparison Response Model
@@ -36,5 +49,9 @@ class PromptType(str, Enum):
     """
     DOCUMENT_ANALYSIS = "document_analysis"
     DOCUMENT_COMPARISON = "document_comparison"
+    DOCUMENT_COMPARISON_DIFF = "document_comparison_diff"
     CONTEXTUALIZE_QUESTION = "contextualize_question"
     CONTEXT_QA = "context_qa"
+    SUMMARIZE_HISTORY = "summarize_history"
+    DOCUMENT_ANALYSIS_MAP = "document_analysis_map"
+    DOCUMENT_ANALYSIS_REDUCE = "document_analysis_reduce"
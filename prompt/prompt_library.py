@@ -10,6 +10,33 @@ Analyze this document:
 {document_text}
 """)
 
+# Map step of the analysis of long documents: one call per page-aligned section
+document_analysis_map_prompt = ChatPromptTemplate.from_template("""
+You are analyzing section {section} of {sections} of a long document.
+Extract the key points of this section as short summary bullets, plus any document-level
+details it states (title, author, dates, publisher, language, tone). Use null for details
+that this section does not state. Return ONLY valid JSON matching the exact schema below.
+
+{format_instructions}
+
+Section text:
+{section_text}
+""")
+
+# Reduce step: merge the per-section notes into the document metadata
+document_analysis_reduce_prompt = ChatPromptTemplate.from_template("""
+You are given notes extracted, in order, from the {sections} sections of one document
+({page_count} pages). Combine them into the metadata of the whole document: write a concise
+summary of the entire document, and resolve each detail from the sections that state it
+(prefer the earliest section for title and author). Use "Not Available" for details no
+section states. Return ONLY valid JSON matching the exact schema below.
+
+{format_instructions}
+
+Section notes:
+{section_notes}
+""")
+
 
 document_comparison_prompt = ChatPromptTemplate.from_template("""
 You will be provided with content from two PDFs. Your tasks are as follows:
@@ -28,6 +55,22 @@ Your response should follow this format:
 {format_instruction}
 """)
 
+# Comparison of the changed pages only; unchanged pages are reported locally
+document_comparison_diff_prompt = ChatPromptTemplate.from_template("""
+You will be given unified diffs of the pages that differ between a reference PDF and an
+actual PDF ("-" lines are only in the reference, "+" lines only in the actual document).
+Each diff is headed by its page label. For every page label, describe the changes
+concisely in plain language. Use the page label exactly as given as the page value.
+
+Changed pages:
+
+{changes}
+
+Your response should follow this format:
+
+{format_instruction}
+""")
+
 # Prompt for contextual question rewriting
 contextualize_question_prompt = ChatPromptTemplate.from_messages([
     ("system", (
@@ -50,10 +93,24 @@ context_qa_prompt = ChatPromptTemplate.from_messages([
     ("human", "{input}"),
 ])
 
+# Prompt for folding older chat turns into a rolling summary
+summarize_history_prompt = ChatPromptTemplate.from_messages([
+    ("system", (
+        "You maintain a running summary of a conversation about some documents. Merge the new conversation "
+        "lines into the existing summary. Keep facts, names, numbers and open questions the user may refer back "
+        "to; drop pleasantries. Reply with the updated summary only, in no more than {max_words} words."
+    )),
+    ("human", "Existing summary:\n{summary}\n\nNew conversation lines:\n{conversation}"),
+])
+
 
 PROMPT_REGISTRY={
     "document_analysis": document_analysis_prompt,
     "document_comparison": document_comparison_prompt,
+    "document_comparison_diff": document_comparison_diff_prompt,
     "contextualize_question": contextualize_question_prompt,
-    "context_qa": context_qa_prompt
+    "context_qa": context_qa_prompt,
+    "summarize_history": summarize_history_prompt,
+    "document_analysis_map": document_analysis_map_prompt,
+    "document_analysis_reduce": document_analysis_reduce_prompt
 }
\ No newline at end of file
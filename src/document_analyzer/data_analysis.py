@@ -1,5 +1,11 @@
 import os
-from utils.model_loader import ModelLoader
+import re
+import json
+from typing import List
+from utils.model_loader import get_model_registry, llm_identity
+from utils.result_cache import prompt_version, result_key
+from utils.config_loader import load_config_cached
+from utils.token_count import CHARS_PER_TOKEN, estimate_tokens
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
 from model.models import *
@@ -7,20 +13,72 @@ from langchain_core.output_parsers import JsonOutputParser
 from langchain.output_parsers import OutputFixingParser
 from prompt.prompt_library import PROMPT_REGISTRY
 
+# Page headers written by DocHandler.read_pdf ("--- Page N ---")
+_PAGE_MARKER = re.compile(r"\n\s*--- Page \d+ ---\s*\n")
+
+
+def split_sections(document_text: str, max_tokens: int) -> List[str]:
+    """Split text into sections of at most ~max_tokens, cutting only at page headers.
+
+    A single page larger than the budget is cut at whitespace.
+    """
+    limit = max_tokens * CHARS_PER_TOKEN
+    starts = [m.start() for m in _PAGE_MARKER.finditer(document_text)]
+    bounds = [0] + [s for s in starts if s > 0] + [len(document_text)]
+    sections: List[str] = []
+    current = ""
+    for page in (document_text[a:b] for a, b in zip(bounds, bounds[1:])):
+        if not page.strip():
+            continue
+        if current and len(current) + len(page) > limit:
+            sections.append(current)
+            current = ""
+        while len(page) > limit:
+            cut = page.rfind(" ", 0, limit)
+            cut = cut if cut > 0 else limit
+            if current:
+                sections.append(current)
+                current = ""
+            sections.append(page[:cut])
+            page = page[cut:]
+        current += page
+    if current.strip():
+        sections.append(current)
+    return sections
+
+
+def analysis_cache_key(pdf_sha256: str) -> str:
+    """Result cache key of an analysis: the PDF content, the analysis prompts and the model."""
+    prompts = [PROMPT_REGISTRY[t.value] for t in (PromptType.DOCUMENT_ANALYSIS, PromptType.DOCUMENT_ANALYSIS_MAP,
+                                                   PromptType.DOCUMENT_ANALYSIS_REDUCE)]
+    return result_key(pdf_sha256, prompt_version(*prompts), llm_identity())
+
 
 class DocumentAnalyzer:
     """Document Analyzer Class
+
+    Documents above `analysis.map_reduce_threshold_tokens` are analyzed map-reduce:
+    page-aligned sections are summarized concurrently, then merged into Metadata.
     """
     def __init__(self):
         self.log = CustomLogger().get_logger(__name__)
         try:
-            self.loader = ModelLoader()
-            self.llm = self.loader.load_llm()
+            self.llm = get_model_registry().get_llm()
 
             # Prepare parsers
             self.parser = JsonOutputParser(pydantic_object=Metadata)
             self.fixing_parser = OutputFixingParser.from_llm(parser=self.parser, llm=self.llm)
             self.prompt = PROMPT_REGISTRY["document_analysis"]
+
+            # Map-reduce pieces for long documents
+            self.section_parser = JsonOutputParser(pydantic_object=SectionNotes)
+            self.section_fixing_parser = OutputFixingParser.from_llm(parser=self.section_parser, llm=self.llm)
+            self.map_prompt = PROMPT_REGISTRY[PromptType.DOCUMENT_ANALYSIS_MAP.value]
+            self.reduce_prompt = PROMPT_REGISTRY[PromptType.DOCUMENT_ANALYSIS_REDUCE.value]
+            cfg = load_config_cached().get("analysis", {})
+            self.map_reduce_threshold = int(cfg.get("map_reduce_threshold_tokens", 24_000))
+            self.section_tokens = int(cfg.get("section_tokens", 8_000))
+            self.max_concurrency = int(cfg.get("max_concurrency", 4))
             self.log.info("Document analyzer initialized successfully.")
 
         except Exception as e:
@@ -31,13 +89,35 @@ class DocumentAnalyzer:
         """Analyze the document
         """
         try:
-            chain = self.prompt | self.llm | self.fixing_parser
-            self.log.info("Meta data analysis chain initialized")
+            if self._use_map_reduce(document_text):
+                sections = split_sections(document_text, self.section_tokens)
+                notes = self._map_chain().batch(self._section_inputs(sections),
+                                                config={"max_concurrency": self.max_concurrency})
+                response = self._reduce_chain().invoke(self._reduce_inputs(document_text, notes))
+            else:
+                chain = self.prompt | self.llm | self.fixing_parser
+                self.log.info("Meta data analysis chain initialized")
+                response = chain.invoke(self._inputs(document_text))
+
+            self.log.info("Meta data execution successful", keys=list(response.keys()))
+            return response
 
-            response = chain.invoke({
-                "format_instructions": self.parser.get_format_instructions(),
-                "document_text": document_text
-            })
+        except Exception as e:
+            self.log.error("Meta data analysis failed", error=str(e))
+            raise DocumentPortalException(error_message="Meta data analysis failed", error_details=e) from e
+
+    async def aanalyze_document(self, document_text: str) -> dict:
+        """Analyze the document without blocking the event loop
+        """
+        try:
+            if self._use_map_reduce(document_text):
+                sections = split_sections(document_text, self.section_tokens)
+                notes = await self._map_chain().abatch(self._section_inputs(sections),
+                                                       config={"max_concurrency": self.max_concurrency})
+                response = await self._reduce_chain().ainvoke(self._reduce_inputs(document_text, notes))
+            else:
+                chain = self.prompt | self.llm | self.fixing_parser
+                response = await chain.ainvoke(self._inputs(document_text))
 
             self.log.info("Meta data execution successful", keys=list(response.keys()))
             return response
@@ -45,4 +125,44 @@ class DocumentAnalyzer:
         except Exception as e:
             self.log.error("Meta data analysis failed", error=str(e))
             raise DocumentPortalException(error_message="Meta data analysis failed", error_details=e) from e
-        
+
+    def _inputs(self, document_text: str) -> dict:
+        return {
+            "format_instructions": self.parser.get_format_instructions(),
+            "document_text": document_text
+        }
+
+    def _use_map_reduce(self, document_text: str) -> bool:
+        tokens = estimate_tokens(document_text)
+        use = tokens > self.map_reduce_threshold
+        self.log.info("Analysis mode selected", mode="map_reduce" if use else "single", tokens=tokens)
+        return use
+
+    def _map_chain(self):
+        return self.map_prompt | self.llm | self.section_fixing_parser
+
+    def _reduce_chain(self):
+        return self.reduce_prompt | self.llm | self.fixing_parser
+
+    def _section_inputs(self, sections: List[str]) -> List[dict]:
+        self.log.info("Map step started", sections=len(sections), max_concurrency=self.max_concurrency)
+        return [
+            {
+                "format_instructions": self.section_parser.get_format_instructions(),
+                "section": i,
+                "sections": len(sections),
+                "section_text": text,
+            }
+            for i, text in enumerate(sections, start=1)
+        ]
+
+    def _reduce_inputs(self, document_text: str, notes: List[dict]) -> dict:
+        page_count = len(_PAGE_MARKER.findall(document_text)) or "Not Available"
+        return {
+            "format_instructions": self.parser.get_format_instructions(),
+            "sections": len(notes),
+            "page_count": page_count,
+            "section_notes": json.dumps(
+                [{"section": i, **note} for i, note in enumerate(notes, start=1)], ensure_ascii=False, indent=1
+            ),
+        }
@@ -1,14 +1,26 @@
 import sys
 import os
+import time
+from pathlib import Path
 from operator import itemgetter
-from typing import List, Optional, Dict, Any
+from typing import AsyncIterator, List, Optional, Dict, Any
 
 from langchain_core.messages import BaseMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableBranch, RunnableConfig, RunnableLambda
+from langchain_core.vectorstores import VectorStoreRetriever
 from langchain_community.vectorstores import FAISS
 
-from utils.model_loader import ModelLoader
+from utils.model_loader import get_model_registry
+from utils.vectorstore_cache import index_footprint
+from utils.answer_cache import answer_scope, get_answer_cache
+from utils.hybrid_retriever import HybridRetriever, aembed_queries, embed_queries
+from utils.concurrency import run_cpu
+from utils.context_packer import PackedContext, context_budget, pack_context
+from utils.sharded_index import ShardLayout, load_shards
+from utils.config_loader import load_config_cached
+from utils.query_rewrite import REWRITE_METRICS, needs_rewrite
 from exception.custom_exception import DocumentPortalException
 from logger.custom_logger import CustomLogger
 from prompt.prompt_library import PROMPT_REGISTRY
@@ -39,9 +51,21 @@ class ConversationalRAG:
                 PromptType.CONTEXT_QA.value
             ]
 
+            # Answers to standalone questions, reused while the index is unchanged
+            self.answer_cache = get_answer_cache()
+            self._cache_scope = None
+            self._index_version = None
+
+            # Token budget for the retrieved context handed to the LLM
+            self._budget = context_budget()
+
             # Lazy pieces
             self.retriever = retriever
+            self.vectorstore = None
+            self._k = 5
             self.chain = None
+            self.retrieve_chain = None
+            self.answer_chain = None
             if self.retriever is not None:
                 self._build_lcel_chain()
 
@@ -67,20 +91,38 @@ class ConversationalRAG:
             if not os.path.isdir(index_path):
                 raise FileNotFoundError(f"FAISS index directory not found: {index_path}")
 
-            embeddings = ModelLoader().load_embeddings()
-            vectorstore = FAISS.load_local(
-                index_path,
-                embeddings,
-                index_name=index_name,
-                allow_dangerous_deserialization=True,  # ok if you trust the index
-            )
+            # A sharded global index is searched across all of its shards.
+            layout = ShardLayout(index_path, index_name=index_name)
+            index_dirs = layout.shard_dirs() if layout.is_sharded() else [Path(index_path)]
+
+            retriever_cfg = load_config_cached().get("retriever", {})
+            hybrid = bool(retriever_cfg.get("hybrid", True))
+            # Reuse the deserialized indexes across questions; invalidated on re-index.
+            shards = load_shards(index_dirs, index_name, get_model_registry().get_embeddings(),
+                                 with_bm25=hybrid)
+            if not shards:
+                raise FileNotFoundError(f"No FAISS index named '{index_name}' in: {index_path}")
+            self.vectorstore = shards[0][0]
+            self._cache_scope = answer_scope(index_path, index_name, self.session_id)
+            self._index_version = tuple(index_footprint(d) for d in index_dirs)
 
             if search_kwargs is None:
                 search_kwargs = {"k": k}
+            self._k = search_kwargs.get("k", k)
 
-            self.retriever = vectorstore.as_retriever(
-                search_type=search_type, search_kwargs=search_kwargs
-            )
+            if len(shards) > 1 or (search_type == "similarity" and hybrid):
+                self.retriever = HybridRetriever(
+                    shards=shards,
+                    k=search_kwargs.get("k", k),
+                    fetch_k=max(int(retriever_cfg.get("fetch_k", 20)), k),
+                    rrf_k=int(retriever_cfg.get("rrf_k", 60)),
+                    lexical=hybrid,
+                    lexical_fast_path=bool(retriever_cfg.get("lexical_fast_path", True)),
+                )
+            else:
+                self.retriever = self.vectorstore.as_retriever(
+                    search_type=search_type, search_kwargs=search_kwargs
+                )
             self._build_lcel_chain()
 
             self.log.info(
@@ -104,13 +146,21 @@ class ConversationalRAG:
                     "RAG chain not initialized. Call load_retriever_from_faiss() before invoke().", sys
                 )
             chat_history = chat_history or []
+            cached, pending = self._cache_lookup(user_input, chat_history)
+            if cached is not None:
+                self.log.info("Answer served from cache", session_id=self.session_id)
+                return cached["answer"]
             payload = {"input": user_input, "chat_history": chat_history}
-            answer = self.chain.invoke(payload)
+            docs = self._retrieve_for(payload, pending)
+            if docs is None:
+                docs = self.retrieve_chain.invoke(payload)
+            answer = self.answer_chain.invoke({**payload, "context": self._context(docs)})
             if not answer:
                 self.log.warning(
                     "No answer generated", user_input=user_input, session_id=self.session_id
                 )
                 return "no answer generated."
+            self._cache_store(user_input, pending, answer, self._sources(docs))
             self.log.info(
                 "Chain invoked successfully",
                 session_id=self.session_id,
@@ -122,11 +172,306 @@ class ConversationalRAG:
             self.log.error("Failed to invoke ConversationalRAG", error=str(e))
             raise DocumentPortalException("Invocation error in ConversationalRAG", sys)
 
+    async def ainvoke(self, user_input: str, chat_history: Optional[List[BaseMessage]] = None) -> str:
+        """Invoke the LCEL pipeline without blocking the event loop."""
+        if self.chain is None:
+            raise DocumentPortalException(
+                "RAG chain not initialized. Call load_retriever_from_faiss() before ainvoke().", sys
+            )
+        try:
+            cached, pending = await self._acache_lookup(user_input, chat_history or [])
+            if cached is not None:
+                self.log.info("Answer served from cache", session_id=self.session_id)
+                return cached["answer"]
+            payload = {"input": user_input, "chat_history": chat_history or []}
+            docs = await run_cpu(self._retrieve_for, payload, pending) if pending and pending["vector"] else None
+            if docs is None:
+                docs = await self.retrieve_chain.ainvoke(payload)
+            answer = await self.answer_chain.ainvoke({**payload, "context": self._context(docs)})
+            if not answer:
+                self.log.warning(
+                    "No answer generated", user_input=user_input, session_id=self.session_id
+                )
+                return "no answer generated."
+            self._cache_store(user_input, pending, answer, self._sources(docs))
+            self.log.info(
+                "Chain invoked successfully",
+                session_id=self.session_id,
+                user_input=user_input,
+                answer_preview=str(answer)[:150],
+            )
+            return answer
+        except Exception as e:
+            self.log.error("Failed to invoke ConversationalRAG", error=str(e))
+            raise DocumentPortalException("Invocation error in ConversationalRAG", e) from e
+
+    async def astream(
+        self, user_input: str, chat_history: Optional[List[BaseMessage]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream the answer token by token.
+
+        Yields {"type": "token", "text": ...} events as the LLM produces them, then a
+        single {"type": "done", ...} event with the full answer, timings and sources.
+        """
+        if self.retrieve_chain is None or self.answer_chain is None:
+            raise DocumentPortalException(
+                "RAG chain not initialized. Call load_retriever_from_faiss() before astream().", sys
+            )
+        start = time.perf_counter()
+        payload = {"input": user_input, "chat_history": chat_history or []}
+        try:
+            cached, pending = await self._acache_lookup(user_input, payload["chat_history"])
+        except Exception as e:
+            raise DocumentPortalException("Streaming error in ConversationalRAG", e) from e
+        if cached is not None:
+            elapsed = round((time.perf_counter() - start) * 1000, 1)
+            yield {"type": "token", "text": cached["answer"]}
+            yield {"type": "done", "answer": cached["answer"], "sources": cached["sources"], "cached": True,
+                   "timing": {"retrieval_ms": 0.0, "first_token_ms": elapsed, "total_ms": elapsed}}
+            return
+        try:
+            docs = await run_cpu(self._retrieve_for, payload, pending) if pending and pending["vector"] else None
+            if docs is None:
+                docs = await self.retrieve_chain.ainvoke(payload)
+            retrieved = time.perf_counter()
+
+            first_token = None
+            parts: List[str] = []
+            packed = self._pack(docs)
+            async for text in self.answer_chain.astream({**payload, "context": packed.text}):
+                if not text:
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter()
+                parts.append(text)
+                yield {"type": "token", "text": text}
+        except Exception as e:
+            self.log.error("Failed to stream ConversationalRAG", error=str(e), session_id=self.session_id)
+            raise DocumentPortalException("Streaming error in ConversationalRAG", e) from e
+
+        end = time.perf_counter()
+        answer = "".join(parts) or "no answer generated."
+        sources = self._sources(docs)
+        if parts:
+            self._cache_store(user_input, pending, answer, sources)
+        timing = {
+            "retrieval_ms": round((retrieved - start) * 1000, 1),
+            "first_token_ms": round(((first_token or end) - start) * 1000, 1),
+            "total_ms": round((end - start) * 1000, 1),
+        }
+        self.log.info("Chain streamed successfully", session_id=self.session_id,
+                      answer_preview=answer[:150], **timing)
+        yield {"type": "done", "answer": answer, "timing": timing, "sources": sources, "cached": False,
+               "context": packed.report()}
+
+    def batch(self, questions: List[str], max_concurrency: int = 4) -> List[Dict[str, Any]]:
+        """Answer independent (history-free) questions against the loaded index.
+
+        All questions are embedded in one provider call and searched in one FAISS
+        call per shard; answers are generated with at most `max_concurrency` LLM calls
+        in flight. Results keep the input order.
+        """
+        start = time.perf_counter()
+        retriever, items, to_embed = self._batch_prepare(questions)
+        vectors = embed_queries(retriever.embeddings, [it["question"] for it in to_embed])
+        misses = self._batch_lookup(items, to_embed, vectors)
+        inputs = self._batch_inputs(misses, retriever.retrieve_batch(
+            [m["question"] for m in misses], [m["vector"] for m in misses]))
+        retrieved = time.perf_counter()
+        outputs = self._timed_answer().batch(inputs, config={"max_concurrency": max_concurrency})
+        return self._batch_results(items, misses, outputs, start, retrieved)
+
+    async def abatch(self, questions: List[str], max_concurrency: int = 4) -> List[Dict[str, Any]]:
+        """Async batch(); the FAISS/BM25 work runs on the CPU pool."""
+        start = time.perf_counter()
+        retriever, items, to_embed = self._batch_prepare(questions)
+        vectors = await aembed_queries(retriever.embeddings, [it["question"] for it in to_embed])
+        misses = self._batch_lookup(items, to_embed, vectors)
+        docs = await run_cpu(retriever.retrieve_batch,
+                             [m["question"] for m in misses], [m["vector"] for m in misses])
+        inputs = self._batch_inputs(misses, docs)
+        retrieved = time.perf_counter()
+        outputs = await self._timed_answer().abatch(inputs, config={"max_concurrency": max_concurrency})
+        return self._batch_results(items, misses, outputs, start, retrieved)
+
+    async def asummarize_history(self, summary: str, messages: List[BaseMessage], max_words: int = 200) -> str:
+        """Fold `messages` into the rolling conversation `summary` (used by ChatMemory.acompact)."""
+        conversation = "\n".join(
+            f"{'User' if m.type == 'human' else 'Assistant'}: {m.content}" for m in messages
+        )
+        chain = PROMPT_REGISTRY[PromptType.SUMMARIZE_HISTORY.value] | self.llm | StrOutputParser()
+        return await chain.ainvoke(
+            {"summary": summary or "(none)", "conversation": conversation, "max_words": max_words}
+        )
+
     # ---------- Internals ----------
 
+    def _batch_prepare(self, questions: List[str]):
+        """Exact answer-cache hits and the questions that need an embedding."""
+        if self.answer_chain is None or self.vectorstore is None:
+            raise DocumentPortalException(
+                "RAG chain not initialized. Call load_retriever_from_faiss() before batch().", sys
+            )
+        retriever = self.retriever if isinstance(self.retriever, HybridRetriever) else HybridRetriever(
+            shards=[(self.vectorstore, None)], k=self._k, fetch_k=self._k, lexical=False)
+        cacheable = self.answer_cache is not None and self._cache_scope is not None
+        items = []
+        for q in questions:
+            hit = self.answer_cache.get_exact(self._cache_scope, self._index_version, q) if cacheable else None
+            items.append({"question": q, "hit": hit, "vector": None,
+                          "lexical": hit is None and retriever.is_lexical_only(q)})
+        to_embed = [it for it in items if it["hit"] is None and not it["lexical"]]
+        return retriever, items, to_embed
+
+    def _batch_lookup(self, items: List[Dict[str, Any]], to_embed: List[Dict[str, Any]],
+                      vectors: List[List[float]]) -> List[Dict[str, Any]]:
+        """Attach embeddings, try the semantic cache and return the items still to answer."""
+        for it, vector in zip(to_embed, vectors):
+            it["vector"] = vector
+        if self.answer_cache is not None and self._cache_scope is not None:
+            for it in items:
+                if it["hit"] is not None:
+                    continue
+                if it["vector"] is None:
+                    self.answer_cache.record_miss()
+                else:
+                    it["hit"] = self.answer_cache.get_similar(self._cache_scope, self._index_version, it["vector"])
+        return [it for it in items if it["hit"] is None]
+
+    def _batch_inputs(self, misses: List[Dict[str, Any]], docs: List[List[Any]]) -> List[Dict[str, Any]]:
+        inputs = []
+        for it, found in zip(misses, docs):
+            it["docs"] = found
+            it["context"] = self._pack(found)
+            inputs.append({"input": it["question"], "chat_history": [], "context": it["context"].text})
+        return inputs
+
+    def _batch_results(self, items, misses, outputs, start: float, retrieved: float) -> List[Dict[str, Any]]:
+        retrieval_ms = round((retrieved - start) * 1000, 1)
+        for it, (answer, seconds) in zip(misses, outputs):
+            it["answer"] = answer or "no answer generated."
+            it["sources"] = self._sources(it["docs"])
+            it["answer_ms"] = round(seconds * 1000, 1)
+            if answer and self.answer_cache is not None and self._cache_scope is not None:
+                self.answer_cache.put(self._cache_scope, self._index_version, it["question"], it["vector"],
+                                      {"answer": answer, "sources": it["sources"]})
+        results = []
+        for it in items:
+            cached = it["hit"] is not None
+            results.append({
+                "question": it["question"],
+                "answer": it["hit"]["answer"] if cached else it["answer"],
+                "sources": it["hit"]["sources"] if cached else it["sources"],
+                "cached": cached,
+                "context": None if cached else it["context"].report(),
+                "timing": {
+                    # Retrieval is batched, so its time is shared by every question.
+                    "retrieval_ms": 0.0 if cached else retrieval_ms,
+                    "answer_ms": 0.0 if cached else it["answer_ms"],
+                },
+            })
+        self.log.info("Batch answered", session_id=self.session_id, questions=len(items),
+                      cached=len(items) - len(misses), total_ms=round((time.perf_counter() - start) * 1000, 1))
+        return results
+
+    def _timed_answer(self) -> RunnableLambda:
+        """answer_chain returning (answer, seconds) so batch results carry per-question timing."""
+        def answer(x: Dict[str, Any], config: RunnableConfig):
+            start = time.perf_counter()
+            return self.answer_chain.invoke(x, config), time.perf_counter() - start
+
+        async def aanswer(x: Dict[str, Any], config: RunnableConfig):
+            start = time.perf_counter()
+            return await self.answer_chain.ainvoke(x, config), time.perf_counter() - start
+
+        return RunnableLambda(answer, afunc=aanswer, name="timed_answer")
+
+    def _cacheable(self, user_input: str, chat_history: List[BaseMessage]) -> bool:
+        # Questions that lean on the history are not reusable across turns.
+        return (self.answer_cache is not None and self._cache_scope is not None
+                and not needs_rewrite(user_input, chat_history))
+
+    def _exact_lookup(self, user_input: str, chat_history: List[BaseMessage]):
+        """Shared first step of the cache lookups; (hit, pending, done).
+
+        `pending` is what _cache_store needs after a miss ({"vector": ...}), or None
+        when the answer must not be cached. `done` means no semantic lookup is needed.
+        """
+        if not self._cacheable(user_input, chat_history):
+            return None, None, True
+        hit = self.answer_cache.get_exact(self._cache_scope, self._index_version, user_input)
+        if hit is not None:
+            return hit, None, True
+        if isinstance(self.retriever, HybridRetriever) and self.retriever.is_lexical_only(user_input):
+            # Retrieval will not embed this question; neither does the cache.
+            self.answer_cache.record_miss()
+            return None, {"vector": None}, True
+        return None, None, False
+
+    def _cache_lookup(self, user_input: str, chat_history: List[BaseMessage]):
+        """(cached {"answer", "sources"} or None, state for _cache_store on a miss)."""
+        hit, pending, done = self._exact_lookup(user_input, chat_history)
+        if done:
+            return hit, pending
+        vector = self.vectorstore.embeddings.embed_query(user_input)
+        hit = self.answer_cache.get_similar(self._cache_scope, self._index_version, vector)
+        return hit, None if hit is not None else {"vector": vector}
+
+    async def _acache_lookup(self, user_input: str, chat_history: List[BaseMessage]):
+        hit, pending, done = self._exact_lookup(user_input, chat_history)
+        if done:
+            return hit, pending
+        vector = await self.vectorstore.embeddings.aembed_query(user_input)
+        hit = self.answer_cache.get_similar(self._cache_scope, self._index_version, vector)
+        return hit, None if hit is not None else {"vector": vector}
+
+    def _retrieve_for(self, payload: Dict[str, Any], pending: Optional[Dict[str, Any]]):
+        """Docs for a cache miss, searched with the question vector the cache lookup already computed.
+
+        Returns None when there is no such vector (or the retriever cannot search by
+        vector); the caller then runs retrieve_chain, which embeds the question itself.
+        A cacheable question never needs the history rewrite, so the input is the query.
+        """
+        vector = (pending or {}).get("vector")
+        if vector is None:
+            return None
+        retriever = self.retriever
+        if isinstance(retriever, HybridRetriever):
+            docs = retriever.retrieve_batch([payload["input"]], [vector])[0]
+        elif isinstance(retriever, VectorStoreRetriever) and retriever.search_type in ("similarity", "mmr"):
+            search = (retriever.vectorstore.similarity_search_by_vector if retriever.search_type == "similarity"
+                      else retriever.vectorstore.max_marginal_relevance_search_by_vector)
+            docs = search(vector, **retriever.search_kwargs)
+        else:
+            return None
+        self._skip_rewrite(payload)
+        return docs
+
+    def _cache_store(self, user_input: str, pending: Optional[Dict[str, Any]], answer: str,
+                     sources: List[Dict[str, Any]]):
+        if pending is None:
+            return
+        self.answer_cache.put(self._cache_scope, self._index_version, user_input, pending["vector"],
+                              {"answer": answer, "sources": sources})
+
+    @staticmethod
+    def _sources(docs) -> List[Dict[str, Any]]:
+        """Distinct source/page pairs of the retrieved docs, in retrieval order."""
+        seen, out = set(), []
+        for d in docs:
+            md = getattr(d, "metadata", None) or {}
+            src = md.get("source") or md.get("file_path")
+            key = (src, md.get("page"))
+            if key in seen:
+                continue
+            seen.add(key)
+            out.append({"source": os.path.basename(src) if src else None,
+                        "page": md["page"] + 1 if isinstance(md.get("page"), int) else None})
+        return out
+
     def _load_llm(self):
         try:
-            llm = ModelLoader().load_llm()
+            llm = get_model_registry().get_llm()
             if not llm:
                 raise ValueError("LLM could not be loaded")
             self.log.info("LLM loaded successfully", session_id=self.session_id)
@@ -135,36 +480,72 @@ class ConversationalRAG:
             self.log.error("Failed to load LLM", error=str(e))
             raise DocumentPortalException("LLM loading error in ConversationalRAG", sys)
 
-    @staticmethod
-    def _format_docs(docs) -> str:
-        return "\n\n".join(getattr(d, "page_content", str(d)) for d in docs)
+    def _timed_rewriter(self) -> RunnableLambda:
+        """contextualize_prompt | llm, recording its latency in REWRITE_METRICS."""
+        rewriter = (
+            {"input": itemgetter("input"), "chat_history": itemgetter("chat_history")}
+            | self.contextualize_prompt
+            | self.llm
+            | StrOutputParser()
+        )
+
+        def rewrite(x: Dict[str, Any], config: RunnableConfig) -> str:
+            start = time.perf_counter()
+            question = rewriter.invoke(x, config)
+            REWRITE_METRICS.record_rewrite(time.perf_counter() - start)
+            return question
+
+        async def arewrite(x: Dict[str, Any], config: RunnableConfig) -> str:
+            start = time.perf_counter()
+            question = await rewriter.ainvoke(x, config)
+            REWRITE_METRICS.record_rewrite(time.perf_counter() - start)
+            return question
+
+        return RunnableLambda(rewrite, afunc=arewrite, name="rewrite_question")
+
+    def _skip_rewrite(self, x: Dict[str, Any]) -> str:
+        REWRITE_METRICS.record_skip(had_history=bool(x["chat_history"]))
+        self.log.info("Question rewrite skipped", session_id=self.session_id,
+                      has_history=bool(x["chat_history"]))
+        return x["input"]
+
+    def _pack(self, docs) -> PackedContext:
+        """Merge overlapping chunks, drop repeats and fit the context to the token budget."""
+        packed = pack_context(docs, self._budget["max_tokens"], self._budget["near_duplicate"])
+        self.log.info("Context packed", session_id=self.session_id, **packed.report())
+        return packed
+
+    def _context(self, docs) -> str:
+        return self._pack(docs).text
 
     def _build_lcel_chain(self):
         try:
             if self.retriever is None:
                 raise DocumentPortalException("No retriever set before building chain", sys)
 
-            # 1) Rewrite user question with chat history context
-            question_rewriter = (
-                {"input": itemgetter("input"), "chat_history": itemgetter("chat_history")}
-                | self.contextualize_prompt
-                | self.llm
-                | StrOutputParser()
+            # 1) Rewrite user question with chat history context, but only when it
+            #    depends on that history; otherwise go straight to retrieval.
+            question_rewriter = RunnableBranch(
+                (
+                    lambda x: needs_rewrite(x["input"], x["chat_history"]),
+                    self._timed_rewriter(),
+                ),
+                RunnableLambda(self._skip_rewrite),
             )
 
             # 2) Retrieve docs for rewritten question
-            retrieve_docs = question_rewriter | self.retriever | self._format_docs
+            self.retrieve_chain = question_rewriter | self.retriever
+            retrieve_docs = self.retrieve_chain | self._context
 
             # 3) Answer using retrieved context + original input + chat history
+            self.answer_chain = self.qa_prompt | self.llm | StrOutputParser()
             self.chain = (
                 {
                     "context": retrieve_docs,
                     "input": itemgetter("input"),
                     "chat_history": itemgetter("chat_history"),
                 }
-                | self.qa_prompt
-                | self.llm
-                | StrOutputParser()
+                | self.answer_chain
             )
 
             self.log.info("LCEL graph built successfully", session_id=self.session_id)
@@ -1,30 +1,63 @@
 import sys
-from dotenv import load_dotenv
 import pandas as pd
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
 from model.models import SummaryResponse,PromptType
 from prompt.prompt_library import PROMPT_REGISTRY
-from utils.model_loader import ModelLoader
+from utils.model_loader import get_model_registry, llm_identity
+from utils.result_cache import prompt_version, result_key
+from utils.concurrency import run_cpu
+from utils.config_loader import load_config_cached
+from utils.page_diff import PageChange, PageDiff, diff_pages, format_changes
+from utils.token_count import estimate_tokens
+from langchain_core.runnables import RunnableLambda
 from langchain_core.output_parsers import JsonOutputParser
 from langchain.output_parsers import OutputFixingParser
 import pandas as pd
 
+def comparison_cache_key(reference_sha256: str, actual_sha256: str) -> str:
+    """
+        Result cache key of a comparison: both documents, the prompt version and the model
+    """
+    prompt = PROMPT_REGISTRY[PromptType.DOCUMENT_COMPARISON_DIFF.value]
+    return result_key(reference_sha256, actual_sha256, prompt_version(prompt), llm_identity())
+
+
+def comparison_tag(reference_sha256: str, actual_sha256: str) -> str:
+    """
+        Result cache tag of a document pair, shared by its results for every prompt version and model
+    """
+    return f"{reference_sha256}:{actual_sha256}"
+
+
 class DocumentCompareLLM:
     """
         Document Compare Class
+
+        Changed pages are described in windows of at most `compare.window_pages` pages /
+        `compare.window_tokens` diff tokens, so no single answer runs into the output
+        token limit. Windows run concurrently and are retried on parse failures.
     """
 
     def __init__(self):
-        load_dotenv()
         self.log = CustomLogger().get_logger(name=__name__)
-        self.loader = ModelLoader()
-        self.llm = self.loader.load_llm()
+        self.llm = get_model_registry().get_llm()
         self.parser = JsonOutputParser(pydantic_object= SummaryResponse)
         self.fixing_parser = OutputFixingParser.from_llm(parser=self.parser, llm=self.llm)
         self.prompt = PROMPT_REGISTRY.get("document_comparison")
         #self.chain = self.prompt | self.llm | self.parser | self.fixing_parser
         self.chain = self.prompt | self.llm | self.parser
+        cfg = load_config_cached().get("compare", {})
+        self.window_pages = int(cfg.get("window_pages", 8))
+        self.window_tokens = int(cfg.get("window_tokens", 6000))
+        self.max_concurrency = int(cfg.get("max_concurrency", 4))
+        self.window_chain = (
+            PROMPT_REGISTRY[PromptType.DOCUMENT_COMPARISON_DIFF.value] | self.llm | self.parser
+            | RunnableLambda(self._validate_rows)
+        ).with_retry(stop_after_attempt=int(cfg.get("window_attempts", 3)))
+        # Batch over per-window invokes: RunnableRetry.batch() can return a retried
+        # item's result in the place of another item.
+        self.diff_chain = RunnableLambda(self.window_chain.invoke, afunc=self.window_chain.ainvoke)
         self.log.info("DocumentCompareLLM class initialized")
 
     def compare_document(self, combined_docs: str) -> pd.DataFrame:
@@ -44,6 +77,126 @@ class DocumentCompareLLM:
             self.log.error(f"Error comparing the document {e}")
             raise DocumentPortalException(error_message="Error comparing the document", error_details=sys) from e
 
+    async def acompare_document(self, combined_docs: str) -> pd.DataFrame:
+        """
+            Compare two documents without blocking the event loop
+        """
+        try:
+            inputs = {
+                "combined_docs": combined_docs,
+                "format_instruction": self.parser.get_format_instructions()
+            }
+            response = await self.chain.ainvoke(inputs)
+            self.log.info("Document comparison completed", response=str(response)[:200])
+            return self._format_response(response)
+        except Exception as e:
+            self.log.error(f"Error comparing the document {e}")
+            raise DocumentPortalException(error_message="Error comparing the document", error_details=e) from e
+
+    def compare_pages(self, reference_pages: list[str], actual_pages: list[str]) -> pd.DataFrame:
+        """
+            Compare two documents page by page; only changed pages are sent to the LLM
+
+            Pages the LLM did not describe (a window failed after its retries, or the
+            page was skipped) carry their raw diff and are listed in
+            `df.attrs["fallback_pages"]`; such a result should not be cached.
+        """
+        try:
+            page_diff = diff_pages(reference_pages, actual_pages)
+            windows = self._windows(page_diff)
+            results = self.diff_chain.batch([self._diff_inputs(w) for w in windows],
+                                            config={"max_concurrency": self.max_concurrency},
+                                            return_exceptions=True)
+            return self._result(page_diff, windows, results)
+        except Exception as e:
+            self.log.error(f"Error comparing the document {e}")
+            raise DocumentPortalException(error_message="Error comparing the document", error_details=e) from e
+
+    async def acompare_pages(self, reference_pages: list[str], actual_pages: list[str]) -> pd.DataFrame:
+        """
+            Async compare_pages(); the page alignment runs on the CPU pool
+        """
+        try:
+            page_diff = await run_cpu(diff_pages, reference_pages, actual_pages)
+            windows = self._windows(page_diff)
+            results = await self.diff_chain.abatch([self._diff_inputs(w) for w in windows],
+                                                   config={"max_concurrency": self.max_concurrency},
+                                                   return_exceptions=True)
+            return self._result(page_diff, windows, results)
+        except Exception as e:
+            self.log.error(f"Error comparing the document {e}")
+            raise DocumentPortalException(error_message="Error comparing the document", error_details=e) from e
+
+    def _windows(self, page_diff: PageDiff) -> list[list[PageChange]]:
+        """
+            Split the changed pages, in page order, into windows for concurrent LLM calls
+        """
+        windows: list[list[PageChange]] = []
+        tokens = 0
+        for change in page_diff.changed:
+            cost = estimate_tokens(change.diff)
+            if not windows or len(windows[-1]) >= self.window_pages or tokens + cost > self.window_tokens:
+                windows.append([])
+                tokens = 0
+            windows[-1].append(change)
+            tokens += cost
+        self.log.info("Page diff computed", pages=len(page_diff.order), unchanged=len(page_diff.unchanged),
+                      changed=len(page_diff.changed), windows=len(windows))
+        return windows
+
+    def _diff_inputs(self, window: list[PageChange]) -> dict:
+        return {"changes": format_changes(window), "format_instruction": self.parser.get_format_instructions()}
+
+    @staticmethod
+    def _validate_rows(response) -> list[dict]:
+        # A malformed window answer raises here, so with_retry() asks the model again.
+        if isinstance(response, dict):
+            response = [response]
+        rows = [{**row, "page": str(row.get("page", ""))} if isinstance(row, dict) else row
+                for row in response or []]
+        return SummaryResponse.model_validate(rows).model_dump()
+
+    def _window_rows(self, windows: list[list[PageChange]], results: list) -> list[dict]:
+        """
+            Rows of the windows that succeeded; failed windows fall back to their raw diffs
+        """
+        rows: list[dict] = []
+        for window, result in zip(windows, results):
+            if isinstance(result, Exception):
+                self.log.warning("Comparison window failed after retries", error=str(result),
+                                 pages=[c.page for c in window])
+                continue
+            rows += result
+        return rows
+
+    def _merge_rows(self, page_diff: PageDiff, response: list[dict]) -> tuple[list[dict], list[str]]:
+        """
+            NO CHANGE rows from the local diff plus the LLM rows, in page order, and the
+            labels of the changed pages that fell back to their raw diff
+        """
+        described = {str(row.get("page")): row.get("changes", "") for row in response or []}
+        fallback = []
+        rows = []
+        for change in page_diff.changed:
+            if change.page not in described:
+                # The model skipped or relabelled this page (or its window failed); use the raw diff.
+                described[change.page] = change.diff
+                fallback.append(change.page)
+        for label in page_diff.order:
+            rows.append({"page": label, "changes": page_diff.unchanged.get(label) or described.pop(label)})
+            described.pop(label, None)  # rows the model wrote for pages the local diff found unchanged
+        if described:
+            self.log.warning("Comparison rows for unknown pages appended", pages=list(described))
+        rows += [{"page": label, "changes": text} for label, text in described.items()]
+        return SummaryResponse.model_validate(rows).model_dump(), fallback
+
+    def _result(self, page_diff: PageDiff, windows: list[list[PageChange]], results: list) -> pd.DataFrame:
+        rows, fallback = self._merge_rows(page_diff, self._window_rows(windows, results))
+        df = self._format_response(rows)
+        df.attrs["fallback_pages"] = fallback
+        if fallback:
+            self.log.warning("Comparison has pages without an LLM description", pages=fallback)
+        return df
 
     def _format_response(self, response_parsed: list[dict]) -> pd.DataFrame: #type: ignore
         """
@@ -12,14 +12,25 @@ from typing import Iterable, List, Optional, Dict, Any
 import fitz  # PyMuPDF
 from langchain.schema import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
 from langchain_community.vectorstores import FAISS
 
-from utils.model_loader import ModelLoader
+from utils.model_loader import ModelLoader, get_model_registry
+from utils.config_loader import load_config_cached
+from utils.faiss_segments import SegmentedFaissStore, docstore_items, merge_into
+from utils.vectorstore_cache import VECTORSTORE_CACHE
+from utils.answer_cache import get_answer_cache
+from utils.bm25_index import BM25Index, append_bm25
+from utils.ann_index import ensure_index_type
+from utils.hybrid_retriever import HybridRetriever
+from utils.sharded_index import ShardLayout, load_shards
+from utils.embedding_cache import CachedEmbeddings, get_embedding_cache
+from utils.embedding_scheduler import EmbeddingScheduler
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
 
-from utils.file_io import _session_id, save_uploaded_files
+from utils.file_io import _session_id, save_uploads, stream_upload
+from utils.document_loader import iter_pdf_pages
+from utils.concurrency import run_cpu, run_io
 from utils.document_ops import load_documents, concat_for_analysis, concat_for_comparison
 
 SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
@@ -29,36 +40,48 @@ class FaissManager:
     """FAISS Manager Class
     """
     def __init__(self, index_dir: Path, model_loader: Optional[ModelLoader] = None):
+        self.log = CustomLogger().get_logger(__name__)
         self.index_dir = Path(index_dir)
         self.index_dir.mkdir(parents=True, exist_ok=True)
+
+        config = load_config_cached()
+        faiss_cfg = config.get("faiss_db", {})
+        self.segmented = faiss_cfg.get("storage", "segmented") == "segmented"
+        self.store = SegmentedFaissStore(self.index_dir,
+                                         compact_after=int(faiss_cfg.get("compact_after_segments", 8)))
         
         self.meta_path = self.index_dir / "ingested_meta.json"
-        self._meta: Dict[str, Any] = {"rows": {}}
-        
-        if self.meta_path.exists():
-            try:
-                self._meta = json.loads(self.meta_path.read_text(encoding="utf-8")) or {"rows": {}}
-            except Exception:
-                self._meta = {"rows": {}}
-        
+        self._meta: Dict[str, Any] = {"rows": self.store.rows()}
+
 
-        self.model_loader = model_loader or ModelLoader()
-        self.emb = self.model_loader.load_embeddings()
+        # An explicit loader builds its own client; otherwise share the process-wide one.
+        self.model_loader = model_loader
+        raw_emb = model_loader.load_embeddings() if model_loader else get_model_registry().get_embeddings()
+        # Chunks embedded in earlier sessions/uploads are served from the on-disk cache;
+        # the rest go to the provider in rate-limited, concurrent batches.
+        self.emb = CachedEmbeddings(EmbeddingScheduler.from_config(raw_emb, config), get_embedding_cache(),
+                                    model_name=getattr(raw_emb, "model", None))
         self.vs: Optional[FAISS] = None
         
     def _exists(self)-> bool:
-        return (self.index_dir / "index.faiss").exists() and (self.index_dir / "index.pkl").exists()
+        return self.store.exists()
     
+    def as_retriever(self, k: int = 5):
+        return self.vs.as_retriever(search_type="similarity", search_kwargs={"k": k})  # type: ignore
+
     @staticmethod
     def _fingerprint(text: str, md: Dict[str, Any]) -> str:
+        # Chunk-level key: source + page + character offset + content hash.
+        content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
         src = md.get("source") or md.get("file_path")
-        rid = md.get("row_id")
-        if src is not None:
-            return f"{src}::{'' if rid is None else rid}"
-        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+        if src is None:
+            return content_hash
+        page = md.get("page", md.get("row_id"))
+        offset = md.get("start_index")
+        return f"{src}::{'' if page is None else page}::{'' if offset is None else offset}::{content_hash}"
     
     def _save_meta(self):
-        self.meta_path.write_text(json.dumps(self._meta, ensure_ascii=False, indent=2), encoding="utf-8")
+        self.meta_path.write_text(json.dumps(self._meta, ensure_ascii=False), encoding="utf-8")
         
         
     def add_documents(self,docs: List[Document]):
@@ -75,26 +98,102 @@ class FaissManager:
         """
         if self.vs is None:
             raise RuntimeError("Call load_or_create() before add_documents_idempotent().")
-        
+
+        new_docs = self._new_chunks(docs)
+        if new_docs:
+            self._write(new_docs)
+        return len(new_docs)
+
+    def ingest(self, docs: List[Document]) -> Dict[str, int]:
+        """Load the index if present, then embed and add only chunks not indexed yet.
+
+        Every new chunk is embedded exactly once; the index is created from those
+        embeddings when it does not exist yet.
+
+        Args:
+            docs (List[Document]): Chunks to index.
+
+        Raises:
+            DocumentPortalException: No existing index and nothing new to create one from.
+
+        Returns:
+            Dict[str, int]: Counts of chunks added and skipped as already indexed.
+        """
+        new_docs = self._prepare(docs)
+        if new_docs:
+            self._write(new_docs)
+        return self._ingest_stats(docs, new_docs)
+
+    async def aingest(self, docs: List[Document]) -> Dict[str, int]:
+        """Async ingest(): embeddings are awaited, disk work runs on the IO pool."""
+        new_docs = await run_io(self._prepare, docs)
+        if new_docs:
+            vectors = await self.emb.aembed_documents([d.page_content for d in new_docs])
+            await run_io(self._write, new_docs, vectors)
+        return self._ingest_stats(docs, new_docs)
+
+    def _prepare(self, docs: List[Document]) -> List[Document]:
+        """Load the existing index (if any) and return the chunks still to be indexed."""
+        if self.vs is None and self._exists():
+            self.load_or_create()
+        if not self._exists():
+            # Metadata without an index (e.g. an interrupted first save) indexes nothing.
+            self._meta = {"rows": {}}
+
+        new_docs = self._new_chunks(docs)
+        if self.vs is None and not new_docs:
+            raise DocumentPortalException("No existing FAISS index and no data to create one", sys)
+        return new_docs
+
+    def _ingest_stats(self, docs: List[Document], new_docs: List[Document]) -> Dict[str, int]:
+        stats = {"added": len(new_docs), "skipped": len(docs) - len(new_docs)}
+        self.log.info("Chunks ingested", index_dir=str(self.index_dir), **stats)
+        return stats
+
+    def _new_chunks(self, docs: List[Document]) -> List[Document]:
+        """Chunks whose fingerprint is neither indexed nor repeated earlier in docs."""
+        seen = set(self._meta["rows"])
         new_docs: List[Document] = []
-        
-        # Create unique key for each document (pdf, txt, docs etc.) and add to metadata. 
-        # If key exists continue else add new document
-        # This will avoid ingesting duplicate data.
-        # Iterate through chunks / documents and create unique key
         for d in docs:
             key = self._fingerprint(d.page_content, d.metadata or {})
-            if key in self._meta["rows"]:
+            if key in seen:
                 continue
-            self._meta["rows"][key] = True
+            seen.add(key)
             new_docs.append(d)
-        
-        # Add new documents to index and save
-        if new_docs:
-            self.vs.add_documents(new_docs)
+        return new_docs
+
+    def _write(self, docs: List[Document], vectors: Optional[List[List[float]]] = None):
+        """Embed docs once (unless vectors are given), add them to the index and persist."""
+        texts = [d.page_content for d in docs]
+        metadatas = [d.metadata or {} for d in docs]
+        if vectors is None:
+            vectors = self.emb.embed_documents(texts)
+        segment = FAISS.from_embeddings(list(zip(texts, vectors)), self.emb, metadatas=metadatas)
+        self._persist(segment, [self._fingerprint(t, md) for t, md in zip(texts, metadatas)])
+
+    def _persist(self, segment: FAISS, rows: List[str]):
+        """Fold segment into the in-memory index and write it out per the storage mode."""
+        self.vs = segment if self.vs is None else merge_into(self.vs, segment)
+        self._meta["rows"].update(dict.fromkeys(rows, True))
+
+        # Lexical index first: ids it holds that never got committed are skipped at query time.
+        # An index built before BM25 existed is backfilled in full on its first write.
+        backfill = not (self.index_dir / BM25Index.FILE).exists()
+        append_bm25(self.index_dir, docstore_items(self.vs if backfill else segment))
+
+        if self.segmented:
+            # Cost scales with the batch: a small delta file plus one journal line.
+            self.store.append(segment, rows)
+            if self.store.pending_segments() >= self.store.compact_after:
+                self.store.compact_in_background(self.emb)
+        else:
+            self.vs = ensure_index_type(self.vs)
             self.vs.save_local(str(self.index_dir))
             self._save_meta()
-        return len(new_docs)
+        VECTORSTORE_CACHE.invalidate(self.index_dir)
+        answer_cache = get_answer_cache()
+        if answer_cache is not None:
+            answer_cache.invalidate(self.index_dir)
     
     def load_or_create(self, texts:Optional[List[str]]=None, metadatas: Optional[List[dict]] = None):
         """Load existing index or create new one if not exists.
@@ -109,23 +208,77 @@ class FaissManager:
         Returns:
             _type_: _description_
         """
-        # Index exists, load and return
+        # Index exists, load base + delta segments and return
         if self._exists():
-            self.vs = FAISS.load_local(
-                str(self.index_dir),
-                embeddings=self.emb,
-                allow_dangerous_deserialization=True,
-            )
+            self.vs = self.store.load(self.emb)
             return self.vs
         if not texts:
             raise DocumentPortalException("No existing FAISS index and no data to create one", sys)
         
         # First time execution. Create new index
-        self.vs = FAISS.from_texts(texts=texts, embedding=self.emb, metadatas=metadatas or [])
-        self.vs.save_local(str(self.index_dir))
+        metadatas = metadatas or [{} for _ in texts]
+        segment = FAISS.from_texts(texts=texts, embedding=self.emb, metadatas=metadatas)
+        self._persist(segment, [self._fingerprint(t, md) for t, md in zip(texts, metadatas)])
         return self.vs
         
         
+class ShardedFaissManager:
+    """
+    Global index split into fixed-size shards (see ShardLayout).
+
+    New chunks are de-duplicated against every shard, then written only to the
+    newest shard (and new shards once it is full), each through its own FaissManager.
+    """
+    def __init__(self, root: Path, shard_size: int, model_loader: Optional[ModelLoader] = None):
+        self.log = CustomLogger().get_logger(__name__)
+        self.root = Path(root)
+        self.layout = ShardLayout(self.root, shard_size=shard_size)
+        self.model_loader = model_loader
+
+    def _plan(self, docs: List[Document]) -> List[tuple]:
+        """(shard dir, chunks) for the chunks not yet in any shard."""
+        seen = set(self.layout.rows())
+        new_docs: List[Document] = []
+        for d in docs:
+            key = FaissManager._fingerprint(d.page_content, d.metadata or {})
+            if key not in seen:
+                seen.add(key)
+                new_docs.append(d)
+        if not new_docs and not self.layout.shard_dirs():
+            raise DocumentPortalException("No existing FAISS index and no data to create one", sys)
+        plan, start = [], 0
+        for shard_dir, count in (self.layout.assign(len(new_docs)) if new_docs else []):
+            plan.append((shard_dir, new_docs[start:start + count]))
+            start += count
+        return plan
+
+    def _ingest_stats(self, docs: List[Document], plan: List[tuple]) -> Dict[str, int]:
+        added = sum(len(part) for _, part in plan)
+        answer_cache = get_answer_cache()
+        if added and answer_cache is not None:
+            answer_cache.invalidate(self.root)
+        stats = {"added": added, "skipped": len(docs) - added}
+        self.log.info("Chunks ingested", index_dir=str(self.root), shards=[d.name for d, _ in plan], **stats)
+        return stats
+
+    def ingest(self, docs: List[Document]) -> Dict[str, int]:
+        plan = self._plan(docs)
+        for shard_dir, part in plan:
+            FaissManager(shard_dir, self.model_loader).ingest(part)
+        return self._ingest_stats(docs, plan)
+
+    async def aingest(self, docs: List[Document]) -> Dict[str, int]:
+        plan = await run_io(self._plan, docs)
+        for shard_dir, part in plan:
+            fm = await run_io(FaissManager, shard_dir, self.model_loader)
+            await fm.aingest(part)
+        return self._ingest_stats(docs, plan)
+
+    def as_retriever(self, k: int = 5) -> HybridRetriever:
+        embeddings = self.model_loader.load_embeddings() if self.model_loader else get_model_registry().get_embeddings()
+        return HybridRetriever(shards=load_shards(self.layout.shard_dirs(), "index", embeddings), k=k)
+
+
 class ChatIngestor:
     """
     Chat Ingestor
@@ -138,7 +291,6 @@ class ChatIngestor:
         ):
         try:
             self.log = CustomLogger().get_logger(__name__)
-            self.model_loader = ModelLoader()
 
             self.use_session = use_session_dirs
             self.session_id = session_id or _session_id()
@@ -151,6 +303,8 @@ class ChatIngestor:
             
             self.temp_dir = self._resolve_dir(self.temp_base)
             self.faiss_dir = self._resolve_dir(self.faiss_base)
+            self.ingest_stats: Dict[str, int] = {"added": 0, "skipped": 0}
+            self.content_hashes: Dict[str, str] = {}
             
             self.log.info("ChatIngestor initialized",
                           session_id=self.session_id,
@@ -170,7 +324,9 @@ class ChatIngestor:
         return base
         
     def _split(self, docs: List[Document], chunk_size=1000, chunk_overlap=200) -> List[Document]:
-        splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        # start_index gives every chunk a distinct offset for fingerprinting.
+        splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                                  add_start_index=True)
         chunks = splitter.split_documents(docs)
         self.log.info("Documents split", chunks=len(chunks), chunk_size=chunk_size, overlap=chunk_overlap)
         return chunks
@@ -197,32 +353,56 @@ class ChatIngestor:
             _type_: _description_
         """
         try:
-            # Store the file in session directory
-            paths = save_uploaded_files(uploaded_files, self.temp_dir)
-            docs = load_documents(paths)
-            if not docs:
-                raise ValueError("No valid documents loaded")
-            
-            chunks = self._split(docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-            fm = FaissManager(self.faiss_dir, self.model_loader)
-            
-            texts = [c.page_content for c in chunks]
-            metas = [c.metadata for c in chunks]
-            
-            try:
-                vs = fm.load_or_create(texts=texts, metadatas=metas)
-            except Exception:
-                vs = fm.load_or_create(texts=texts, metadatas=metas)
-                
-            added = fm.add_documents(chunks)
-            self.log.info("FAISS index updated", added=added, index=str(self.faiss_dir))
-            
-            return vs.as_retriever(search_type="similarity", search_kwargs={"k": k})
+            chunks = self._load_chunks(uploaded_files, chunk_size, chunk_overlap)
+            fm = self._faiss_manager()
+
+            self.ingest_stats = fm.ingest(chunks)
+            self.log.info("FAISS index updated", index=str(self.faiss_dir), **self.ingest_stats)
+
+            return fm.as_retriever(k)
             
         except Exception as e:
             self.log.error("Failed to build retriever", error=str(e))
             raise DocumentPortalException("Failed to build retriever", e) from e
 
+    async def abuilt_retriver(self,
+        uploaded_files: Iterable,
+        *,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        k: int = 5,):
+        """Async built_retriver(): parsing runs on the CPU pool, embeddings are awaited."""
+        try:
+            chunks = await run_cpu(self._load_chunks, uploaded_files, chunk_size, chunk_overlap)
+            fm = await run_io(self._faiss_manager)
+
+            self.ingest_stats = await fm.aingest(chunks)
+            self.log.info("FAISS index updated", index=str(self.faiss_dir), **self.ingest_stats)
+
+            return await run_io(fm.as_retriever, k)
+
+        except Exception as e:
+            self.log.error("Failed to build retriever", error=str(e))
+            raise DocumentPortalException("Failed to build retriever", e) from e
+
+    def _faiss_manager(self):
+        # The shared (non-session) index is sharded so it never has to be loaded whole.
+        shard_size = int(load_config_cached().get("faiss_db", {}).get("shard_size", 0) or 0)
+        if not self.use_session and shard_size > 0:
+            return ShardedFaissManager(self.faiss_dir, shard_size)
+        return FaissManager(self.faiss_dir)
+
+    def _load_chunks(self, uploaded_files: Iterable, chunk_size: int, chunk_overlap: int) -> List[Document]:
+        # Stream the files into the session directory, hashing them on the way
+        uploads = save_uploads(uploaded_files, self.temp_dir)
+        self.content_hashes.update({str(u.path): u.sha256 for u in uploads})
+        paths = [u.path for u in uploads]
+        docs = load_documents(paths, self.content_hashes)
+        if not docs:
+            raise ValueError("No valid documents loaded")
+
+        return self._split(docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
 class DocHandler:
     """
     Save PDF, Read Data for analysis.
@@ -233,6 +413,7 @@ class DocHandler:
         self.session_id = session_id or _session_id("session")
         self.session_path = os.path.join(self.data_dir, self.session_id)
         os.makedirs(self.session_path, exist_ok=True)
+        self.content_hashes: Dict[str, str] = {}
         self.log.info("DocHandler initialized", session_id=self.session_id, session_path=self.session_path)
 
     def save_pdf(self, uploaded_file) -> str:
@@ -256,13 +437,11 @@ class DocHandler:
             
             save_path = os.path.join(self.session_path, filename)
 
-            with open(save_path, "wb") as f:
-                if hasattr(uploaded_file, "read"):
-                    f.write(uploaded_file.read())
-                else:
-                    f.write(uploaded_file.getbuffer())
+            upload = stream_upload(uploaded_file, Path(save_path))
+            self.content_hashes[save_path] = upload.sha256
 
-            self.log.info("PDF saved successfully", file=filename, save_path=save_path, session_id=self.session_id)
+            self.log.info("PDF saved successfully", file=filename, save_path=save_path,
+                          size=upload.size, sha256=upload.sha256, session_id=self.session_id)
 
             return save_path
         except Exception as e:
@@ -282,12 +461,8 @@ class DocHandler:
             str: _description_
         """
         try:
-            text_chunks = []
-
-            with fitz.open(pdf_path) as doc:
-                for page_num in range(doc.page_count):
-                    page = doc.load_page(page_num)
-                    text_chunks.append(f"\n--- Page {page_num + 1} ---\n{page.get_text()}")
+            text_chunks = [f"\n--- Page {d.metadata['page'] + 1} ---\n{d.page_content}"
+                           for d in iter_pdf_pages(pdf_path, content_hash=self.content_hashes.get(str(pdf_path)))]
 
             text = "\n".join(text_chunks)
 
@@ -309,6 +484,7 @@ class DocumentComparator:
         self.session_id = session_id or _session_id()
         self.session_path = self.base_dir / self.session_id
         self.session_path.mkdir(parents=True, exist_ok=True)
+        self.content_hashes: Dict[str, str] = {}
         self.log.info("DocumentComparator initialized", session_path=str(self.session_path))
 
 
@@ -332,11 +508,7 @@ class DocumentComparator:
             for fobj, out in ((reference_file, ref_path), (actual_file, act_path)):
                 if not fobj.name.lower().endswith(".pdf"):
                     raise ValueError("Only PDF files are allowed.")
-                with open(out, "wb") as f:
-                    if hasattr(fobj, "read"):
-                        f.write(fobj.read())
-                    else:
-                        f.write(fobj.getbuffer())
+                self.content_hashes[str(out)] = stream_upload(fobj, out).sha256
             self.log.info("Files saved", reference=str(ref_path), actual=str(act_path), session=self.session_id)
             return ref_path, act_path
         except Exception as e:
@@ -357,21 +529,37 @@ class DocumentComparator:
             str: _description_
         """
         try:
-            with fitz.open(pdf_path) as doc:
-                if doc.is_encrypted:
-                    raise ValueError(f"PDF is encrypted: {pdf_path.name}")
-                parts = []
-                for page_num in range(doc.page_count):
-                    page = doc.load_page(page_num)
-                    text = page.get_text()  # type: ignore
-                    if text.strip():
-                        parts.append(f"\n --- Page {page_num + 1} --- \n{text}")
+            parts = [f"\n --- Page {d.metadata['page'] + 1} --- \n{d.page_content}"
+                     for d in iter_pdf_pages(pdf_path, reject_encrypted=True,
+                                             content_hash=self.content_hashes.get(str(pdf_path)))
+                     if d.page_content.strip()]
             self.log.info("PDF read successfully", file=str(pdf_path), pages=len(parts))
             return "\n".join(parts)
         except Exception as e:
             self.log.error("Error reading PDF", file=str(pdf_path), error=str(e))
             raise DocumentPortalException("Error reading PDF", e) from e
 
+    def read_pages(self, pdf_path: Path) -> List[str]:
+        """Read the text of every page of a PDF, in order (used by the page-level diff).
+
+        Args:
+            pdf_path (Path): PDF saved by save_uploaded_files.
+
+        Raises:
+            DocumentPortalException: If the PDF cannot be read or is encrypted.
+
+        Returns:
+            List[str]: One string per page; blank pages are kept so page numbers line up.
+        """
+        try:
+            pages = [d.page_content for d in iter_pdf_pages(pdf_path, reject_encrypted=True,
+                                                            content_hash=self.content_hashes.get(str(pdf_path)))]
+            self.log.info("PDF pages read", file=str(pdf_path), pages=len(pages))
+            return pages
+        except Exception as e:
+            self.log.error("Error reading PDF", file=str(pdf_path), error=str(e))
+            raise DocumentPortalException("Error reading PDF", e) from e
+
     def combine_documents(self) -> str:
         """Combine all PDFs in the session directory into a single text.
         Raises:
@@ -0,0 +1,188 @@
+# tests/test_routes.py
+
+import asyncio
+import time
+from pathlib import Path
+
+import httpx
+
+import api.main as main
+
+PDF = Path(__file__).resolve().parent.parent / "notebook" / "data" / "CQRS.pdf"
+
+
+class _SlowAnalyzer:
+    async def aanalyze_document(self, text: str) -> dict:
+        await asyncio.sleep(0.2)
+        return {"Summary": [text[:20]]}
+
+
+def test_health_stays_responsive_while_analyzing(tmp_path, monkeypatch):
+    from utils.result_cache import ResultCache
+
+    monkeypatch.setenv("DATA_STORAGE_PATH", str(tmp_path))
+    cache = ResultCache(str(tmp_path / "results.sqlite"))  # a cached analysis would skip the slow read
+    monkeypatch.setattr(main, "get_result_cache", lambda: cache)
+    monkeypatch.setattr(main, "DocumentAnalyzer", _SlowAnalyzer)
+
+    def slow_read_pdf(self, path):
+        time.sleep(0.5)  # stands in for a long text extraction
+        return "extracted text"
+
+    monkeypatch.setattr(main.DocHandler, "read_pdf", slow_read_pdf)
+    payload = PDF.read_bytes()
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            analyses = [
+                asyncio.create_task(client.post(
+                    "/analyze", files={"file": ("CQRS.pdf", payload, "application/pdf")}))
+                for _ in range(4)
+            ]
+            await asyncio.sleep(0.1)
+            health = await client.get("/health")
+            pending = not any(t.done() for t in analyses)
+            responses = await asyncio.gather(*analyses)
+        return health, pending, responses
+
+    health, pending, responses = asyncio.run(scenario())
+    assert health.status_code == 200
+    assert pending  # /health answered while every analysis was still blocked in its read
+    assert [r.status_code for r in responses] == [200] * 4
+    assert cache.stats()["analysis"]["hits"] == 0  # every request ran the slow read
+
+
+def test_compare_serves_repeated_pairs_from_result_cache(tmp_path, monkeypatch):
+    import hashlib
+    import pandas as pd
+    from src.document_ingestion.data_ingestion import DocumentComparator
+    from utils.result_cache import ResultCache
+
+    calls = []
+
+    class _StubCompare:
+        async def acompare_pages(self, reference_pages, actual_pages):
+            calls.append(len(reference_pages))
+            df = pd.DataFrame([{"page": "1", "changes": "NO CHANGE"}])
+            df.attrs["fallback_pages"] = ["1"] if len(calls) == 1 else []  # first run: a window failed
+            return df
+
+    cache = ResultCache(str(tmp_path / "results.sqlite"))
+    hashed = []
+    monkeypatch.setattr(main, "upload_sha256", lambda upload: hashed.append(upload))
+    monkeypatch.setattr(main, "get_result_cache", lambda: cache)
+    monkeypatch.setattr(main, "DocumentCompareLLM", _StubCompare)
+    monkeypatch.setattr(main, "DocumentComparator", lambda: DocumentComparator(base_dir=str(tmp_path / "cmp")))
+    payload = PDF.read_bytes()
+    files = {"reference": ("a.pdf", payload, "application/pdf"),
+             "actual": ("b.pdf", payload, "application/pdf")}
+    digest = hashlib.sha256(payload).hexdigest()
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            runs = [await client.post("/compare", files=files) for _ in range(3)]
+            dropped = await client.post("/compare/cache/invalidate",
+                                        data={"reference_sha256": digest, "actual_sha256": digest})
+            runs.append(await client.post("/compare", files=files))
+            return runs, dropped
+
+    runs, dropped = asyncio.run(scenario())
+    assert [r.json()["cached"] for r in runs] == [False, False, True, False]
+    assert all(r.json()["rows"] == [{"page": "1", "changes": "NO CHANGE"}] for r in runs)
+    assert dropped.json()["invalidated"] == 1
+    assert len(calls) == 3 and len(list((tmp_path / "cmp").iterdir())) == 3  # the hit left no session folder
+    assert hashed == []  # the cache key is the digests computed while saving the uploads
+    assert cache.stats()["compare"]["hit_ratio"] == 0.25
+
+
+def test_analyze_uses_result_cache_until_invalidated(tmp_path, monkeypatch):
+    import hashlib
+    from utils.result_cache import ResultCache
+
+    calls = []
+
+    class _CountingAnalyzer:
+        async def aanalyze_document(self, text: str) -> dict:
+            calls.append(text)
+            return {"Summary": ["cached summary"]}
+
+    reads, hashed = [], []
+    monkeypatch.setattr(main, "upload_sha256", lambda upload: hashed.append(upload))
+    monkeypatch.setenv("DATA_STORAGE_PATH", str(tmp_path))
+    cache = ResultCache(str(tmp_path / "results.sqlite"))
+    monkeypatch.setattr(main, "get_result_cache", lambda: cache)
+    monkeypatch.setattr(main, "DocumentAnalyzer", _CountingAnalyzer)
+    monkeypatch.setattr(main.DocHandler, "read_pdf", lambda self, path: reads.append(path) or "extracted text")
+    payload = PDF.read_bytes()
+    files = {"file": ("CQRS.pdf", payload, "application/pdf")}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = await client.post("/analyze", files=files)
+            second = await client.post("/analyze", files=files)
+            dropped = await client.post("/analyze/cache/invalidate",
+                                        data={"sha256": hashlib.sha256(payload).hexdigest()})
+            third = await client.post("/analyze", files=files)
+            return first, second, dropped, third
+
+    first, second, dropped, third = asyncio.run(scenario())
+    assert first.json() == second.json() == third.json() == {"Summary": ["cached summary"]}
+    assert dropped.json()["invalidated"] == 1
+    assert len(calls) == 2 and len(reads) == 2  # the second request skipped extraction and the LLM
+    assert hashed == []  # the cache key is the digest computed while saving the upload
+    assert len([d for d in tmp_path.iterdir() if d.is_dir()]) == 2  # the hit left no session folder
+    assert cache.stats()["analysis"]["hit_ratio"] == round(1 / 3, 4)
+
+
+def test_chat_stream_stores_turn_before_done_and_compacts_after(tmp_path, monkeypatch):
+    class _StubRAG:
+        def __init__(self, session_id=None):
+            pass
+
+        def load_retriever_from_faiss(self, index_dir, k=5, index_name="index"):
+            pass
+
+        async def astream(self, question, chat_history=None):
+            yield {"type": "token", "text": "hi"}
+            yield {"type": "done", "answer": "hi", "sources": [], "timing": {}}
+
+    stored, compactions = [], []
+
+    class _StubMemory:
+        def history(self, session_id):
+            return []
+
+        def append(self, session_id, question, answer):
+            stored.append((session_id, question, answer))
+
+        def needs_compaction(self, session_id):
+            return True
+
+        def summary_max_words(self):
+            return 50
+
+        async def acompact(self, session_id, summarize):
+            compactions.append(session_id)
+            raise RuntimeError("summary store unavailable")
+
+    monkeypatch.setattr(main, "ConversationalRAG", _StubRAG)
+    monkeypatch.setattr(main, "get_chat_memory", lambda: _StubMemory())
+    monkeypatch.setattr(main, "_resolve_index_dir", lambda session_id, use_session_dirs: str(tmp_path))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            async with client.stream("POST", "/chat/query/stream",
+                                     data={"question": "hello", "session_id": "s1"}) as res:
+                async for line in res.aiter_lines():
+                    if line == "event: done":
+                        stored_at_done = list(stored)
+                        break
+            return stored_at_done
+
+    stored_at_done = asyncio.run(scenario())
+    assert stored_at_done == [("s1", "hello", "hi")]  # the turn is stored before `done` is sent
+    assert compactions == ["s1"]  # ran after the body; its failure was logged, not streamed
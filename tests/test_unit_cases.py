@@ -1,6 +1,7 @@
 # tests/test_unit_cases.py
 
 import pytest
+from pathlib import Path
 from fastapi.testclient import TestClient
 from api.main import app   # or your FastAPI entrypoint
 
@@ -9,4 +10,690 @@ client = TestClient(app)
 def test_home():
     response = client.get("/")
     assert response.status_code == 200
-    assert "Document Portal" in response.text
\ No newline at end of file
+    assert "Document Portal" in response.text
+
+def test_vectorstore_cache_hits_and_evicts(tmp_path):
+    from utils.vectorstore_cache import VectorStoreCache
+
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "index.faiss").write_bytes(b"x" * 10)
+
+    cache = VectorStoreCache(max_entries=1, max_bytes=1024)
+    loads = []
+    first = cache.get_or_load(tmp_path / "a", "index", lambda: loads.append("a") or "store-a")
+    again = cache.get_or_load(tmp_path / "a", "index", lambda: loads.append("a") or "store-a")
+    assert first == again == "store-a"
+    assert loads == ["a"]
+
+    cache.get_or_load(tmp_path / "b", "index", lambda: "store-b")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 2, 1)
+
+    assert cache.invalidate(tmp_path / "b") == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_model_registry_reuses_clients_until_config_changes():
+    from utils.model_loader import ModelRegistry
+
+    class StubLoader:
+        config = {"llm": {"google": {"model_name": "m1"}}, "embedding_model": {"model_name": "e1"}}
+        built = 0
+
+        def load_llm(self, provider_key=None, **_):
+            StubLoader.built += 1
+            return object()
+
+        def load_embeddings(self):
+            return object()
+
+    loader = StubLoader()
+    registry = ModelRegistry(loader=loader)  # type: ignore[arg-type]
+    llm = registry.get_llm("google")
+    assert registry.get_llm("google") is llm
+    assert registry.get_embeddings() is registry.get_embeddings()
+
+    loader.config = {"llm": {"google": {"model_name": "m2"}}, "embedding_model": {"model_name": "e1"}}
+    assert registry.get_llm("google") is not llm
+    assert StubLoader.built == 2
+    assert registry.stats() == {"llm_clients": 1, "embedding_clients": 1}
+    registry.close()
+
+
+def test_cached_embeddings_only_embeds_unseen_texts(tmp_path):
+    from utils.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+    class CountingEmbeddings:
+        model = "fake-model"
+        calls: list = []
+
+        def embed_documents(self, texts):
+            self.calls.append(list(texts))
+            return [[float(len(t)), 1.0] for t in texts]
+
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite"))
+    emb = CachedEmbeddings(CountingEmbeddings(), cache)  # type: ignore[arg-type]
+    assert emb.embed_documents(["aa", "bbb", "aa"]) == [[2.0, 1.0], [3.0, 1.0], [2.0, 1.0]]
+    assert emb.embed_documents(["bbb", "c"]) == [[3.0, 1.0], [1.0, 1.0]]
+    assert CountingEmbeddings.calls == [["aa", "bbb"], ["c"]]
+    assert cache.stats()["hits"] == 1
+    cache.close()
+
+
+def test_faiss_manager_ingest_embeds_each_chunk_once(tmp_path, monkeypatch):
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from src.document_ingestion import data_ingestion
+    from utils.embedding_cache import EmbeddingCache
+
+    embedded = []
+
+    class CountingEmbedding(DeterministicFakeEmbedding):
+        def embed_documents(self, texts):
+            embedded.extend(texts)
+            return super().embed_documents(texts)
+
+    class StubLoader:
+        def load_embeddings(self):
+            return CountingEmbedding(size=8)
+
+    monkeypatch.setattr(data_ingestion, "get_embedding_cache",
+                        lambda: EmbeddingCache(str(tmp_path / "emb.sqlite")))
+    chunks = [
+        Document(page_content="alpha", metadata={"source": "a.pdf", "page": 0, "start_index": 0}),
+        Document(page_content="beta", metadata={"source": "a.pdf", "page": 0, "start_index": 5}),
+    ]
+    fm = data_ingestion.FaissManager(tmp_path / "idx", StubLoader())  # type: ignore[arg-type]
+    assert fm.ingest(chunks) == {"added": 2, "skipped": 0}
+    assert embedded == ["alpha", "beta"]
+
+    more = chunks + [Document(page_content="gamma", metadata={"source": "a.pdf", "page": 1, "start_index": 0})]
+    fm2 = data_ingestion.FaissManager(tmp_path / "idx", StubLoader())  # type: ignore[arg-type]
+    assert fm2.ingest(more) == {"added": 1, "skipped": 2}
+    assert embedded == ["alpha", "beta", "gamma"]
+    assert fm2.vs.index.ntotal == 3
+
+
+def test_segmented_store_appends_and_compacts(tmp_path):
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from utils.faiss_segments import SegmentedFaissStore
+
+    emb = DeterministicFakeEmbedding(size=8)
+    store = SegmentedFaissStore(tmp_path, compact_after=2)
+    assert not store.exists()
+    store.append(FAISS.from_texts(["a", "b"], emb), ["fa", "fb"])
+    store.append(FAISS.from_texts(["c"], emb), ["fc"])
+    with open(tmp_path / store.JOURNAL, "a", encoding="utf-8") as f:
+        f.write('{"seq": 3, "segm')  # torn write from a crash is ignored
+
+    assert store.pending_segments() == 2
+    assert store.load(emb).index.ntotal == 3
+    store.append(FAISS.from_texts(["d"], emb), ["fd"])
+
+    assert store.compact(emb)
+    assert store.pending_segments() == 0
+    assert not list((tmp_path / "segments").glob("*.faiss"))
+    assert store.load(emb).index.ntotal == 4
+    assert set(store.rows()) == {"fa", "fb", "fc", "fd"}
+
+
+def test_embedding_scheduler_batches_retries_and_keeps_order():
+    from utils.embedding_scheduler import EmbeddingScheduler
+
+    class FlakyEmbeddings:
+        def __init__(self):
+            self.batches = []
+            self.failed = False
+
+        def embed_documents(self, texts):
+            if not self.failed and texts[0] == "t4":
+                self.failed = True
+                raise RuntimeError("429 Resource has been exhausted")
+            self.batches.append(list(texts))
+            return [[float(t[1:])] for t in texts]
+
+    flaky = FlakyEmbeddings()
+    scheduler = EmbeddingScheduler(flaky, batch_size=2, max_concurrency=3,  # type: ignore[arg-type]
+                                   backoff_base_seconds=0.01, provider="test")
+    texts = [f"t{i}" for i in range(7)]
+    assert scheduler.embed_documents(texts) == [[float(i)] for i in range(7)]
+    assert sorted(len(b) for b in flaky.batches) == [1, 2, 2, 2]
+
+
+def test_stream_upload_hashes_and_enforces_limit(tmp_path):
+    import hashlib
+    import io
+    from utils.file_io import UploadTooLargeError, stream_upload
+
+    data = b"0123456789" * 100
+    saved = stream_upload(io.BytesIO(data), tmp_path / "doc.pdf", max_bytes=2000, block_size=64)
+    assert saved.size == len(data)
+    assert saved.sha256 == hashlib.sha256(data).hexdigest()
+    assert (tmp_path / "doc.pdf").read_bytes() == data
+
+    with pytest.raises(UploadTooLargeError):
+        stream_upload(io.BytesIO(data), tmp_path / "big.pdf", max_bytes=500, block_size=64)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["doc.pdf"]
+
+
+def test_parallel_pdf_extraction_matches_serial():
+    from utils import pdf_extract
+    from utils.pdf_extract import extract_pages, page_ranges, shutdown_pool
+
+    assert page_ranges(10, 3) == [(0, 4), (4, 8), (8, 10)]
+    pdf = "notebook/data/XML.pdf"
+    assert extract_pages(pdf, max_workers=2, min_pages_parallel=0) == extract_pages(pdf, max_workers=1)
+    shutdown_pool(wait=True)
+    assert pdf_extract._POOL is None
+
+
+def test_document_loader_yields_pages_and_text_files(tmp_path):
+    from utils.document_ops import load_documents
+
+    note = tmp_path / "note.txt"
+    note.write_text("plain text", encoding="utf-8")
+    docs = load_documents([Path("notebook/data/CQRS.pdf"), note, tmp_path / "skip.csv"])
+    assert [d.metadata.get("page") for d in docs] == [0, 1, 2, 3, None]
+    assert docs[-1].page_content == "plain text"
+    assert docs[0].metadata["source"].endswith("CQRS.pdf")
+
+
+def test_extracted_text_cache_hits_and_evicts_lru(tmp_path):
+    import os
+    from utils.text_cache import ExtractedTextCache
+
+    cache = ExtractedTextCache(str(tmp_path), max_bytes=10_000)
+    cache.put("a" * 64, "v1", ["page one", "page two"])
+    assert cache.get("a" * 64, "v1") == {"pages": ["page one", "page two"], "encrypted": False}
+    assert cache.get("a" * 64, "v2") is None
+
+    first = tmp_path / f"{'a' * 64}_v1{cache.SUFFIX}"
+    os.utime(first, (1, 1))  # oldest entry
+    cache.max_bytes = first.stat().st_size + 1
+    cache.put("b" * 64, "v1", ["other"])
+    assert cache.get("a" * 64, "v1") is None
+    assert cache.get("b" * 64, "v1") == {"pages": ["other"], "encrypted": False}
+    assert cache.stats()["evictions"] == 1
+
+
+def test_extracted_text_cache_drops_truncated_entries_and_skips_temp_files(tmp_path):
+    from utils.text_cache import ExtractedTextCache
+
+    cache = ExtractedTextCache(str(tmp_path), max_bytes=10_000)
+    cache.put("a" * 64, "v1", ["page one " * 50])
+    entry = tmp_path / f"{'a' * 64}_v1{cache.SUFFIX}"
+    entry.write_bytes(entry.read_bytes()[:20])  # truncated gzip stream
+    assert cache.get("a" * 64, "v1") is None
+    assert not entry.exists()
+
+    in_flight = tmp_path / f"{cache.TMP_PREFIX}{'b' * 64}_v1{cache.SUFFIX}"
+    in_flight.write_bytes(b"x" * 100)
+    cache.max_bytes = 0
+    cache.put("c" * 64, "v1", ["other"])
+    assert in_flight.exists()
+    assert ExtractedTextCache(str(tmp_path), max_bytes=10_000)._bytes == 0
+
+
+def test_extracted_text_cache_concurrent_puts_of_one_key(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from utils.text_cache import ExtractedTextCache
+
+    cache = ExtractedTextCache(str(tmp_path), max_bytes=10_000)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: cache.put("abc", "v1", ["page " * 200]), range(8)))
+    assert [p.name for p in tmp_path.iterdir()] == [f"abc_v1{cache.SUFFIX}"]
+    assert cache.stats()["bytes"] == (tmp_path / f"abc_v1{cache.SUFFIX}").stat().st_size
+
+    cache.cache_dir = tmp_path / "missing"  # unwritable: the write is skipped, not raised
+    cache.put("def", "v1", ["page"])
+    assert cache.get("def", "v1") is None
+
+
+def test_conversational_rag_streams_tokens_then_done(monkeypatch):
+    import asyncio
+    from langchain_core.documents import Document
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from langchain_core.runnables import RunnableLambda
+    from src.document_chat import retrieval
+
+    class StubRegistry:
+        def get_llm(self):
+            # No chat history, so the rewrite step is skipped and only the answer is generated.
+            return FakeListChatModel(responses=["The answer."])
+
+    monkeypatch.setattr(retrieval, "get_model_registry", lambda: StubRegistry())
+    docs = [Document(page_content="ctx", metadata={"source": "/tmp/a.pdf", "page": 2})]
+    rag = retrieval.ConversationalRAG(session_id="s1", retriever=RunnableLambda(lambda q: docs))
+
+    async def collect():
+        return [e async for e in rag.astream("what is it?")]
+
+    events = asyncio.run(collect())
+    assert "".join(e["text"] for e in events if e["type"] == "token") == "The answer."
+    assert events[-1]["type"] == "done"
+    assert events[-1]["answer"] == "The answer."
+    assert events[-1]["sources"] == [{"source": "a.pdf", "page": 3}]
+
+
+def test_question_rewrite_only_runs_when_history_is_needed(monkeypatch):
+    from langchain_core.documents import Document
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langchain_core.runnables import RunnableLambda
+    from src.document_chat import retrieval
+    from utils.query_rewrite import RewriteMetrics, needs_rewrite
+
+    history = [HumanMessage("Tell me about CQRS"), AIMessage("It separates reads and writes.")]
+    assert not needs_rewrite("what is it?", [])
+    assert not needs_rewrite("How does CQRS handle event sourcing?", history)
+    assert needs_rewrite("what are its drawbacks?", history)
+    assert needs_rewrite("and performance?", history)
+
+    class StubRegistry:
+        def get_llm(self):
+            return FakeListChatModel(responses=["What are the drawbacks of CQRS?", "The answer."])
+
+    metrics = RewriteMetrics()
+    monkeypatch.setattr(retrieval, "REWRITE_METRICS", metrics)
+    monkeypatch.setattr(retrieval, "get_model_registry", lambda: StubRegistry())
+    queries = []
+    retriever = RunnableLambda(lambda q: queries.append(q) or [Document(page_content="ctx")])
+    rag = retrieval.ConversationalRAG(session_id="s1", retriever=retriever)
+
+    rag.invoke("what are its drawbacks?", chat_history=history)
+    assert queries == ["What are the drawbacks of CQRS?"]
+
+    rag.invoke("What are the drawbacks of CQRS?", chat_history=[])
+    assert queries[-1] == "What are the drawbacks of CQRS?"
+    stats = metrics.stats()
+    assert stats["rewritten"] == 1 and stats["skipped_no_history"] == 1
+
+
+def test_chat_memory_keeps_history_within_budget(tmp_path):
+    import asyncio
+    from utils.chat_memory import ChatMemory
+    from utils.token_count import estimate_tokens
+
+    memory = ChatMemory(str(tmp_path / "memory.sqlite"), max_tokens=100, summary_max_tokens=20)
+    for i in range(10):
+        memory.append("s1", f"question {i} " + "q" * 40, f"answer {i} " + "a" * 40)
+    memory.append("s2", "other session", "untouched")
+
+    window = memory.history("s1")
+    assert sum(estimate_tokens(m.content) for m in window) <= 100
+    assert window[-1].content.startswith("answer 9")
+    assert memory.needs_compaction("s1")
+
+    folded = []
+
+    async def summarize(summary, messages):
+        folded.extend(m.content for m in messages)
+        return "earlier: " + ", ".join(m.content.split()[1] for m in messages if m.type == "human")
+
+    assert asyncio.run(memory.acompact("s1", summarize))
+    assert folded[0].startswith("question 0")
+    assert not memory.needs_compaction("s1")
+
+    window = memory.history("s1")
+    assert window[0].type == "system" and "earlier: 0" in window[0].content
+    assert window[-1].content.startswith("answer 9")
+    assert [m.content for m in memory.history("s2")] == ["other session", "untouched"]
+
+
+def test_answer_cache_exact_semantic_and_invalidation(tmp_path):
+    from utils.answer_cache import AnswerCache, answer_scope
+
+    cache = AnswerCache(max_entries=2, ttl_seconds=60, similarity_threshold=0.9)
+    scope = answer_scope(tmp_path, "index", "s1")
+    value = {"answer": "30 days notice.", "sources": []}
+    cache.put(scope, 1, "What is the termination clause?", [1.0, 0.0], value)
+
+    assert cache.get_exact(scope, 1, "  what is the termination clause ") == value
+    assert cache.get_similar(scope, 1, [0.99, 0.05]) == value
+    assert cache.get_similar(scope, 1, [0.0, 1.0]) is None
+    assert cache.get_exact(answer_scope(tmp_path, "index", "s2"), 1, "What is the termination clause?") is None
+    assert cache.get_exact(scope, 2, "What is the termination clause?") is None  # index changed
+
+    cache.put(scope, 2, "q1", [1.0, 0.0], value)
+    assert cache.invalidate(tmp_path) == 1
+    assert cache.get_exact(scope, 2, "q1") is None
+    stats = cache.stats()
+    assert stats["exact_hits"] == 1 and stats["semantic_hits"] == 1 and stats["invalidations"] == 1
+
+
+def test_hybrid_retriever_fuses_and_takes_lexical_fast_path(tmp_path):
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from utils.bm25_index import BM25Index, append_bm25
+    from utils.faiss_segments import docstore_items
+    from utils.hybrid_retriever import HybridRetriever, rrf_fuse
+
+    class CountingEmbeddings(DeterministicFakeEmbedding):
+        calls: int = 0
+
+        def embed_query(self, text):
+            self.calls += 1
+            return super().embed_query(text)
+
+    texts = ["Clause 4.2 covers termination with 30 days notice.",
+             "SKU-1234 ships in blue and red.",
+             "The warranty lasts two years from delivery."]
+    emb = CountingEmbeddings(size=16)
+    vs = FAISS.from_texts(texts, emb)
+    append_bm25(tmp_path, docstore_items(vs))
+    bm25 = BM25Index.load(tmp_path)
+    assert len(bm25) == 3
+
+    retriever = HybridRetriever(shards=[(vs, bm25)], k=2)
+    docs = retriever.invoke("clause 4.2")
+    assert docs[0].page_content.startswith("Clause 4.2") and emb.calls == 0
+
+    docs = retriever.invoke("how long is the warranty?")
+    assert emb.calls == 1 and len(docs) == 2
+    assert any("warranty" in d.page_content for d in docs)
+    assert rrf_fuse([["a", "b"], ["b", "c"]], k=2) == ["b", "a"]
+
+
+def test_flat_index_upgrades_to_configured_ann_type(tmp_path):
+    import numpy as np
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from utils.ann_index import ann_settings, ensure_index_type, index_type_of
+    from utils.faiss_segments import merge_into
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(400, 8)).astype(np.float32)
+    emb = DeterministicFakeEmbedding(size=8)
+    vs = FAISS.from_embeddings([(f"chunk {i}", v.tolist()) for i, v in enumerate(vectors)], emb)
+
+    settings = {**ann_settings(), "index_type": "auto", "auto_type": "ivf_flat", "ann_threshold": 500}
+    assert index_type_of(ensure_index_type(vs, settings).index) == "flat"  # below threshold
+
+    extra = FAISS.from_embeddings([(f"chunk {400 + i}", v.tolist()) for i, v in enumerate(vectors[:150])], emb)
+    merge_into(vs, extra)
+    ensure_index_type(vs, settings)
+    assert index_type_of(vs.index) == "ivf_flat" and vs.index.ntotal == 550
+
+    # Later segments still merge into the trained index, and it round-trips through disk.
+    merge_into(vs, FAISS.from_embeddings([("late chunk", vectors[7].tolist())], emb))
+    vs.save_local(str(tmp_path))
+    loaded = FAISS.load_local(str(tmp_path), emb, allow_dangerous_deserialization=True)
+    hits = loaded.similarity_search_by_vector(vectors[3].tolist(), k=1)
+    assert index_type_of(loaded.index) == "ivf_flat" and hits[0].page_content == "chunk 3"
+
+
+def test_sharded_global_index_fills_newest_shard_and_fans_out(tmp_path, monkeypatch):
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from src.document_ingestion import data_ingestion
+    from utils.embedding_cache import EmbeddingCache
+
+    class StubRegistry:
+        def get_embeddings(self):
+            return DeterministicFakeEmbedding(size=16)
+
+    monkeypatch.setattr(data_ingestion, "get_model_registry", lambda: StubRegistry())
+    monkeypatch.setattr(data_ingestion, "get_embedding_cache",
+                        lambda: EmbeddingCache(str(tmp_path / "emb.sqlite")))
+
+    def docs(start, stop):
+        return [Document(page_content=f"Invoice INV-{i:03d} totals {i * 10} dollars.",
+                         metadata={"source": "ledger.pdf", "page": i}) for i in range(start, stop)]
+
+    root = tmp_path / "faiss_index"
+    manager = data_ingestion.ShardedFaissManager(root, shard_size=2)
+    assert manager.ingest(docs(0, 3)) == {"added": 3, "skipped": 0}
+    assert manager.ingest(docs(0, 5)) == {"added": 2, "skipped": 3}
+    assert [d.name for d in manager.layout.shard_dirs()] == ["shard_0001", "shard_0002", "shard_0003"]
+
+    retriever = manager.as_retriever(k=2)
+    assert len(retriever.shards) == 3
+    hits = retriever.invoke("inv-004")  # identifier: lexical fast path across shards
+    assert hits[0].page_content.startswith("Invoice INV-004")
+    assert len(retriever.invoke("how much was invoiced overall?")) == 2
+
+
+def test_conversational_rag_batch_embeds_once_and_keeps_order(monkeypatch):
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from src.document_chat import retrieval
+    from utils.answer_cache import AnswerCache, answer_scope
+
+    class CountingEmbeddings(DeterministicFakeEmbedding):
+        batches: list = []
+
+        def embed_documents(self, texts, **kwargs):
+            self.batches.append(list(texts))
+            return super().embed_documents(texts)
+
+    class StubRegistry:
+        def get_llm(self):
+            return FakeListChatModel(responses=["ok"])
+
+    monkeypatch.setattr(retrieval, "get_model_registry", lambda: StubRegistry())
+    monkeypatch.setattr(retrieval, "get_answer_cache", lambda: AnswerCache())
+    emb = CountingEmbeddings(size=16)
+    vs = FAISS.from_texts(["alpha facts", "beta facts", "gamma facts"], emb)
+    emb.batches.clear()
+
+    rag = retrieval.ConversationalRAG(session_id="s1")
+    rag.vectorstore = vs
+    rag._cache_scope, rag._index_version = answer_scope("idx", "index", "s1"), 1
+    rag.retriever = vs.as_retriever(search_kwargs={"k": 2})
+    rag._k = 2
+    rag._build_lcel_chain()
+
+    questions = ["tell me about alpha", "tell me about beta", "tell me about gamma"]
+    results = rag.batch(questions, max_concurrency=2)
+    assert [r["question"] for r in results] == questions
+    assert emb.batches == [questions]
+    assert all(r["answer"] == "ok" and len(r["sources"]) == 1 and not r["cached"] for r in results)
+
+    again = rag.batch(questions[:1])
+    assert again[0]["cached"] and emb.batches == [questions]
+
+
+def test_context_packer_merges_overlaps_drops_repeats_and_fits_budget():
+    from langchain_core.documents import Document
+    from utils.context_packer import pack_context
+
+    page = " ".join(f"word{i}" for i in range(300))
+    first, second = page[:1200], page[1000:2000]
+    docs = [
+        Document(page_content=second, metadata={"source": "a.pdf", "page": 0, "start_index": 1000}),
+        Document(page_content=first, metadata={"source": "a.pdf", "page": 0, "start_index": 0}),
+        Document(page_content=first, metadata={"source": "copy.pdf", "page": 3, "start_index": 0}),
+        Document(page_content="unrelated closing note", metadata={"source": "b.pdf", "page": 1}),
+    ]
+
+    packed = pack_context(docs, max_tokens=10_000)
+    assert packed.text == page[:2000] + "\n\n" + "unrelated closing note"
+    assert packed.spans == 2 and packed.chunks == 4 and packed.tokens_saved > 0
+
+    tight = pack_context(docs, max_tokens=100)
+    assert tight.tokens <= 100 and page.startswith(tight.text)
+
+
+def test_document_analyzer_map_reduces_long_documents(monkeypatch):
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from src.document_analyzer import data_analysis
+
+    pages = "".join(f"\n--- Page {i} ---\n" + f"page {i} " * 300 for i in range(1, 7))
+    sections = data_analysis.split_sections(pages, max_tokens=1300)
+    assert len(sections) == 3 and "".join(sections) == pages
+    assert all(s.lstrip().startswith("--- Page") for s in sections)
+
+    note = '{"Summary": ["a section"], "Title": "Report"}'
+    metadata = ('{"Summary": ["whole"], "Title": "Report", "Author": "A", "DateCreated": "x", '
+                '"LastModifiedDate": "x", "Publisher": "P", "Language": "en", "PageCount": 6, '
+                '"Sentimenttone": "neutral"}')
+    llm = FakeListChatModel(responses=[note, note, note, metadata])
+
+    class StubRegistry:
+        def get_llm(self):
+            return llm
+
+    monkeypatch.setattr(data_analysis, "get_model_registry", lambda: StubRegistry())
+    analyzer = data_analysis.DocumentAnalyzer()
+    analyzer.map_reduce_threshold, analyzer.section_tokens, analyzer.max_concurrency = 1000, 1300, 1
+
+    result = analyzer.analyze_document(pages)
+    assert result["Title"] == "Report" and result["PageCount"] == 6
+    assert analyzer._reduce_inputs(pages, [{"Summary": []}])["page_count"] == 6
+
+    llm.responses, llm.i = [metadata], 0
+    analyzer.map_reduce_threshold = 10 ** 6
+    assert analyzer.analyze_document(pages)["Summary"] == ["whole"]
+
+
+def test_page_diff_aligns_inserted_pages_and_sends_only_changes(monkeypatch):
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from src.document_compare import document_compare
+    from utils.page_diff import NO_CHANGE, diff_pages
+
+    ref = [f"Section {i}\nThe fee for item {i} is {i * 10} dollars.\nPayment due in 30 days." for i in range(1, 6)]
+    act = list(ref)
+    act.insert(2, "A brand new appendix page about something else entirely.")
+    act[4] = act[4].replace("30 days", "45 days")  # was reference page 4
+
+    result = diff_pages(ref, act)
+    assert result.order == ["1", "2", "3 (added)", "3 -> 4", "4 -> 5", "5 -> 6"]
+    assert [c.page for c in result.changed] == ["3 (added)", "4 -> 5"]
+    assert "-Payment due in 30 days." in result.changed[1].diff and "+Payment due in 45 days." in result.changed[1].diff
+    assert result.unchanged["3 -> 4"] == NO_CHANGE
+
+    described = '[{"page": "4 -> 5", "changes": "Payment term extended to 45 days."}]'
+    llm = FakeListChatModel(responses=[described, described])
+
+    class StubRegistry:
+        def get_llm(self):
+            return llm
+
+    monkeypatch.setattr(document_compare, "get_model_registry", lambda: StubRegistry())
+    comp = document_compare.DocumentCompareLLM()
+    rows = comp.compare_pages(ref, act).to_dict(orient="records")
+    assert [r["page"] for r in rows] == result.order
+    assert rows[4]["changes"] == "Payment term extended to 45 days."
+    assert rows[2]["changes"].startswith("--- reference (no page)")  # not described by the model: raw diff
+    assert comp.compare_pages(ref, act).attrs["fallback_pages"] == ["3 (added)"]
+    assert llm.i == 0
+
+    merged, _ = comp._merge_rows(result, [{"page": "1", "changes": "Reworded."},  # unchanged locally
+                                          {"page": "4 -> 5", "changes": "Payment term extended."},
+                                          {"page": "9", "changes": "Unknown page."}])
+    assert [r["page"] for r in merged] == result.order + ["9"]
+    assert merged[0]["changes"] == NO_CHANGE
+
+    assert set(comp.compare_pages(ref, ref)["changes"]) == {NO_CHANGE} and llm.i == 0  # no LLM call
+
+
+def test_windowed_comparison_retries_bad_windows_and_merges_in_page_order(monkeypatch):
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from src.document_compare import document_compare
+
+    ref = [f"Page {i} text.\nAmount: {i}" for i in range(1, 5)]
+    act = [f"Page {i} text.\nAmount: {i * 100}" for i in range(1, 5)]
+    llm = FakeListChatModel(responses=[
+        '[{"page": 1, "changes": "Amount 1 -> 100"}, {"page": "2", "changes": "Amount 2 -> 200"}]',
+        "Sorry, I cannot produce JSON right now.",
+        '[{"page": "3", "changes": "Amount 3 -> 300"}, {"page": "4", "changes": "Amount 4 -> 400"}]',
+    ])
+
+    class StubRegistry:
+        def get_llm(self):
+            return llm
+
+    monkeypatch.setattr(document_compare, "get_model_registry", lambda: StubRegistry())
+    comp = document_compare.DocumentCompareLLM()
+    comp.window_pages, comp.max_concurrency = 2, 1
+
+    rows = comp.compare_pages(ref, act).to_dict(orient="records")
+    assert rows == [
+        {"page": "1", "changes": "Amount 1 -> 100"},
+        {"page": "2", "changes": "Amount 2 -> 200"},
+        {"page": "3", "changes": "Amount 3 -> 300"},
+        {"page": "4", "changes": "Amount 4 -> 400"},
+    ]
+
+
+def test_result_cache_expires_and_evicts_least_recently_used(tmp_path, monkeypatch):
+    from utils import result_cache
+    from utils.result_cache import ResultCache, result_key
+
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "time", lambda: now[0])
+    cache = ResultCache(str(tmp_path / "results.sqlite"), max_entries=2, ttl_seconds=60)
+    a, b, c = (result_key("ref", x, "v1", "google:gemini") for x in "abc")
+    assert a != result_key("ref", "a", "v2", "google:gemini")
+
+    cache.put("compare", a, [{"page": "1"}])
+    cache.put("compare", b, [{"page": "2"}])
+    now[0] += 1
+    assert cache.get("compare", a) == [{"page": "1"}]  # a is now more recently used than b
+    cache.put("compare", c, [{"page": "3"}])
+    assert cache.get("compare", b) is None and cache.get("compare", c) == [{"page": "3"}]
+
+    now[0] += 61
+    assert cache.get("compare", a) is None
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["expirations"] == 1 and stats["compare"]["hits"] == 2
+
+
+def test_answer_cache_miss_embeds_the_question_once(monkeypatch):
+    import asyncio
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from src.document_chat import retrieval
+    from utils.answer_cache import AnswerCache, answer_scope
+    from utils.hybrid_retriever import HybridRetriever
+
+    class CountingEmbeddings(DeterministicFakeEmbedding):
+        queries: list = []
+
+        def embed_query(self, text):
+            self.queries.append(text)
+            return super().embed_query(text)
+
+    class StubRegistry:
+        def get_llm(self):
+            return FakeListChatModel(responses=["ok"])
+
+    monkeypatch.setattr(retrieval, "get_model_registry", lambda: StubRegistry())
+    emb = CountingEmbeddings(size=16)
+    vs = FAISS.from_texts(["alpha facts", "beta facts", "gamma facts"], emb)
+
+    for retriever in (vs.as_retriever(search_kwargs={"k": 2}), HybridRetriever(shards=[(vs, None)], k=2,
+                                                                                lexical=False)):
+        monkeypatch.setattr(retrieval, "get_answer_cache", lambda: AnswerCache())
+        rag = retrieval.ConversationalRAG(session_id="s1", retriever=retriever)
+        rag.vectorstore = vs
+        rag._cache_scope, rag._index_version = answer_scope("idx", "index", "s1"), 1
+
+        emb.queries.clear()
+        assert rag.invoke("tell me about alpha") == "ok"
+        assert emb.queries == ["tell me about alpha"]
+        assert asyncio.run(rag.ainvoke("tell me about beta")) == "ok"
+        assert emb.queries == ["tell me about alpha", "tell me about beta"]
+        assert rag.invoke("tell me about alpha") == "ok"  # exact hit: no embedding at all
+        assert len(emb.queries) == 2
+
+
+    # A retriever that cannot search by vector still caches the answer with its sources.
+    monkeypatch.setattr(retrieval, "get_answer_cache", lambda: AnswerCache())
+    vs = FAISS.from_texts(["alpha facts"], emb, metadatas=[{"source": "/data/a.pdf", "page": 0}])
+    retriever = vs.as_retriever(search_type="similarity_score_threshold",
+                                search_kwargs={"k": 1, "score_threshold": -1e9})
+    rag = retrieval.ConversationalRAG(session_id="s1", retriever=retriever)
+    rag.vectorstore = vs
+    rag._cache_scope, rag._index_version = answer_scope("idx", "index", "s1"), 1
+    assert rag.invoke("tell me about alpha") == "ok"
+
+    async def streamed_hit():
+        return [e async for e in rag.astream("tell me about alpha")][-1]
+
+    done = asyncio.run(streamed_hit())
+    assert done["cached"] and done["sources"] == [{"source": "a.pdf", "page": 1}]
@@ -0,0 +1,125 @@
+from __future__ import annotations
+import math
+from typing import Any, Dict, Optional
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+from logger.custom_logger import CustomLogger
+from utils.config_loader import load_config_cached
+
+log = CustomLogger().get_logger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+
+def ann_settings() -> Dict[str, Any]:
+    """Index-type settings from the `faiss_db` block of config.yaml, with defaults."""
+    cfg = load_config_cached().get("faiss_db", {})
+    return {
+        "index_type": cfg.get("index_type", "auto"),
+        "auto_type": cfg.get("auto_index_type", "ivf_flat"),
+        "ann_threshold": int(cfg.get("ann_threshold", 50_000)),
+        "ivf": {"nlist": 0, "nprobe": 16, **(cfg.get("ivf") or {})},
+        "hnsw": {"m": 32, "ef_construction": 80, "ef_search": 64, **(cfg.get("hnsw") or {})},
+        "pq": {"m": 16, "nbits": 8, **(cfg.get("pq") or {})},
+    }
+
+
+def index_type_of(index: faiss.Index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def select_index_type(ntotal: int, settings: Optional[Dict[str, Any]] = None) -> str:
+    """Configured index type; "auto" stays flat (exact) below ann_threshold chunks."""
+    settings = settings or ann_settings()
+    kind = settings["index_type"]
+    if kind == "auto":
+        kind = settings["auto_type"] if ntotal >= settings["ann_threshold"] else "flat"
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown faiss_db index type: {kind}")
+    return kind
+
+
+def _pq_trainable(n: int, settings: Dict[str, Any]) -> bool:
+    return n >= 39 * (1 << int(settings["pq"]["nbits"]))
+
+
+def _nlist(n: int, configured: int) -> int:
+    # ~4*sqrt(n) lists, while keeping enough training points per centroid.
+    nlist = configured or int(4 * math.sqrt(n))
+    return max(1, min(nlist, n // 39 or 1))
+
+
+def _pq_m(dim: int, wanted: int) -> int:
+    """Largest sub-quantizer count <= wanted that divides dim."""
+    return next(m for m in range(min(wanted, dim), 0, -1) if dim % m == 0)
+
+
+def build_index(kind: str, vectors: np.ndarray, settings: Optional[Dict[str, Any]] = None) -> faiss.Index:
+    """Build (and train) an L2 index of the given type holding `vectors`."""
+    settings = settings or ann_settings()
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    if kind == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif kind == "hnsw":
+        hnsw = settings["hnsw"]
+        index = faiss.IndexHNSWFlat(dim, int(hnsw["m"]))
+        index.hnsw.efConstruction = int(hnsw["ef_construction"])
+    elif kind in ("ivf_flat", "ivf_pq"):
+        nlist = _nlist(n, int(settings["ivf"]["nlist"]))
+        quantizer = faiss.IndexFlatL2(dim)
+        if kind == "ivf_pq" and _pq_trainable(n, settings):
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_m(dim, int(settings["pq"]["m"])),
+                                     int(settings["pq"]["nbits"]))
+        else:
+            # Too few vectors to train the product quantizer; keep full vectors.
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        index.train(vectors)
+        # Keep id -> vector lookups working so later segments can be merged in.
+        index.set_direct_map_type(faiss.DirectMap.Array)
+    else:
+        raise ValueError(f"Unknown faiss_db index type: {kind}")
+    apply_search_params(index, settings)
+    index.add(vectors)
+    return index
+
+
+def apply_search_params(index: faiss.Index, settings: Optional[Dict[str, Any]] = None):
+    """Set query-time knobs (nprobe / efSearch) from config; no-op for flat indexes."""
+    settings = settings or ann_settings()
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = int(settings["hnsw"]["ef_search"])
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(int(settings["ivf"]["nprobe"]), index.nlist)
+
+
+def ensure_index_type(vs: FAISS, settings: Optional[Dict[str, Any]] = None) -> FAISS:
+    """Rebuild vs.index as the configured type if it differs (in place); ids are kept.
+
+    Called when a full index is written (compaction or full-mode save), so the flat
+    index of a growing session is upgraded once it crosses ann_threshold.
+    """
+    settings = settings or ann_settings()
+    current = index_type_of(vs.index)
+    wanted = select_index_type(vs.index.ntotal, settings)
+    if wanted == "ivf_pq" and not _pq_trainable(vs.index.ntotal, settings):
+        wanted = "ivf_flat"  # what build_index falls back to
+    if current == wanted or vs.index.ntotal == 0:
+        return vs
+    if current == "ivf_pq":
+        # Reconstructed PQ vectors are approximations; rebuilding from them compounds the error.
+        log.warning("Rebuilding from a product-quantized index", wanted=wanted)
+    vectors = vs.index.reconstruct_n(0, vs.index.ntotal)
+    vs.index = build_index(wanted, vectors, settings)
+    log.info("FAISS index type changed", previous=current, index_type=index_type_of(vs.index),
+             vectors=vs.index.ntotal)
+    return vs
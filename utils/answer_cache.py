@@ -0,0 +1,185 @@
+from __future__ import annotations
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from logger.custom_logger import CustomLogger
+from utils.config_loader import load_config_cached
+
+log = CustomLogger().get_logger(__name__)
+
+# (resolved index dir, index name, session id)
+Scope = Tuple[str, str, Optional[str]]
+
+_TRAILING = re.compile(r"[\s?!.]+$")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    return _TRAILING.sub("", _SPACES.sub(" ", question.strip().lower()))
+
+
+def answer_scope(index_dir, index_name: str, session_id: Optional[str]) -> Scope:
+    return str(Path(index_dir).resolve()), index_name, session_id
+
+
+class AnswerCache:
+    """
+    Process-wide cache of chat answers for standalone questions.
+
+    Entries belong to a scope (index dir, index name, session) and an index version;
+    a version mismatch counts as a miss. Lookups try the normalized question text
+    first, then the most similar cached question embedding above
+    `similarity_threshold`. Entries expire after `ttl_seconds` and the least recently
+    used are evicted above `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[Tuple[Scope, str], Dict[str, Any]]" = OrderedDict()
+        self._by_scope: Dict[Scope, Dict[str, None]] = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get_exact(self, scope: Scope, version: Any, question: str) -> Optional[Dict[str, Any]]:
+        """Cached {"answer", "sources"} for the same question text, or None (not counted as a miss)."""
+        key = (scope, normalize_question(question))
+        with self._lock:
+            entry = self._live(key, version)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry["value"]
+
+    def get_similar(self, scope: Scope, version: Any, vector: Sequence[float]) -> Optional[Dict[str, Any]]:
+        """Cached value of the closest question by cosine similarity, if above the threshold."""
+        query = _unit(vector)
+        with self._lock:
+            keys = [(scope, q) for q in list(self._by_scope.get(scope, ()))]
+            live = [(k, e) for k in keys
+                    if (e := self._live(k, version)) is not None and e["vector"] is not None]
+            if not live:
+                self.misses += 1
+                return None
+            sims = np.stack([e["vector"] for _, e in live]) @ query
+            best = int(np.argmax(sims))
+            if sims[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+            key, entry = live[best]
+            self._entries.move_to_end(key)
+            self.semantic_hits += 1
+            log.info("Answer cache semantic hit", similarity=round(float(sims[best]), 4))
+            return entry["value"]
+
+    def record_miss(self):
+        """Count a lookup that ended after get_exact (no embedding to compare)."""
+        with self._lock:
+            self.misses += 1
+
+    def put(self, scope: Scope, version: Any, question: str, vector: Optional[Sequence[float]],
+            value: Dict[str, Any]):
+        """Store value; entries without a vector are only found by exact question text."""
+        key = (scope, normalize_question(question))
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = {"version": version, "vector": None if vector is None else _unit(vector),
+                                  "value": value, "created": time.monotonic()}
+            self._by_scope.setdefault(scope, {})[key[1]] = None
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, index_dir) -> int:
+        """Drop every entry answered from index_dir (all index names and sessions)."""
+        resolved = str(Path(index_dir).resolve())
+        with self._lock:
+            keys = [k for k in self._entries if k[0][0] == resolved]
+            for k in keys:
+                self._drop(k)
+            self.invalidations += len(keys)
+        if keys:
+            log.info("Answer cache invalidated", index_dir=resolved, dropped=len(keys))
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_scope.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _live(self, key, version) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry["version"] != version:
+            self._drop(key)
+            return None
+        if time.monotonic() - entry["created"] > self.ttl_seconds:
+            self._drop(key)
+            self.expirations += 1
+            return None
+        return entry
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        questions = self._by_scope.get(key[0])
+        if questions is not None:
+            questions.pop(key[1], None)
+            if not questions:
+                del self._by_scope[key[0]]
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm else v
+
+
+_CACHE: Optional[AnswerCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Return the process-wide answer cache (`answer_cache` block of config.yaml), or None if disabled."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            cfg = load_config_cached().get("answer_cache", {})
+            if not cfg.get("enabled", True):
+                return None
+            _CACHE = AnswerCache(
+                max_entries=int(cfg.get("max_entries", 1024)),
+                ttl_seconds=float(cfg.get("ttl_seconds", 3600)),
+                similarity_threshold=float(cfg.get("similarity_threshold", 0.95)),
+            )
+        return _CACHE
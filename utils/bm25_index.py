@@ -0,0 +1,139 @@
+from __future__ import annotations
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from logger.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+# Keeps identifiers whole: "4.2.1", "sku-1234", "v2_final", "a/b".
+_TOKEN = re.compile(r"[a-z0-9]+(?:[._/-][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be but by do does for from has have how i in is it its of on or "
+    "that the their this to was were what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def is_identifier(token: str) -> bool:
+    """Clause numbers, SKUs, codes: tokens with digits or internal punctuation."""
+    return any(c.isdigit() for c in token) or any(c in "._/-" for c in token)
+
+
+class BM25Index:
+    """
+    In-memory BM25 (Okapi) inverted index over the chunks of one FAISS index.
+
+    Chunks are identified by their FAISS docstore ids, so hits resolve to the same
+    Documents the vector search returns. On disk the index is `bm25.jsonl` in the
+    index directory: one appended line per chunk with its term counts, written
+    before the matching FAISS segment is committed.
+    """
+
+    FILE = "bm25.jsonl"
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[str] = []
+        self.doc_len: List[int] = []
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._total_len = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    # ---------- Building ----------
+
+    def _add_counts(self, doc_id: str, tf: Dict[str, int]):
+        idx = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+        length = sum(tf.values())
+        self.doc_len.append(length)
+        self._total_len += length
+        for term, count in tf.items():
+            self.postings[term][idx] = count
+
+    def add(self, items: Iterable[Tuple[str, str]]):
+        """Index (doc_id, text) pairs."""
+        for doc_id, text in items:
+            self._add_counts(doc_id, Counter(tokenize(text)))
+
+    @classmethod
+    def from_documents(cls, items: Iterable[Tuple[str, str]]) -> "BM25Index":
+        index = cls()
+        index.add(items)
+        return index
+
+    @classmethod
+    def load(cls, index_dir) -> Optional["BM25Index"]:
+        """Read bm25.jsonl from index_dir, or None if the directory has none."""
+        path = Path(index_dir) / cls.FILE
+        if not path.exists():
+            return None
+        index = cls()
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    log.warning("Skipping unreadable BM25 line", index_dir=str(index_dir))
+                    continue
+                index._add_counts(entry["id"], entry["tf"])
+        return index
+
+    # ---------- Querying ----------
+
+    def df(self, term: str) -> int:
+        return len(self.postings.get(term, ()))
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Top-k (doc_id, score) for the query, best first."""
+        n = len(self.doc_ids)
+        if not n:
+            return []
+        avg_len = self._total_len / n or 1.0
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for idx, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[idx] / avg_len)
+                scores[idx] += idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+        return [(self.doc_ids[i], s) for i, s in best]
+
+
+def append_bm25(index_dir, items: Iterable[Tuple[str, str]]) -> int:
+    """Append (doc_id, text) pairs to index_dir/bm25.jsonl; returns the number written."""
+    lines = [json.dumps({"id": doc_id, "tf": Counter(tokenize(text))}, ensure_ascii=False) + "\n"
+             for doc_id, text in items]
+    if not lines:
+        return 0
+    path = Path(index_dir) / BM25Index.FILE
+    with _APPEND_LOCK:
+        prefix = ""
+        if path.exists() and path.stat().st_size:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    prefix = "\n"  # terminate a torn line from a crash
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(prefix + "".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+    return len(lines)
+
+
+_APPEND_LOCK = threading.Lock()
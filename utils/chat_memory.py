@@ -0,0 +1,187 @@
+from __future__ import annotations
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from logger.custom_logger import CustomLogger
+from utils.config_loader import load_config_cached
+from utils.token_count import CHARS_PER_TOKEN, estimate_tokens
+
+log = CustomLogger().get_logger(__name__)
+
+# (previous summary, messages to fold in) -> new summary
+Summarizer = Callable[[str, List[BaseMessage]], Awaitable[str]]
+
+
+class ChatMemory:
+    """
+    Server-side chat history keyed by session_id, stored in SQLite.
+
+    Prompts get a bounded window: a rolling summary of older turns followed by the
+    newest turns that fit in `max_tokens`. Once the unsummarized turns exceed the
+    budget, `acompact` folds the oldest of them into the summary with an LLM call,
+    leaving about half the budget as verbatim recent turns.
+    """
+
+    def __init__(self, db_path: str, max_tokens: int = 1500, summary_max_tokens: int = 300):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, role TEXT NOT NULL,"
+            " content TEXT NOT NULL, tokens INTEGER NOT NULL, created_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id);"
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            " session_id TEXT PRIMARY KEY, summary TEXT NOT NULL, upto_id INTEGER NOT NULL);"
+        )
+        self._conn.commit()
+        self.compactions = 0
+
+    # ---------- Reads ----------
+
+    def _summary(self, session_id: str) -> Tuple[str, int]:
+        row = self._conn.execute(
+            "SELECT summary, upto_id FROM summaries WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return (row[0], row[1]) if row else ("", 0)
+
+    def _unsummarized(self, session_id: str, upto_id: int) -> List[Tuple[int, str, str, int]]:
+        return self._conn.execute(
+            "SELECT id, role, content, tokens FROM messages WHERE session_id = ? AND id > ? ORDER BY id",
+            (session_id, upto_id),
+        ).fetchall()
+
+    def history(self, session_id: str) -> List[BaseMessage]:
+        """Summary (as a system message) plus the newest turns within the token budget."""
+        with self._lock:
+            summary, upto_id = self._summary(session_id)
+            rows = self._unsummarized(session_id, upto_id)
+
+        budget = self.max_tokens - estimate_tokens(summary)
+        window: List[BaseMessage] = []
+        for _, role, content, tokens in reversed(rows):
+            if tokens > budget:
+                break
+            budget -= tokens
+            window.append(_message(role, content))
+        window.reverse()
+        if summary:
+            window.insert(0, SystemMessage(f"Summary of the earlier conversation: {summary}"))
+        return window
+
+    def needs_compaction(self, session_id: str) -> bool:
+        with self._lock:
+            _, upto_id = self._summary(session_id)
+            rows = self._unsummarized(session_id, upto_id)
+        return sum(r[3] for r in rows) > self.max_tokens
+
+    # ---------- Writes ----------
+
+    def append(self, session_id: str, question: str, answer: str):
+        now = time.time()
+        rows = [
+            (session_id, "human", question, estimate_tokens(question), now),
+            (session_id, "ai", answer, estimate_tokens(answer), now),
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO messages (session_id, role, content, tokens, created_at) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    async def acompact(self, session_id: str, summarize: Summarizer) -> bool:
+        """Fold the oldest unsummarized turns into the rolling summary.
+
+        Returns False when the history is within budget or another compaction of the
+        same session committed first.
+        """
+        with self._lock:
+            summary, upto_id = self._summary(session_id)
+            rows = self._unsummarized(session_id, upto_id)
+
+        remaining = sum(r[3] for r in rows)
+        if remaining <= self.max_tokens:
+            return False
+        fold: List[Tuple[int, str, str, int]] = []
+        for row in rows:
+            if remaining <= self.max_tokens // 2:
+                break
+            fold.append(row)
+            remaining -= row[3]
+
+        try:
+            new_summary = (await summarize(summary, [_message(r[1], r[2]) for r in fold])).strip()
+        except Exception as e:
+            # The window stays bounded without the summary; retry on the next turn.
+            log.error("Chat history compaction failed", session_id=session_id, error=str(e))
+            return False
+        # Guard the budget even if the model ignores the requested length.
+        new_summary = new_summary[: self.summary_max_tokens * CHARS_PER_TOKEN]
+        new_upto = fold[-1][0]
+
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO summaries (session_id, summary, upto_id) VALUES (?, ?, ?)"
+                " ON CONFLICT(session_id) DO UPDATE SET summary = excluded.summary, upto_id = excluded.upto_id"
+                " WHERE summaries.upto_id = ?",
+                (session_id, new_summary, new_upto, upto_id),
+            )
+            self._conn.commit()
+            applied = cur.rowcount > 0
+            if applied:
+                self.compactions += 1
+        log.info("Chat history compacted", session_id=session_id, folded=len(fold),
+                 summary_tokens=estimate_tokens(new_summary), applied=applied)
+        return applied
+
+    def summary_max_words(self) -> int:
+        return max(1, self.summary_max_tokens * 3 // 4)
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM summaries WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions, messages = self._conn.execute(
+                "SELECT COUNT(DISTINCT session_id), COUNT(*) FROM messages"
+            ).fetchone()
+            return {"sessions": sessions, "messages": messages, "compactions": self.compactions}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _message(role: str, content: str) -> BaseMessage:
+    return HumanMessage(content) if role == "human" else AIMessage(content)
+
+
+_MEMORY: Optional[ChatMemory] = None
+_MEMORY_LOCK = threading.Lock()
+
+
+def get_chat_memory() -> ChatMemory:
+    """Return the process-wide chat memory (`chat_memory` block of config.yaml)."""
+    global _MEMORY
+    with _MEMORY_LOCK:
+        if _MEMORY is None:
+            cfg = load_config_cached().get("chat_memory", {})
+            _MEMORY = ChatMemory(
+                os.getenv("CHAT_MEMORY_PATH", cfg.get("db_path", os.path.join("cache", "chat_memory.sqlite"))),
+                max_tokens=int(cfg.get("max_history_tokens", 1500)),
+                summary_max_tokens=int(cfg.get("summary_max_tokens", 300)),
+            )
+        return _MEMORY
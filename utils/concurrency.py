@@ -0,0 +1,51 @@
+from __future__ import annotations
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+from utils.config_loader import load_config_cached
+
+T = TypeVar("T")
+
+_EXECUTORS: Dict[str, ThreadPoolExecutor] = {}
+_EXECUTORS_LOCK = threading.Lock()
+_DEFAULT_WORKERS = {"io": 8, "cpu": 4, "search": 4}
+
+
+def get_executor(kind: str) -> ThreadPoolExecutor:
+    """Bounded thread pool for "io" (disk), "cpu" (parsing, FAISS) or "search" (shard fan-out) work.
+
+    Sizes come from the `concurrency` block of config.yaml. Keeping these separate
+    from the event loop is what lets /health answer while a request is busy.
+    """
+    with _EXECUTORS_LOCK:
+        pool = _EXECUTORS.get(kind)
+        if pool is None:
+            cfg = load_config_cached().get("concurrency", {})
+            workers = int(cfg.get(f"{kind}_workers", _DEFAULT_WORKERS[kind]))
+            pool = _EXECUTORS[kind] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{kind}-worker")
+        return pool
+
+
+async def _run(kind: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(kind), functools.partial(fn, *args, **kwargs))
+
+
+async def run_io(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking disk-bound call on the IO pool and await its result."""
+    return await _run("io", fn, *args, **kwargs)
+
+
+async def run_cpu(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking CPU-bound call on the CPU pool and await its result."""
+    return await _run("cpu", fn, *args, **kwargs)
+
+
+def shutdown_executors(wait: bool = False):
+    with _EXECUTORS_LOCK:
+        for pool in _EXECUTORS.values():
+            pool.shutdown(wait=wait)
+        _EXECUTORS.clear()
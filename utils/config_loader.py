@@ -1,15 +1,15 @@
 import yaml
 import os
+import threading
 from pathlib import Path
 
 def _project_root() -> Path:
     return Path(__file__).resolve().parents[1]
 
-def load_config(config_path: str | None = None) -> dict:
-    """
-    Resolve config path reliably irrespective of CWD.
-    Priority: explicit arg > CONFIG_PATH env > <project_root>/config/config.yaml
-    """
+_CONFIG_CACHE: dict = {}
+_CONFIG_LOCK = threading.Lock()
+
+def _resolve_config_path(config_path: str | None = None) -> Path:
     env_path = os.getenv("CONFIG_PATH")
     if config_path is None:
         config_path = env_path or str(_project_root() / "config" / "config.yaml")
@@ -20,10 +20,32 @@ def load_config(config_path: str | None = None) -> dict:
 
     if not path.exists():
         raise FileNotFoundError(f"Config file not found: {path}")
+    return path
 
+def load_config(config_path: str | None = None) -> dict:
+    """
+    Resolve config path reliably irrespective of CWD.
+    Priority: explicit arg > CONFIG_PATH env > <project_root>/config/config.yaml
+    """
+    path = _resolve_config_path(config_path)
     with open(path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f) or {}
 
+def load_config_cached(config_path: str | None = None) -> dict:
+    """
+    Same as load_config(), but parses the file only when its mtime changes.
+    Callers must treat the returned dict as read-only.
+    """
+    path = _resolve_config_path(config_path)
+    mtime = path.stat().st_mtime_ns
+    with _CONFIG_LOCK:
+        cached = _CONFIG_CACHE.get(str(path))
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        config = load_config(str(path))
+        _CONFIG_CACHE[str(path)] = (mtime, config)
+        return config
+
 
 if __name__ == "__main__":
     load_config()
\ No newline at end of file
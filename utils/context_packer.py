@@ -0,0 +1,138 @@
+from __future__ import annotations
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.documents import Document
+
+from utils.config_loader import load_config_cached
+from utils.token_count import CHARS_PER_TOKEN, estimate_tokens
+
+_WORD = re.compile(r"\w+")
+_SHINGLE = 5
+
+
+@dataclass
+class _Span:
+    key: tuple
+    start: Optional[int]
+    text: str
+    rank: int
+
+    @property
+    def end(self) -> Optional[int]:
+        return None if self.start is None else self.start + len(self.text)
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens: int
+    tokens_saved: int
+    chunks: int
+    spans: int
+
+    def report(self) -> Dict[str, int]:
+        return {"tokens": self.tokens, "tokens_saved": self.tokens_saved,
+                "chunks": self.chunks, "spans": self.spans}
+
+
+def _shingles(text: str) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) <= _SHINGLE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + _SHINGLE]) for i in range(len(words) - _SHINGLE + 1)}
+
+
+def _merge_overlapping(docs: Sequence[Document]) -> List[_Span]:
+    """Join chunks of the same source/page whose character ranges overlap or touch."""
+    groups: Dict[tuple, List[_Span]] = {}
+    loose: List[_Span] = []
+    for rank, d in enumerate(docs):
+        md = d.metadata or {}
+        key = (md.get("source") or md.get("file_path"), md.get("page"))
+        start = md.get("start_index")
+        span = _Span(key, start if isinstance(start, int) and start >= 0 else None, d.page_content, rank)
+        (loose if span.start is None or key[0] is None else groups.setdefault(key, [])).append(span)
+
+    merged: List[_Span] = []
+    for spans in groups.values():
+        spans.sort(key=lambda s: s.start)  # type: ignore[arg-type,return-value]
+        cur = spans[0]
+        for nxt in spans[1:]:
+            if nxt.start <= cur.end:  # type: ignore[operator]
+                tail = nxt.text[cur.end - nxt.start:]  # type: ignore[operator]
+                cur = _Span(cur.key, cur.start, cur.text + tail, min(cur.rank, nxt.rank))
+            else:
+                merged.append(cur)
+                cur = nxt
+        merged.append(cur)
+    return merged + loose
+
+
+def pack_context(docs: Sequence[Document], max_tokens: int, near_duplicate: float = 0.9,
+                 separator: str = "\n\n") -> PackedContext:
+    """Build the prompt context from retrieved chunks (best first).
+
+    Overlapping/adjacent chunks of one page are merged into a single span, spans that
+    repeat an already chosen span (shingle overlap >= near_duplicate) are dropped,
+    and the rest are added in relevance order until max_tokens is reached.
+    """
+    naive_tokens = estimate_tokens(separator.join(d.page_content for d in docs))
+    chosen: List[str] = []
+    seen: List[set] = []
+    used = 0
+    for span in sorted(_merge_overlapping(docs), key=lambda s: s.rank):
+        shingles = _shingles(span.text)
+        if any(len(shingles & prev) >= near_duplicate * len(shingles) for prev in seen):
+            continue
+        cost = estimate_tokens(span.text) + (estimate_tokens(separator) if chosen else 0)
+        text, truncated = span.text, False
+        if used + cost > max_tokens:
+            room = (max_tokens - used) * CHARS_PER_TOKEN
+            if room < 200:  # not worth a fragment
+                break
+            text, truncated = text[:room].rsplit(" ", 1)[0], True
+            cost = estimate_tokens(text) + (estimate_tokens(separator) if chosen else 0)
+        chosen.append(text)
+        seen.append(shingles)
+        used += cost
+        if truncated:
+            break
+
+    packed = separator.join(chosen)
+    tokens = estimate_tokens(packed)
+    PACKING_METRICS.record(max(naive_tokens - tokens, 0))
+    return PackedContext(packed, tokens, max(naive_tokens - tokens, 0), len(docs), len(chosen))
+
+
+def context_budget() -> Dict[str, Any]:
+    cfg = load_config_cached().get("context_packer", {})
+    return {"max_tokens": int(cfg.get("max_tokens", 3000)),
+            "near_duplicate": float(cfg.get("near_duplicate_threshold", 0.9))}
+
+
+class PackingMetrics:
+    """Process-wide totals of context tokens saved by pack_context()."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.tokens_saved = 0
+
+    def record(self, saved: int):
+        with self._lock:
+            self.queries += 1
+            self.tokens_saved += saved
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queries": self.queries,
+                "tokens_saved": self.tokens_saved,
+                "avg_tokens_saved": round(self.tokens_saved / self.queries, 1) if self.queries else 0.0,
+            }
+
+
+PACKING_METRICS = PackingMetrics()
@@ -0,0 +1,87 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import fitz  # PyMuPDF
+import docx2txt
+from langchain.schema import Document
+
+from logger.custom_logger import CustomLogger
+from utils.pdf_extract import EXTRACTOR_VERSION, extract_pages, extraction_settings
+from utils.file_io import file_sha256
+from utils.text_cache import get_text_cache
+
+log = CustomLogger().get_logger(__name__)
+
+SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
+
+
+def _page_docs(source: str, pages: List[str]) -> Iterator[Document]:
+    for i, text in enumerate(pages):
+        yield Document(page_content=text, metadata={"source": source, "page": i, "total_pages": len(pages)})
+
+
+def iter_pdf_pages(path, reject_encrypted: bool = False,
+                   content_hash: Optional[str] = None, use_cache: bool = True) -> Iterator[Document]:
+    """Yield one Document per PDF page with `source`/`page` (0-based) metadata.
+
+    Page text is served from the extracted-text cache when this file's content was
+    extracted before. Otherwise small PDFs are read lazily page by page, and PDFs
+    large enough for the process pool are extracted in parallel first; either way
+    the pages are cached once fully read.
+    """
+    source = str(path)
+    cache = get_text_cache() if use_cache else None
+    content_hash = content_hash or (file_sha256(source) if cache else None)
+    cached = cache.get(content_hash, EXTRACTOR_VERSION) if cache else None  # type: ignore[arg-type]
+    if cached is not None:
+        if reject_encrypted and cached["encrypted"]:
+            raise ValueError(f"PDF is encrypted: {Path(source).name}")
+        yield from _page_docs(source, cached["pages"])
+        return
+
+    _, min_pages_parallel = extraction_settings()
+    with fitz.open(source) as doc:
+        encrypted = bool(doc.is_encrypted)
+        if reject_encrypted and encrypted:
+            raise ValueError(f"PDF is encrypted: {Path(source).name}")
+        total = doc.page_count
+        if total < min_pages_parallel:
+            pages: List[str] = []
+            for i in range(total):
+                pages.append(doc.load_page(i).get_text())  # type: ignore
+                yield Document(page_content=pages[-1],
+                               metadata={"source": source, "page": i, "total_pages": total})
+            if cache:
+                cache.put(content_hash, EXTRACTOR_VERSION, pages, encrypted)  # type: ignore[arg-type]
+            return
+
+    pages = extract_pages(source)
+    if cache:
+        cache.put(content_hash, EXTRACTOR_VERSION, pages, encrypted)  # type: ignore[arg-type]
+    yield from _page_docs(source, pages)
+
+
+def iter_documents(path, content_hash: Optional[str] = None) -> Iterator[Document]:
+    """Yield Documents for a single .pdf (per page), .docx or .txt file."""
+    p = Path(path)
+    ext = p.suffix.lower()
+    if ext == ".pdf":
+        yield from iter_pdf_pages(p, content_hash=content_hash)
+    elif ext == ".docx":
+        yield Document(page_content=docx2txt.process(str(p)), metadata={"source": str(p)})
+    elif ext == ".txt":
+        yield Document(page_content=p.read_text(encoding="utf-8"), metadata={"source": str(p)})
+    else:
+        log.warning("Unsupported extension skipped", path=str(p))
+
+
+def lazy_load_documents(paths: Iterable[Path],
+                        content_hashes: Optional[Dict[str, str]] = None) -> Iterator[Document]:
+    """Yield Documents for every supported file in paths, one page at a time for PDFs.
+
+    content_hashes maps str(path) to a sha256 already computed at upload time.
+    """
+    content_hashes = content_hashes or {}
+    for p in paths:
+        yield from iter_documents(p, content_hash=content_hashes.get(str(p)))
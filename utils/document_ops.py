@@ -12,12 +12,12 @@ from typing import Iterable, List, Optional, Dict, Any
 import fitz  # PyMuPDF
 from langchain.schema import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
 from langchain_community.vectorstores import FAISS
 
 from utils.model_loader import ModelLoader
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
+from utils.document_loader import lazy_load_documents
 from fastapi import UploadFile
 
 
@@ -25,22 +25,10 @@ log = CustomLogger().get_logger(__name__)
 
 SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
 
-def load_documents(paths: Iterable[Path]) -> List[Document]:
-    """Load docs using appropriate loader based on extension."""
-    docs: List[Document] = []
+def load_documents(paths: Iterable[Path], content_hashes: Optional[Dict[str, str]] = None) -> List[Document]:
+    """Load docs (PDFs page by page via PyMuPDF) based on extension."""
     try:
-        for p in paths:
-            ext = p.suffix.lower()
-            if ext == ".pdf":
-                loader = PyPDFLoader(str(p))
-            elif ext == ".docx":
-                loader = Docx2txtLoader(str(p))
-            elif ext == ".txt":
-                loader = TextLoader(str(p), encoding="utf-8")
-            else:
-                log.warning("Unsupported extension skipped", path=str(p))
-                continue
-            docs.extend(loader.load())
+        docs = list(lazy_load_documents(paths, content_hashes))
         log.info("Documents loaded", count=len(docs))
         return docs
     except Exception as e:
@@ -60,10 +48,18 @@ def concat_for_comparison(ref_docs: List[Document], act_docs: List[Document]) ->
     return f"<<REFERENCE_DOCUMENTS>>\n{left}\n\n<<ACTUAL_DOCUMENTS>>\n{right}"
 
 class FastAPIFileAdapter:
-    """Adapt FastAPI UploadFile -> .name + .getbuffer() API"""
+    """Adapt FastAPI UploadFile -> .name + .read()/.getbuffer() API"""
     def __init__(self, uf: UploadFile):
         self._uf = uf
         self.name = uf.filename
+        self.size = uf.size
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to size bytes from the spooled upload (all remaining if -1)."""
+        return self._uf.file.read(size)
+
+    def seek(self, offset: int) -> int:
+        return self._uf.file.seek(offset)
 
     def getbuffer(self) -> bytes:
         """Get File Buffer
@@ -0,0 +1,149 @@
+from __future__ import annotations
+import os
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from logger.custom_logger import CustomLogger
+from utils.concurrency import run_io
+
+log = CustomLogger().get_logger(__name__)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk (SQLite) store of embedding vectors keyed by sha256(text) and model name.
+    Vectors are stored as float32 blobs, which is what FAISS keeps in memory anyway.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " text_hash TEXT NOT NULL, model TEXT NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (text_hash, model))"
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, hashes: List[str], model: str) -> Dict[str, List[float]]:
+        """Return the cached vectors for the given text hashes (missing ones are omitted)."""
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # Stay below SQLite's bound-parameter limit.
+            for i in range(0, len(unique), 500):
+                batch = unique[i:i + 500]
+                marks = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({marks})",
+                    [model, *batch],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+            hit = sum(1 for h in hashes if h in found)
+            self.hits += hit
+            self.misses += len(hashes) - hit
+        return found
+
+    def put_many(self, items: Dict[str, List[float]], model: str):
+        if not items:
+            return
+        rows = [(h, model, np.asarray(v, dtype=np.float32).tobytes()) for h, v in items.items()]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (text_hash, model, vector) VALUES (?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that consults an EmbeddingCache before calling the provider.
+    Only document embeddings are cached; query embeddings pass straight through.
+    """
+
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache, model_name: Optional[str] = None):
+        self.underlying = underlying
+        self.cache = cache
+        self.model_name = model_name or getattr(underlying, "model", None) or type(underlying).__name__
+
+    @staticmethod
+    def _missing(hashes: List[str], texts: List[str], found: Dict[str, List[float]]) -> Dict[str, str]:
+        missing: Dict[str, str] = {}
+        for h, t in zip(hashes, texts):
+            if h not in found and h not in missing:
+                missing[h] = t
+        return missing
+
+    def _resolved(self, hashes: List[str], found: Dict[str, List[float]], embedded: int) -> List[List[float]]:
+        log.info("Embeddings resolved", total=len(hashes), cached=len(hashes) - embedded,
+                 embedded=embedded, model=self.model_name)
+        return [found[h] for h in hashes]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(t) for t in texts]
+        found = self.cache.get_many(hashes, self.model_name)
+
+        missing = self._missing(hashes, texts, found)
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(fresh, self.model_name)
+            found.update(fresh)
+        return self._resolved(hashes, found, len(missing))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(t) for t in texts]
+        found = await run_io(self.cache.get_many, hashes, self.model_name)
+
+        missing = self._missing(hashes, texts, found)
+        if missing:
+            vectors = await self.underlying.aembed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            await run_io(self.cache.put_many, fresh, self.model_name)
+            found.update(fresh)
+        return self._resolved(hashes, found, len(missing))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+
+_CACHE: Optional[EmbeddingCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Return the process-wide embedding cache (path from EMBEDDING_CACHE_PATH)."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = EmbeddingCache(os.getenv("EMBEDDING_CACHE_PATH", os.path.join("cache", "embeddings.sqlite")))
+        return _CACHE
@@ -0,0 +1,194 @@
+from __future__ import annotations
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from logger.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+RETRYABLE_MARKERS = ("429", "rate limit", "quota", "resourceexhausted", "resource_exhausted",
+                     "503", "unavailable", "deadline", "timeout", "timed out")
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    if status in (429, 500, 502, 503, 504):
+        return True
+    text = f"{type(exc).__name__} {exc}".lower()
+    return any(marker in text for marker in RETRYABLE_MARKERS)
+
+
+class RateLimiter:
+    """Spaces request starts to at most requests_per_minute, across threads and event loops."""
+
+    def __init__(self, requests_per_minute: Optional[float]):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+_LIMITERS: Dict[str, RateLimiter] = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def _limiter_for(provider: str, requests_per_minute: Optional[float]) -> RateLimiter:
+    """Rate limits are per provider, shared by every scheduler in the process."""
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(provider)
+        if limiter is None or limiter.interval != (60.0 / requests_per_minute if requests_per_minute else 0.0):
+            limiter = _LIMITERS[provider] = RateLimiter(requests_per_minute)
+        return limiter
+
+
+class EmbeddingMetrics:
+    """Process-wide counters for scheduled embedding batches."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+        self.retries = 0
+        self.failures = 0
+        self.batch_seconds = 0.0
+
+    def record(self, texts: int, seconds: float, retries: int):
+        with self._lock:
+            self.batches += 1
+            self.texts += texts
+            self.retries += retries
+            self.batch_seconds += seconds
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "texts": self.texts,
+                "retries": self.retries,
+                "failures": self.failures,
+                "avg_batch_latency_ms": round(1000 * self.batch_seconds / self.batches, 1) if self.batches else 0.0,
+            }
+
+
+EMBEDDING_METRICS = EmbeddingMetrics()
+
+
+class EmbeddingScheduler(Embeddings):
+    """
+    Embeddings wrapper that splits documents into batches and embeds them with
+    bounded concurrency, a per-provider rate limit and exponential backoff on
+    rate-limit/transient errors. Results are returned in input order.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        provider: str = "google",
+        batch_size: int = 64,
+        max_concurrency: int = 4,
+        max_retries: int = 5,
+        backoff_base_seconds: float = 1.0,
+        backoff_max_seconds: float = 30.0,
+        requests_per_minute: Optional[float] = None,
+    ):
+        self.underlying = underlying
+        self.model = getattr(underlying, "model", None)
+        self.provider = provider
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base_seconds
+        self.backoff_max = backoff_max_seconds
+        self.limiter = _limiter_for(provider, requests_per_minute)
+
+    @classmethod
+    def from_config(cls, underlying: Embeddings, config: dict) -> "EmbeddingScheduler":
+        """Build from the `embedding_scheduler` and `embedding_model` blocks of config.yaml."""
+        cfg = config.get("embedding_scheduler", {})
+        provider = config.get("embedding_model", {}).get("provider", "google")
+        return cls(
+            underlying,
+            provider=provider,
+            batch_size=int(cfg.get("batch_size", 64)),
+            max_concurrency=int(cfg.get("max_concurrency", 4)),
+            max_retries=int(cfg.get("max_retries", 5)),
+            backoff_base_seconds=float(cfg.get("backoff_base_seconds", 1.0)),
+            backoff_max_seconds=float(cfg.get("backoff_max_seconds", 30.0)),
+            requests_per_minute=(cfg.get("requests_per_minute") or {}).get(provider),
+        )
+
+    async def _embed_batch(self, index: int, batch: List[str], sem: asyncio.Semaphore) -> List[List[float]]:
+        async with sem:
+            attempt = 0
+            while True:
+                await self.limiter.acquire()
+                start = time.perf_counter()
+                try:
+                    vectors = await asyncio.to_thread(self.underlying.embed_documents, batch)
+                except Exception as e:
+                    if attempt >= self.max_retries or not _is_retryable(e):
+                        EMBEDDING_METRICS.record_failure()
+                        log.error("Embedding batch failed", batch=index, size=len(batch),
+                                  attempts=attempt + 1, error=str(e))
+                        raise
+                    delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                    delay *= random.uniform(0.5, 1.0)  # jitter so retries do not align
+                    attempt += 1
+                    log.warning("Embedding batch throttled, retrying", batch=index, attempt=attempt,
+                                delay_s=round(delay, 2), error=str(e))
+                    await asyncio.sleep(delay)
+                    continue
+                elapsed = time.perf_counter() - start
+                EMBEDDING_METRICS.record(len(batch), elapsed, attempt)
+                log.info("Embedding batch done", batch=index, size=len(batch),
+                         latency_ms=round(elapsed * 1000, 1),
+                         texts_per_s=round(len(batch) / elapsed, 1) if elapsed else None,
+                         retries=attempt)
+                return vectors
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        sem = asyncio.Semaphore(self.max_concurrency)
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        start = time.perf_counter()
+        results = await asyncio.gather(*(self._embed_batch(i, b, sem) for i, b in enumerate(batches)))
+        elapsed = time.perf_counter() - start
+        log.info("Embedding run done", texts=len(texts), batches=len(batches),
+                 latency_ms=round(elapsed * 1000, 1),
+                 texts_per_s=round(len(texts) / elapsed, 1) if elapsed else None)
+        return [vec for batch in results for vec in batch]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.aembed_documents(texts))
+        # Called from inside an event loop: run the scheduler on its own loop in a worker.
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(asyncio.run, self.aembed_documents(texts)).result()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.underlying.aembed_query(text)
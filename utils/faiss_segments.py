@@ -0,0 +1,267 @@
+from __future__ import annotations
+import os
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_community.vectorstores import FAISS
+
+from logger.custom_logger import CustomLogger
+from utils.vectorstore_cache import VECTORSTORE_CACHE
+from utils.ann_index import apply_search_params, ensure_index_type
+
+log = CustomLogger().get_logger(__name__)
+
+_DIR_LOCKS: Dict[tuple, threading.RLock] = {}
+_DIR_LOCKS_GUARD = threading.Lock()
+
+
+def dir_lock(index_dir: Path, purpose: str) -> threading.RLock:
+    """Process-wide lock per (index directory, purpose), shared by all store instances."""
+    key = (str(index_dir.resolve()), purpose)
+    with _DIR_LOCKS_GUARD:
+        return _DIR_LOCKS.setdefault(key, threading.RLock())
+
+
+def atomic_write_text(path: Path, text: str):
+    tmp = path.with_name(f".tmp_{path.name}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def merge_into(target: FAISS, source: FAISS) -> FAISS:
+    """Append every vector and docstore entry of source to target (in place).
+
+    Unlike FAISS.merge_from this re-adds raw vectors, so the target index may be
+    of a different (e.g. trained) type than the flat source segment.
+    """
+    n = source.index.ntotal
+    if n == 0:
+        return target
+    start = target.index.ntotal
+    target.index.add(source.index.reconstruct_n(0, n))
+    for i in range(n):
+        doc_id = source.index_to_docstore_id[i]
+        target.docstore.add({doc_id: source.docstore.search(doc_id)})  # type: ignore[attr-defined]
+        target.index_to_docstore_id[start + i] = doc_id
+    return target
+
+
+def docstore_items(vs: FAISS) -> List[Tuple[str, str]]:
+    """(docstore id, text) of every chunk in vs, in index order."""
+    ids = [vs.index_to_docstore_id[i] for i in range(vs.index.ntotal)]
+    return [(doc_id, vs.docstore.search(doc_id).page_content) for doc_id in ids]  # type: ignore[attr-defined]
+
+
+class SegmentedFaissStore:
+    """
+    Incremental on-disk layout for one FAISS index directory.
+
+    <index_dir>/
+        <base>.faiss, <base>.pkl   compacted base index (name recorded in manifest.json)
+        manifest.json              {"base": ..., "folded_through": seq}; the commit point of compaction
+        segments/seg_<seq>.*       small append-only delta indexes
+        journal.jsonl              one line per committed segment with its fingerprints
+        ingested_meta.json         fingerprints folded into the base
+
+    A segment only becomes visible once its journal line is written, and a new base
+    only once manifest.json is atomically replaced, so a crash at any point leaves
+    the previous consistent state readable. Directories written by plain
+    FAISS.save_local() (no manifest) load as a base named index_name.
+    """
+
+    MANIFEST = "manifest.json"
+    JOURNAL = "journal.jsonl"
+    META = "ingested_meta.json"
+    SEGMENT_DIR = "segments"
+
+    def __init__(self, index_dir, index_name: str = "index", compact_after: int = 8):
+        self.index_dir = Path(index_dir)
+        self.index_name = index_name
+        self.compact_after = compact_after
+        self.segment_dir = self.index_dir / self.SEGMENT_DIR
+        self._lock = dir_lock(self.index_dir, "io")
+        self._compacting = dir_lock(self.index_dir, "compaction")
+
+    # ---------- Reading ----------
+
+    def _manifest(self) -> Dict[str, Any]:
+        path = self.index_dir / self.MANIFEST
+        if path.exists():
+            return json.loads(path.read_text(encoding="utf-8"))
+        legacy = (self.index_dir / f"{self.index_name}.faiss").exists()
+        return {"base": self.index_name if legacy else None, "folded_through": 0}
+
+    def _journal(self) -> List[Dict[str, Any]]:
+        path = self.index_dir / self.JOURNAL
+        if not path.exists():
+            return []
+        entries = []
+        for line in path.read_text(encoding="utf-8").splitlines():
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Torn trailing write from a crash; its segment was never committed.
+                log.warning("Skipping unreadable journal line", index_dir=str(self.index_dir))
+        return entries
+
+    def _pending(self, manifest: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return [e for e in self._journal() if e["seq"] > manifest["folded_through"]]
+
+    def exists(self) -> bool:
+        with self._lock:
+            manifest = self._manifest()
+            return manifest["base"] is not None or bool(self._pending(manifest))
+
+    def pending_segments(self) -> int:
+        with self._lock:
+            return len(self._pending(self._manifest()))
+
+    def rows(self) -> Dict[str, bool]:
+        """All ingested chunk fingerprints: the base meta plus every journaled segment."""
+        with self._lock:
+            rows: Dict[str, bool] = {}
+            meta = self.index_dir / self.META
+            if meta.exists():
+                try:
+                    rows.update((json.loads(meta.read_text(encoding="utf-8")) or {}).get("rows", {}))
+                except Exception:
+                    log.warning("Unreadable ingestion meta ignored", path=str(meta))
+            for e in self._journal():
+                rows.update(dict.fromkeys(e.get("rows", []), True))
+            return rows
+
+    def load(self, embeddings) -> Optional[FAISS]:
+        """Load the base index and merge every committed segment on top of it."""
+        for attempt in range(2):
+            with self._lock:
+                manifest = self._manifest()
+                entries = self._pending(manifest)
+            try:
+                return self._materialize(manifest["base"], entries, embeddings)
+            except (FileNotFoundError, RuntimeError):
+                # A concurrent compaction replaced the files we resolved; re-read once.
+                if attempt:
+                    raise
+        return None
+
+    def _materialize(self, base: Optional[str], entries: List[Dict[str, Any]], embeddings) -> Optional[FAISS]:
+        vs = None
+        if base is not None:
+            vs = FAISS.load_local(str(self.index_dir), embeddings, index_name=base,
+                                  allow_dangerous_deserialization=True)
+            apply_search_params(vs.index)
+        for e in entries:
+            seg = FAISS.load_local(str(self.segment_dir), embeddings, index_name=e["segment"],
+                                   allow_dangerous_deserialization=True)
+            vs = seg if vs is None else merge_into(vs, seg)
+        return vs
+
+    # ---------- Writing ----------
+
+    def _save_atomic(self, vs: FAISS, folder: Path, name: str):
+        folder.mkdir(parents=True, exist_ok=True)
+        tmp = f".tmp_{name}"
+        vs.save_local(str(folder), index_name=tmp)
+        for ext in (".faiss", ".pkl"):
+            with open(folder / f"{tmp}{ext}", "rb") as f:
+                os.fsync(f.fileno())
+            os.replace(folder / f"{tmp}{ext}", folder / f"{name}{ext}")
+
+    def append(self, segment: FAISS, rows: List[str]) -> int:
+        """Persist segment as a new delta and commit it to the journal.
+
+        Args:
+            segment (FAISS): Vectorstore holding only the new chunks.
+            rows (List[str]): Fingerprints of those chunks.
+
+        Returns:
+            int: Sequence number of the committed segment.
+        """
+        with self._lock:
+            manifest = self._manifest()
+            journal = self._journal()
+            seq = max([manifest["folded_through"]] + [e["seq"] for e in journal]) + 1
+            name = f"seg_{seq:06d}"
+            self._save_atomic(segment, self.segment_dir, name)
+
+            line = json.dumps({"seq": seq, "segment": name, "count": segment.index.ntotal, "rows": rows},
+                              ensure_ascii=False)
+            journal_path = self.index_dir / self.JOURNAL
+            if journal_path.exists() and journal_path.stat().st_size:
+                with open(journal_path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        # Terminate a torn line so this entry starts on its own line.
+                        line = "\n" + line
+            with open(journal_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        VECTORSTORE_CACHE.invalidate(self.index_dir)
+        log.info("Delta segment committed", index_dir=str(self.index_dir), segment=name,
+                 chunks=segment.index.ntotal)
+        return seq
+
+    def compact(self, embeddings) -> bool:
+        """Fold all committed segments into a new base index.
+
+        Appends may continue while the new base is being built; only segments that
+        were committed when compaction started are folded.
+
+        Returns:
+            bool: False if nothing was pending or another compaction is running.
+        """
+        if not self._compacting.acquire(blocking=False):
+            return False
+        try:
+            with self._lock:
+                manifest = self._manifest()
+                entries = self._pending(manifest)
+            if not entries:
+                return False
+
+            upto = entries[-1]["seq"]
+            new_base = f"base_{upto:06d}"
+            vs = self._materialize(manifest["base"], entries, embeddings)
+            # The base is where the index type applies (segments stay small and flat).
+            vs = ensure_index_type(vs)  # type: ignore[arg-type]
+            self._save_atomic(vs, self.index_dir, new_base)
+
+            with self._lock:
+                # Meta may briefly over-report rows still in the journal; rows are a set.
+                rows = self.rows()
+                atomic_write_text(self.index_dir / self.META, json.dumps({"rows": rows}, ensure_ascii=False))
+                atomic_write_text(self.index_dir / self.MANIFEST,
+                                   json.dumps({"base": new_base, "folded_through": upto}))
+                remaining = [e for e in self._journal() if e["seq"] > upto]
+                atomic_write_text(self.index_dir / self.JOURNAL,
+                                   "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in remaining))
+
+            self._cleanup(manifest["base"], new_base, entries)
+            VECTORSTORE_CACHE.invalidate(self.index_dir)
+            log.info("Segments compacted", index_dir=str(self.index_dir), base=new_base, folded=len(entries))
+            return True
+        finally:
+            self._compacting.release()
+
+    def compact_in_background(self, embeddings):
+        """Run compact() on a daemon thread, logging instead of raising on failure."""
+        def _run():
+            try:
+                self.compact(embeddings)
+            except Exception as e:
+                log.error("Background compaction failed", index_dir=str(self.index_dir), error=str(e))
+
+        threading.Thread(target=_run, name=f"faiss-compact-{self.index_dir.name}", daemon=True).start()
+
+    def _cleanup(self, old_base: Optional[str], new_base: str, folded: List[Dict[str, Any]]):
+        for ext in (".faiss", ".pkl"):
+            if old_base and old_base != new_base:
+                (self.index_dir / f"{old_base}{ext}").unlink(missing_ok=True)
+            for e in folded:
+                (self.segment_dir / f"{e['segment']}{ext}").unlink(missing_ok=True)
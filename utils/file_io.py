@@ -7,8 +7,9 @@ import hashlib
 import shutil
 from pathlib import Path
 from datetime import datetime, timezone
-from typing import Iterable, List, Optional, Dict, Any
+from typing import Iterable, List, Optional, Dict, Any, NamedTuple
 from utils.model_loader import ModelLoader
+from utils.config_loader import load_config_cached
 from logger.custom_logger import CustomLogger
 from exception.custom_exception import DocumentPortalException
 log = CustomLogger().get_logger(__name__)
@@ -20,11 +21,118 @@ SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
 def _session_id(prefix: str = "session") -> str:
     return f"{prefix}_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
 
-def save_uploaded_files(uploaded_files: Iterable, target_dir: Path) -> List[Path]:
-    """Save uploaded files (Streamlit-like) and return local paths."""
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the configured maximum size."""
+
+
+class SavedUpload(NamedTuple):
+    path: Path
+    sha256: str
+    size: int
+
+
+def file_sha256(path, block_size: int = 1024 * 1024) -> str:
+    """sha256 hex digest of a file on disk, read in fixed-size blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _upload_limits() -> tuple:
+    cfg = load_config_cached().get("uploads", {})
+    max_bytes = int(float(cfg.get("max_file_size_mb", 100)) * 1024 * 1024)
+    block_size = int(cfg.get("block_size_kb", 1024)) * 1024
+    return max_bytes, block_size
+
+
+def _iter_blocks(uploaded_file, block_size: int):
+    if hasattr(uploaded_file, "read"):
+        if hasattr(uploaded_file, "seek"):
+            uploaded_file.seek(0)
+        while True:
+            block = uploaded_file.read(block_size)
+            if not block:
+                return
+            yield block
+    else:
+        buf = memoryview(uploaded_file.getbuffer())  # fallback
+        for i in range(0, len(buf), block_size):
+            yield buf[i:i + block_size]
+
+
+def upload_sha256(uploaded_file, max_bytes: Optional[int] = None) -> str:
+    """sha256 hex digest of an upload without saving it; the upload is rewound afterwards.
+
+    Raises:
+        UploadTooLargeError: The upload is larger than max_bytes.
+    """
+    default_max, block_size = _upload_limits()
+    max_bytes = default_max if max_bytes is None else max_bytes
+    digest = hashlib.sha256()
+    size = 0
+    for block in _iter_blocks(uploaded_file, block_size):
+        size += len(block)
+        if size > max_bytes:
+            raise UploadTooLargeError(f"File exceeds the {max_bytes} byte upload limit")
+        digest.update(block)
+    if hasattr(uploaded_file, "seek"):
+        uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def stream_upload(uploaded_file, out: Path, max_bytes: Optional[int] = None,
+                  block_size: Optional[int] = None) -> SavedUpload:
+    """Copy an upload to disk block by block, hashing it in the same pass.
+
+    The file is written to a temporary name and renamed into place only once it is
+    complete, so a rejected or failed upload never leaves a partial file behind.
+
+    Args:
+        uploaded_file: Object with read() (preferred) or getbuffer().
+        out (Path): Destination path.
+        max_bytes (Optional[int]): Size limit; defaults to uploads.max_file_size_mb.
+        block_size (Optional[int]): Copy block size; defaults to uploads.block_size_kb.
+
+    Raises:
+        UploadTooLargeError: The upload is larger than max_bytes.
+
+    Returns:
+        SavedUpload: Saved path, sha256 hex digest and size in bytes.
+    """
+    default_max, default_block = _upload_limits()
+    max_bytes = default_max if max_bytes is None else max_bytes
+    block_size = block_size or default_block
+
+    declared = getattr(uploaded_file, "size", None)
+    if isinstance(declared, int) and declared > max_bytes:
+        raise UploadTooLargeError(f"File exceeds the {max_bytes} byte upload limit")
+
+    out = Path(out)
+    tmp = out.with_name(f".{out.name}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp, "wb") as f:
+            for block in _iter_blocks(uploaded_file, block_size):
+                size += len(block)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"File exceeds the {max_bytes} byte upload limit")
+                digest.update(block)
+                f.write(block)
+        os.replace(tmp, out)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return SavedUpload(out, digest.hexdigest(), size)
+
+
+def save_uploads(uploaded_files: Iterable, target_dir: Path) -> List[SavedUpload]:
+    """Save uploaded files (Streamlit-like) and return their paths and content hashes."""
     try:
         target_dir.mkdir(parents=True, exist_ok=True)
-        saved: List[Path] = []
+        saved: List[SavedUpload] = []
         for uf in uploaded_files:
             name = getattr(uf, "name", "file")
             ext = Path(name).suffix.lower()
@@ -32,15 +140,16 @@ def save_uploaded_files(uploaded_files: Iterable, target_dir: Path) -> List[Path
                 log.warning("Unsupported file skipped", filename=name)
                 continue
             fname = f"{uuid.uuid4().hex[:8]}{ext}"
-            out = target_dir / fname
-            with open(out, "wb") as f:
-                if hasattr(uf, "read"):
-                    f.write(uf.read())
-                else:
-                    f.write(uf.getbuffer())  # fallback
-            saved.append(out)
-            log.info("File saved for ingestion", uploaded=name, saved_as=str(out))
+            upload = stream_upload(uf, target_dir / fname)
+            saved.append(upload)
+            log.info("File saved for ingestion", uploaded=name, saved_as=str(upload.path),
+                     size=upload.size, sha256=upload.sha256)
         return saved
     except Exception as e:
         log.error("Failed to save uploaded files", error=str(e), dir=str(target_dir))
-        raise DocumentPortalException("Failed to save uploaded files", e) from e
\ No newline at end of file
+        raise DocumentPortalException("Failed to save uploaded files", e) from e
+
+
+def save_uploaded_files(uploaded_files: Iterable, target_dir: Path) -> List[Path]:
+    """Save uploaded files (Streamlit-like) and return local paths."""
+    return [u.path for u in save_uploads(uploaded_files, target_dir)]
\ No newline at end of file
@@ -0,0 +1,232 @@
+from __future__ import annotations
+import asyncio
+import heapq
+import inspect
+import threading
+from itertools import chain
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_community.vectorstores import FAISS
+from pydantic import ConfigDict
+
+from logger.custom_logger import CustomLogger
+from utils.bm25_index import BM25Index, is_identifier, tokenize
+from utils.concurrency import get_executor
+
+log = CustomLogger().get_logger(__name__)
+
+# One searchable piece of an index: its vectorstore and (optionally) its BM25 index.
+Shard = Tuple[FAISS, Optional[BM25Index]]
+
+
+class RetrievalMetrics:
+    """Process-wide counters for which retrieval path served each query."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lexical_only = 0
+        self.hybrid = 0
+
+    def record(self, lexical_only: bool):
+        with self._lock:
+            if lexical_only:
+                self.lexical_only += 1
+            else:
+                self.hybrid += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.lexical_only + self.hybrid
+            return {
+                "lexical_only": self.lexical_only,
+                "hybrid": self.hybrid,
+                "lexical_only_ratio": round(self.lexical_only / total, 4) if total else 0.0,
+            }
+
+
+RETRIEVAL_METRICS = RetrievalMetrics()
+
+
+def rrf_fuse(rankings: List[List[str]], k: int, rrf_k: int = 60) -> List[str]:
+    """Reciprocal rank fusion of several ranked id lists; returns the top-k ids."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=scores.__getitem__, reverse=True)[:k]
+
+
+def _query_kwargs(embeddings) -> Dict[str, Any]:
+    # Providers with asymmetric embeddings (Google) need the query task type in batch calls.
+    params = inspect.signature(embeddings.embed_documents).parameters
+    return {"task_type": "RETRIEVAL_QUERY"} if "task_type" in params else {}
+
+
+def embed_queries(embeddings, queries: List[str]) -> List[List[float]]:
+    """Embed several search queries in one batched provider call."""
+    if not queries:
+        return []
+    return embeddings.embed_documents(queries, **_query_kwargs(embeddings))
+
+
+async def aembed_queries(embeddings, queries: List[str]) -> List[List[float]]:
+    if not queries:
+        return []
+    return await embeddings.aembed_documents(queries, **_query_kwargs(embeddings))
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses BM25 and FAISS results with reciprocal rank fusion, over one or more shards.
+
+    The question is embedded once; each shard is then searched in parallel and the
+    per-shard top results are merged (L2 distance for vectors, BM25 score for terms)
+    before fusion. Keyword-heavy questions (every content term is in the lexical
+    index and at least one is an identifier such as a clause number or SKU) are
+    answered from BM25 alone, which needs no call to the embedding API.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    shards: List[Shard]
+    k: int = 5
+    fetch_k: int = 20
+    rrf_k: int = 60
+    lexical: bool = True
+    lexical_fast_path: bool = True
+
+    @property
+    def embeddings(self):
+        return self.shards[0][0].embeddings
+
+    def is_lexical_only(self, query: str) -> bool:
+        if not (self.lexical and self.lexical_fast_path):
+            return False
+        terms = tokenize(query)
+        return (bool(terms) and any(is_identifier(t) for t in terms)
+                and all(any(bm25 is not None and bm25.df(t) for _, bm25 in self.shards) for t in terms))
+
+    # ---------- Per-shard work ----------
+
+    def _map(self, fn: Callable[[Shard], Any]) -> List[Any]:
+        if len(self.shards) == 1:
+            return [fn(self.shards[0])]
+        return list(get_executor("search").map(fn, self.shards))
+
+    async def _amap(self, fn: Callable[[Shard], Any]) -> List[Any]:
+        if len(self.shards) == 1:
+            return [fn(self.shards[0])]
+        loop = asyncio.get_running_loop()
+        pool = get_executor("search")
+        return list(await asyncio.gather(*(loop.run_in_executor(pool, fn, s) for s in self.shards)))
+
+    def _vector_search(self, vector: List[float]) -> Callable[[Shard], List[Tuple[Document, float]]]:
+        return lambda shard: shard[0].similarity_search_with_score_by_vector(vector, k=self.fetch_k)
+
+    def _lexical_search(self, query: str, limit: int) -> Callable[[Shard], List[Tuple[Document, float]]]:
+        def search(shard: Shard) -> List[Tuple[Document, float]]:
+            vs, bm25 = shard
+            if bm25 is None:
+                return []
+            hits = []
+            for doc_id, score in bm25.search(query, limit):
+                doc = vs.docstore.search(doc_id)  # type: ignore[attr-defined]
+                if isinstance(doc, Document):  # ids of uncommitted chunks come back as a message
+                    doc.id = doc.id or doc_id
+                    hits.append((doc, score))
+            return hits
+        return search
+
+    def _batch_vector_search(self, matrix: np.ndarray) -> Callable[[Shard], List[List[Tuple[Document, float]]]]:
+        """One FAISS search call per shard for all query vectors."""
+        def search(shard: Shard) -> List[List[Tuple[Document, float]]]:
+            vs = shard[0]
+            queries = matrix.copy()
+            if getattr(vs, "_normalize_L2", False):
+                faiss.normalize_L2(queries)
+            scores, indices = vs.index.search(queries, self.fetch_k)
+            out = []
+            for row_scores, row_ids in zip(scores, indices):
+                hits = []
+                for score, i in zip(row_scores, row_ids):
+                    if i == -1:
+                        continue
+                    doc_id = vs.index_to_docstore_id[i]
+                    doc = vs.docstore.search(doc_id)  # type: ignore[attr-defined]
+                    if isinstance(doc, Document):
+                        doc.id = doc.id or doc_id
+                        hits.append((doc, float(score)))
+                out.append(hits)
+            return out
+        return search
+
+    def retrieve_batch(self, queries: List[str], vectors: List[Optional[List[float]]]) -> List[List[Document]]:
+        """Retrieve for many queries at once, given their precomputed embeddings.
+
+        A query whose vector is None takes the lexical-only path.
+        """
+        embedded = [i for i, v in enumerate(vectors) if v is not None]
+        per_shard = (self._map(self._batch_vector_search(np.asarray([vectors[i] for i in embedded],
+                                                                    dtype=np.float32)))
+                     if embedded else [])
+        row_of = {i: row for row, i in enumerate(embedded)}
+        results: List[List[Document]] = []
+        for i, query in enumerate(queries):
+            if i not in row_of:
+                RETRIEVAL_METRICS.record(lexical_only=True)
+                results.append(self._top(self._map(self._lexical_search(query, self.k)), self.k, smallest=False))
+                continue
+            vector_docs = self._top([shard[row_of[i]] for shard in per_shard], self.fetch_k, smallest=True)
+            lexical_docs = (self._top(self._map(self._lexical_search(query, self.fetch_k)), self.fetch_k,
+                                      smallest=False)
+                            if self.lexical else [])
+            results.append(self._fuse(vector_docs, lexical_docs))
+        return results
+
+    # ---------- Merging ----------
+
+    @staticmethod
+    def _top(per_shard: Sequence[List[Tuple[Document, float]]], n: int, smallest: bool) -> List[Document]:
+        pick = heapq.nsmallest if smallest else heapq.nlargest
+        return [d for d, _ in pick(n, chain.from_iterable(per_shard), key=lambda hit: hit[1])]
+
+    def _fuse(self, vector_docs: List[Document], lexical_docs: List[Document]) -> List[Document]:
+        RETRIEVAL_METRICS.record(lexical_only=False)
+        if not self.lexical:
+            return vector_docs[: self.k]
+        by_id = {d.id: d for d in chain(vector_docs, lexical_docs) if d.id}
+        ids = rrf_fuse([[d.id for d in vector_docs if d.id], [d.id for d in lexical_docs if d.id]],
+                       self.k, self.rrf_k)
+        return [by_id[i] for i in ids]
+
+    # ---------- BaseRetriever ----------
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        if self.is_lexical_only(query):
+            RETRIEVAL_METRICS.record(lexical_only=True)
+            return self._top(self._map(self._lexical_search(query, self.k)), self.k, smallest=False)
+        vector = self.embeddings.embed_query(query)
+        vector_docs = self._top(self._map(self._vector_search(vector)), self.fetch_k, smallest=True)
+        lexical_docs = (self._top(self._map(self._lexical_search(query, self.fetch_k)), self.fetch_k, smallest=False)
+                        if self.lexical else [])
+        return self._fuse(vector_docs, lexical_docs)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        if self.is_lexical_only(query):
+            RETRIEVAL_METRICS.record(lexical_only=True)
+            return self._top(await self._amap(self._lexical_search(query, self.k)), self.k, smallest=False)
+        vector = await self.embeddings.aembed_query(query)
+        vector_docs = self._top(await self._amap(self._vector_search(vector)), self.fetch_k, smallest=True)
+        lexical_docs = (self._top(await self._amap(self._lexical_search(query, self.fetch_k)), self.fetch_k,
+                                  smallest=False)
+                        if self.lexical else [])
+        return self._fuse(vector_docs, lexical_docs)
@@ -1,8 +1,11 @@
 import os
 import sys
 import json
+import threading
+from typing import Any, Dict, Optional, Tuple
+import httpx
 from dotenv import load_dotenv
-from utils.config_loader import load_config
+from utils.config_loader import load_config_cached
 from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
 from langchain_groq import ChatGroq
 from logger import GLOBAL_LOGGER as log
@@ -63,9 +66,13 @@ class ModelLoader:
             log.info("Running in PRODUCTION mode")
 
         self.api_key_mgr = ApiKeyManager()
-        self.config = load_config()
         log.info("YAML config loaded", config_keys=list(self.config.keys()))
 
+    @property
+    def config(self) -> dict:
+        """Current YAML config; re-read only when the file changes on disk."""
+        return load_config_cached()
+
     def load_embeddings(self):
         """
         Load and return embedding model from Google Generative AI.
@@ -79,12 +86,15 @@ class ModelLoader:
             log.error("Error loading embedding model", error=str(e))
             raise DocumentPortalException("Failed to load embedding model", sys)
 
-    def load_llm(self):
+    def load_llm(self, provider_key: Optional[str] = None,
+                 http_client: Optional[httpx.Client] = None,
+                 http_async_client: Optional[httpx.AsyncClient] = None):
         """
         Load and return the configured LLM model.
+        HTTP clients, when given, are reused by providers that accept them (Groq).
         """
         llm_block = self.config["llm"]
-        provider_key = os.getenv("LLM_PROVIDER", "google")
+        provider_key = provider_key or os.getenv("LLM_PROVIDER", "google")
 
         if provider_key not in llm_block:
             log.error("LLM provider not found in config", provider=provider_key)
@@ -111,6 +121,8 @@ class ModelLoader:
                 model=model_name,
                 api_key=self.api_key_mgr.get("GROQ_API_KEY"), #type: ignore
                 temperature=temperature,
+                http_client=http_client,
+                http_async_client=http_async_client,
             )
 
         # elif provider == "openai":
@@ -126,6 +138,127 @@ class ModelLoader:
             raise ValueError(f"Unsupported LLM provider: {provider}")
 
 
+class ModelRegistry:
+    """
+    Process-level holder of LLM and embedding clients.
+
+    One ModelLoader (dotenv + API keys) is built per process and one client per
+    provider/model settings is kept, so their connection pools are reused across
+    requests. Clients are rebuilt when the matching config block changes.
+    """
+
+    def __init__(self, loader: Optional[ModelLoader] = None,
+                 max_keepalive_connections: int = 20, keepalive_expiry: float = 60.0):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._llms: Dict[Tuple, Any] = {}
+        self._embeddings: Dict[Tuple, Any] = {}
+        self._limits = httpx.Limits(max_keepalive_connections=max_keepalive_connections,
+                                    keepalive_expiry=keepalive_expiry)
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def loader(self) -> ModelLoader:
+        with self._lock:
+            if self._loader is None:
+                self._loader = ModelLoader()
+            return self._loader
+
+    @staticmethod
+    def _settings_key(name: str, block: dict) -> Tuple:
+        return (name,) + tuple(sorted((k, str(v)) for k, v in block.items()))
+
+    def get_llm(self, provider_key: Optional[str] = None):
+        """Return the shared LLM client for provider_key (defaults to LLM_PROVIDER)."""
+        loader = self.loader
+        provider_key = provider_key or os.getenv("LLM_PROVIDER", "google")
+        key = self._settings_key(provider_key, loader.config.get("llm", {}).get(provider_key, {}))
+        with self._lock:
+            llm = self._llms.get(key)
+            if llm is None:
+                if self._http_client is None:
+                    self._http_client = httpx.Client(limits=self._limits)
+                    self._http_async_client = httpx.AsyncClient(limits=self._limits)
+                llm = loader.load_llm(provider_key,
+                                      http_client=self._http_client,
+                                      http_async_client=self._http_async_client)
+                # Drop clients built for an older version of this provider's config.
+                self._llms = {k: v for k, v in self._llms.items() if k[0] != provider_key}
+                self._llms[key] = llm
+                log.info("LLM client registered", provider=provider_key)
+            return llm
+
+    def get_embeddings(self):
+        """Return the shared embeddings client for the configured embedding model."""
+        loader = self.loader
+        key = self._settings_key("embedding_model", loader.config.get("embedding_model", {}))
+        with self._lock:
+            emb = self._embeddings.get(key)
+            if emb is None:
+                emb = loader.load_embeddings()
+                self._embeddings = {key: emb}
+                log.info("Embeddings client registered", model=key)
+            return emb
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"llm_clients": len(self._llms), "embedding_clients": len(self._embeddings)}
+
+    def close(self) -> Optional[httpx.AsyncClient]:
+        """Drop cached clients and close the shared HTTP pool."""
+        with self._lock:
+            self._llms.clear()
+            self._embeddings.clear()
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+            async_client, self._http_async_client = self._http_async_client, None
+        return async_client
+
+    async def aclose(self):
+        """close(), plus closing the async HTTP pool on the running loop."""
+        async_client = self.close()
+        if async_client is not None:
+            await async_client.aclose()
+
+
+_REGISTRY: Optional[ModelRegistry] = None
+_REGISTRY_LOCK = threading.Lock()
+
+
+def init_model_registry() -> ModelRegistry:
+    """Create (or return) the process-level registry. Called from the app lifespan."""
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            _REGISTRY = ModelRegistry()
+            log.info("Model registry created")
+        return _REGISTRY
+
+
+def get_model_registry() -> ModelRegistry:
+    """Return the process-level registry, creating it lazily outside the API."""
+    return _REGISTRY if _REGISTRY is not None else init_model_registry()
+
+
+async def close_model_registry():
+    """Close and forget the process-level registry. Called on app shutdown."""
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        registry, _REGISTRY = _REGISTRY, None
+    if registry is not None:
+        await registry.aclose()
+        log.info("Model registry closed")
+
+
+def llm_identity(provider_key: Optional[str] = None) -> str:
+    """"<LLM_PROVIDER>:<provider>:<model_name>" of the configured LLM, for result cache keys."""
+    provider_key = provider_key or os.getenv("LLM_PROVIDER", "google")
+    block = load_config_cached().get("llm", {}).get(provider_key, {})
+    return f"{provider_key}:{block.get('provider')}:{block.get('model_name')}"
+
+
 if __name__ == "__main__":
     loader = ModelLoader()
 
@@ -0,0 +1,136 @@
+from __future__ import annotations
+import difflib
+import hashlib
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+_SPACE = re.compile(r"\s+")
+
+NO_CHANGE = "NO CHANGE"
+
+# Above this many page pairs in one replaced block, pages are paired by position
+# instead of by similarity (the fuzzy alignment is quadratic in block size).
+_MAX_FUZZY_PAIRS = 400
+
+
+@dataclass
+class PageChange:
+    """One aligned page pair that differs; either side is None for an added/removed page."""
+    page: str
+    ref_page: Optional[int]
+    act_page: Optional[int]
+    diff: str
+
+
+@dataclass
+class PageDiff:
+    """Result of diff_pages(): rows in page order, changed pairs still to be described."""
+    order: List[str] = field(default_factory=list)
+    unchanged: Dict[str, str] = field(default_factory=dict)
+    changed: List[PageChange] = field(default_factory=list)
+
+    @property
+    def identical(self) -> bool:
+        return not self.changed
+
+
+def _fingerprint(text: str) -> str:
+    # Whitespace-insensitive, so re-extraction noise does not count as a change.
+    return hashlib.sha1(_SPACE.sub(" ", text).strip().encode("utf-8")).hexdigest()
+
+
+def _similarity(a: str, b: str) -> float:
+    m = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    return m.ratio() if m.quick_ratio() > 0 else 0.0
+
+
+def _pair_block(ref: Sequence[str], act: Sequence[str], i0: int, j0: int,
+                min_similarity: float) -> List[Tuple[Optional[int], Optional[int]]]:
+    """Order-preserving pairing of a replaced block that maximizes total similarity.
+
+    Pages less similar than min_similarity are reported as removed/added instead.
+    """
+    m, n = len(ref), len(act)
+    if m * n > _MAX_FUZZY_PAIRS:
+        pairs: List[Tuple[Optional[int], Optional[int]]] = [(i0 + k, j0 + k) for k in range(min(m, n))]
+        pairs += [(i0 + k, None) for k in range(n, m)] + [(None, j0 + k) for k in range(m, n)]
+        return pairs
+    sim = [[_similarity(r, a) for a in act] for r in ref]
+    best = [[0.0] * (n + 1) for _ in range(m + 1)]
+    for i in range(m - 1, -1, -1):
+        for j in range(n - 1, -1, -1):
+            take = best[i + 1][j + 1] + sim[i][j] if sim[i][j] >= min_similarity else -1.0
+            best[i][j] = max(take, best[i + 1][j], best[i][j + 1])
+    pairs, i, j = [], 0, 0
+    while i < m and j < n:
+        if sim[i][j] >= min_similarity and best[i][j] == best[i + 1][j + 1] + sim[i][j]:
+            pairs.append((i0 + i, j0 + j))
+            i, j = i + 1, j + 1
+        elif best[i][j] == best[i + 1][j]:
+            pairs.append((i0 + i, None))
+            i += 1
+        else:
+            pairs.append((None, j0 + j))
+            j += 1
+    pairs += [(i0 + k, None) for k in range(i, m)] + [(None, j0 + k) for k in range(j, n)]
+    return pairs
+
+
+def align_pages(ref: Sequence[str], act: Sequence[str],
+                min_similarity: float = 0.5) -> List[Tuple[Optional[int], Optional[int]]]:
+    """Align two page lists (0-based indexes), detecting inserted and removed pages.
+
+    Identical pages are matched by content hash; the pages in between are paired by
+    text similarity.
+    """
+    matcher = difflib.SequenceMatcher(None, [_fingerprint(p) for p in ref], [_fingerprint(p) for p in act],
+                                      autojunk=False)
+    pairs: List[Tuple[Optional[int], Optional[int]]] = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            pairs += [(i1 + k, j1 + k) for k in range(i2 - i1)]
+        elif tag == "delete":
+            pairs += [(i, None) for i in range(i1, i2)]
+        elif tag == "insert":
+            pairs += [(None, j) for j in range(j1, j2)]
+        else:
+            pairs += _pair_block(ref[i1:i2], act[j1:j2], i1, j1, min_similarity)
+    return pairs
+
+
+def page_label(ref_page: Optional[int], act_page: Optional[int]) -> str:
+    """Row label of an aligned pair, with 1-based page numbers."""
+    if act_page is None:
+        return f"{ref_page + 1} (removed)"  # type: ignore[operator]
+    if ref_page is None:
+        return f"{act_page + 1} (added)"
+    if ref_page == act_page:
+        return str(act_page + 1)
+    return f"{ref_page + 1} -> {act_page + 1}"
+
+
+def diff_pages(ref: Sequence[str], act: Sequence[str], context_lines: int = 2,
+               min_similarity: float = 0.5) -> PageDiff:
+    """Align the pages of two documents and diff the pairs that changed."""
+    result = PageDiff()
+    for i, j in align_pages(ref, act, min_similarity):
+        label = page_label(i, j)
+        result.order.append(label)
+        if i is not None and j is not None and _fingerprint(ref[i]) == _fingerprint(act[j]):
+            result.unchanged[label] = NO_CHANGE
+            continue
+        diff = "\n".join(difflib.unified_diff(
+            ref[i].splitlines() if i is not None else [],
+            act[j].splitlines() if j is not None else [],
+            fromfile=f"reference page {i + 1}" if i is not None else "reference (no page)",
+            tofile=f"actual page {j + 1}" if j is not None else "actual (no page)",
+            n=context_lines, lineterm="",
+        ))
+        result.changed.append(PageChange(label, i, j, diff))
+    return result
+
+
+def format_changes(changes: Sequence[PageChange]) -> str:
+    """Prompt text for the changed page pairs."""
+    return "\n\n".join(f"### Page {c.page}\n{c.diff}" for c in changes)
@@ -0,0 +1,103 @@
+from __future__ import annotations
+import os
+import math
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+from logger.custom_logger import CustomLogger
+from utils.config_loader import load_config_cached
+
+log = CustomLogger().get_logger(__name__)
+
+# Bump the suffix whenever extraction output changes, so cached page text is not reused.
+EXTRACTOR_VERSION = f"pymupdf{fitz.VersionBind}-v1"
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_WORKERS = 0
+_POOL_LOCK = threading.Lock()
+
+
+def extraction_settings() -> Tuple[int, int]:
+    cfg = load_config_cached().get("pdf_extraction", {})
+    max_workers = int(cfg.get("max_workers") or min(4, os.cpu_count() or 1))
+    min_pages_parallel = int(cfg.get("min_pages_parallel", 64))
+    return max_workers, min_pages_parallel
+
+
+def _get_pool(max_workers: int) -> ProcessPoolExecutor:
+    """Shared worker pool, so requests do not pay process start-up on every PDF."""
+    global _POOL, _POOL_WORKERS
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_WORKERS != max_workers:
+            if _POOL is not None:
+                _POOL.shutdown(wait=False)
+            # spawn, not fork: the API process is multi-threaded.
+            _POOL = ProcessPoolExecutor(max_workers=max_workers,
+                                        mp_context=multiprocessing.get_context("spawn"))
+            _POOL_WORKERS = max_workers
+        return _POOL
+
+
+def shutdown_pool(wait: bool = False):
+    """Stop the extraction worker processes (app shutdown); the next extraction starts a new pool."""
+    global _POOL, _POOL_WORKERS
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=wait, cancel_futures=True)
+        _POOL = None
+        _POOL_WORKERS = 0
+
+
+def _extract_range(pdf_path: str, start: int, stop: int) -> List[str]:
+    # Runs in a worker process: one open per page range.
+    with fitz.open(pdf_path) as doc:
+        return [doc.load_page(i).get_text() for i in range(start, stop)]  # type: ignore
+
+
+def page_ranges(page_count: int, parts: int) -> List[Tuple[int, int]]:
+    """Split [0, page_count) into at most `parts` contiguous, near-equal ranges."""
+    parts = max(1, min(parts, page_count))
+    size = math.ceil(page_count / parts)
+    return [(s, min(s + size, page_count)) for s in range(0, page_count, size)]
+
+
+def extract_pages(pdf_path, max_workers: Optional[int] = None,
+                  min_pages_parallel: Optional[int] = None,
+                  reject_encrypted: bool = False) -> List[str]:
+    """Extract the text of every page of a PDF, in page order.
+
+    PDFs with at least min_pages_parallel pages are split into one page range per
+    worker and extracted in a process pool; smaller ones are read serially.
+
+    Args:
+        pdf_path: Path to the PDF.
+        max_workers (Optional[int]): Worker processes; defaults to pdf_extraction.max_workers.
+        min_pages_parallel (Optional[int]): Page count from which the pool is used.
+        reject_encrypted (bool): Raise ValueError for encrypted PDFs.
+
+    Returns:
+        List[str]: One string per page.
+    """
+    default_workers, default_min = extraction_settings()
+    max_workers = max_workers or default_workers
+    min_pages_parallel = default_min if min_pages_parallel is None else min_pages_parallel
+    path = str(pdf_path)
+
+    with fitz.open(path) as doc:
+        if reject_encrypted and doc.is_encrypted:
+            raise ValueError(f"PDF is encrypted: {Path(path).name}")
+        count = doc.page_count
+        if max_workers <= 1 or count < min_pages_parallel:
+            return [doc.load_page(i).get_text() for i in range(count)]  # type: ignore
+
+    ranges = page_ranges(count, max_workers)
+    pool = _get_pool(max_workers)
+    futures = [pool.submit(_extract_range, path, start, stop) for start, stop in ranges]
+    pages = [text for fut in futures for text in fut.result()]
+    log.info("PDF extracted in parallel", file=path, pages=count, ranges=len(ranges))
+    return pages
@@ -0,0 +1,74 @@
+from __future__ import annotations
+import re
+import threading
+from typing import Any, Dict, Optional, Sequence
+
+# Words that only make sense relative to earlier turns ("what does *it* cost?").
+_REFERENTIAL = frozenset({
+    "it", "its", "this", "that", "these", "those", "they", "them", "their", "theirs",
+    "he", "him", "his", "she", "her", "hers", "former", "latter", "above", "previous",
+    "earlier", "same", "mentioned", "aforementioned", "one", "ones", "else", "there",
+})
+# Openers that continue the previous question instead of asking a new one.
+_FOLLOW_UP_PREFIXES = ("and ", "also ", "but ", "so ", "then ", "what about", "how about", "why not", "more ")
+_MIN_STANDALONE_WORDS = 4
+_WORD = re.compile(r"[a-z']+")
+
+
+def needs_rewrite(question: str, chat_history: Optional[Sequence[Any]]) -> bool:
+    """Cheap local check for whether a question must be rewritten against the history.
+
+    With no history the rewrite can only echo the question back. With history, a
+    question is treated as self-contained unless it is very short, opens like a
+    follow-up, or leans on pronouns/references to earlier turns.
+    """
+    if not chat_history:
+        return False
+    text = question.strip().lower()
+    words = _WORD.findall(text)
+    if len(words) < _MIN_STANDALONE_WORDS:
+        return True
+    if text.startswith(_FOLLOW_UP_PREFIXES):
+        return True
+    return any(w in _REFERENTIAL for w in words)
+
+
+class RewriteMetrics:
+    """Process-wide counters for the question-rewrite step of the chat chain."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rewritten = 0
+        self.skipped_no_history = 0
+        self.skipped_self_contained = 0
+        self.rewrite_seconds = 0.0
+
+    def record_rewrite(self, seconds: float):
+        with self._lock:
+            self.rewritten += 1
+            self.rewrite_seconds += seconds
+
+    def record_skip(self, had_history: bool):
+        with self._lock:
+            if had_history:
+                self.skipped_self_contained += 1
+            else:
+                self.skipped_no_history += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            skipped = self.skipped_no_history + self.skipped_self_contained
+            total = skipped + self.rewritten
+            avg_ms = 1000 * self.rewrite_seconds / self.rewritten if self.rewritten else 0.0
+            return {
+                "rewritten": self.rewritten,
+                "skipped_no_history": self.skipped_no_history,
+                "skipped_self_contained": self.skipped_self_contained,
+                "skip_ratio": round(skipped / total, 4) if total else 0.0,
+                "avg_rewrite_latency_ms": round(avg_ms, 1),
+                # Estimated from the observed cost of the rewrites that did run.
+                "est_latency_saved_ms": round(skipped * avg_ms, 1),
+            }
+
+
+REWRITE_METRICS = RewriteMetrics()
@@ -0,0 +1,167 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from logger.custom_logger import CustomLogger
+from utils.config_loader import load_config_cached
+
+log = CustomLogger().get_logger(__name__)
+
+
+def result_key(*parts: Any) -> str:
+    """Stable cache key for a tuple of JSON-serializable parts (hashes, versions, model ids)."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def prompt_version(*prompts) -> str:
+    """Short fingerprint of prompt templates; editing a prompt changes it."""
+    text = "\n".join(p.pretty_repr() if hasattr(p, "pretty_repr") else str(p) for p in prompts)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class ResultCache:
+    """
+    Persistent cache of JSON-serializable LLM results, stored in SQLite.
+
+    Results live in namespaces (e.g. "compare") under caller-built keys, optionally
+    tagged (e.g. with the source document hash) so that every result derived from
+    one input can be invalidated at once. Entries expire `ttl_seconds` after they
+    were written, and the least recently used are evicted once there are more than
+    `max_entries`. Hit/miss counters are kept per namespace.
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 2000, ttl_seconds: float = 7 * 24 * 3600):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, tag TEXT,"
+            " created_at REAL NOT NULL, used_at REAL NOT NULL, PRIMARY KEY (namespace, key));"
+            "CREATE INDEX IF NOT EXISTS results_used ON results (used_at);"
+        )
+        if "tag" not in {row[1] for row in self._conn.execute("PRAGMA table_info(results)")}:
+            self._conn.execute("ALTER TABLE results ADD COLUMN tag TEXT")  # caches written before tags
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_tag ON results (namespace, tag)")
+        self._conn.commit()
+        self._hits: Dict[str, int] = defaultdict(int)
+        self._misses: Dict[str, int] = defaultdict(int)
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM results WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM results WHERE namespace = ? AND key = ?", (namespace, key))
+                self._conn.commit()
+                self.expirations += 1
+                row = None
+            if row is None:
+                self._misses[namespace] += 1
+                return None
+            self._conn.execute("UPDATE results SET used_at = ? WHERE namespace = ? AND key = ?",
+                               (now, namespace, key))
+            self._conn.commit()
+            self._hits[namespace] += 1
+        return json.loads(row[0])
+
+    def put(self, namespace: str, key: str, value: Any, tag: Optional[str] = None):
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False, default=str)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (namespace, key, value, tag, created_at, used_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (namespace, key, payload, tag, now, now),
+            )
+            expired = self._conn.execute("DELETE FROM results WHERE created_at < ?",
+                                         (now - self.ttl_seconds,)).rowcount
+            excess = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY used_at LIMIT ?)",
+                    (excess,),
+                )
+                self.evictions += excess
+                log.info("Cached results evicted", count=excess)
+            self._conn.commit()
+            self.expirations += expired
+
+    def invalidate(self, namespace: str, tag: Optional[str] = None) -> int:
+        """Drop the namespace's results carrying `tag` (all of them if tag is None); returns the count."""
+        with self._lock:
+            if tag is None:
+                dropped = self._conn.execute("DELETE FROM results WHERE namespace = ?", (namespace,)).rowcount
+            else:
+                dropped = self._conn.execute("DELETE FROM results WHERE namespace = ? AND tag = ?",
+                                             (namespace, tag)).rowcount
+            self._conn.commit()
+            self.invalidations += dropped
+        log.info("Cached results invalidated", namespace=namespace, tag=tag, count=dropped)
+        return dropped
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = dict(self._conn.execute("SELECT namespace, COUNT(*) FROM results GROUP BY namespace"))
+            namespaces = set(entries) | set(self._hits) | set(self._misses)
+            out: Dict[str, Any] = {
+                "entries": sum(entries.values()),
+                "max_entries": self.max_entries,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+            for ns in sorted(namespaces):
+                hits, misses = self._hits[ns], self._misses[ns]
+                out[ns] = {
+                    "entries": entries.get(ns, 0),
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+                }
+            return out
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_CACHE: Optional[ResultCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """Return the process-wide result cache (`result_cache` block of config.yaml), or None if disabled."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            cfg = load_config_cached().get("result_cache", {})
+            if not cfg.get("enabled", True):
+                return None
+            _CACHE = ResultCache(
+                os.getenv("RESULT_CACHE_PATH", cfg.get("db_path", os.path.join("cache", "results.sqlite"))),
+                max_entries=int(cfg.get("max_entries", 2000)),
+                ttl_seconds=float(cfg.get("ttl_seconds", 7 * 24 * 3600)),
+            )
+        return _CACHE
@@ -0,0 +1,121 @@
+from __future__ import annotations
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_community.vectorstores import FAISS
+
+from logger.custom_logger import CustomLogger
+from utils.bm25_index import BM25Index
+from utils.concurrency import get_executor
+from utils.faiss_segments import SegmentedFaissStore, atomic_write_text, dir_lock, docstore_items
+from utils.vectorstore_cache import VECTORSTORE_CACHE
+
+log = CustomLogger().get_logger(__name__)
+
+
+class ShardLayout:
+    """
+    Sharded layout of the global (use_session_dirs=False) index.
+
+    <root>/
+        shards.json          {"shards": ["shard_0001", ...]}; newest shard last
+        shards/shard_NNNN/   one SegmentedFaissStore directory (+ bm25.jsonl) per shard
+        index.faiss, ...     a pre-sharding global index, kept as a read-only shard
+
+    Each shard holds at most `shard_size` chunks, so an add only loads and writes
+    the newest shard, and a query can search the shards in parallel.
+    """
+
+    MANIFEST = "shards.json"
+    SHARD_DIR = "shards"
+
+    def __init__(self, root, shard_size: int = 50_000, index_name: str = "index"):
+        self.root = Path(root)
+        self.shard_size = shard_size
+        self.index_name = index_name
+        self._lock = dir_lock(self.root, "shards")
+
+    def is_sharded(self) -> bool:
+        return (self.root / self.MANIFEST).exists()
+
+    def _shards(self) -> List[str]:
+        path = self.root / self.MANIFEST
+        if not path.exists():
+            return []
+        return json.loads(path.read_text(encoding="utf-8")).get("shards", [])
+
+    def _store(self, shard_dir: Path) -> SegmentedFaissStore:
+        return SegmentedFaissStore(shard_dir, index_name=self.index_name)
+
+    def shard_dirs(self) -> List[Path]:
+        """Every shard directory to search, the legacy root index first."""
+        with self._lock:
+            dirs = [self.root / self.SHARD_DIR / name for name in self._shards()]
+        if self._store(self.root).exists():
+            dirs.insert(0, self.root)
+        return dirs
+
+    def rows(self) -> Dict[str, bool]:
+        """Chunk fingerprints of all shards, for de-duplication across the whole index."""
+        rows: Dict[str, bool] = {}
+        for d in self.shard_dirs():
+            rows.update(self._store(d).rows())
+        return rows
+
+    def assign(self, count: int) -> List[Tuple[Path, int]]:
+        """Split `count` new chunks over the newest shard and as many new shards as needed.
+
+        Returns:
+            List[Tuple[Path, int]]: (shard directory, number of chunks) in write order.
+        """
+        plan: List[Tuple[Path, int]] = []
+        with self._lock:
+            shards = self._shards()
+            if shards:
+                newest = self.root / self.SHARD_DIR / shards[-1]
+                room = self.shard_size - len(self._store(newest).rows())
+                if room > 0:
+                    plan.append((newest, min(room, count)))
+                    count -= plan[-1][1]
+            while count > 0:
+                name = f"shard_{len(shards) + 1:04d}"
+                shards.append(name)
+                shard_dir = self.root / self.SHARD_DIR / name
+                shard_dir.mkdir(parents=True, exist_ok=True)
+                plan.append((shard_dir, min(self.shard_size, count)))
+                count -= plan[-1][1]
+            self.root.mkdir(parents=True, exist_ok=True)
+            atomic_write_text(self.root / self.MANIFEST, json.dumps({"shards": shards}))
+        log.info("Shards assigned", root=str(self.root), plan=[(p.name, n) for p, n in plan])
+        return plan
+
+
+def load_shards(index_dirs: Sequence[Path], index_name: str, embeddings,
+                with_bm25: bool = True) -> List[Tuple[FAISS, Optional[BM25Index]]]:
+    """Load (vectorstore, BM25 index) for each directory in parallel, via the vectorstore cache.
+
+    Directories without a committed index are skipped.
+    """
+    def load(index_dir: Path):
+        vs = VECTORSTORE_CACHE.get_or_load(
+            index_dir, index_name,
+            # Base index plus any delta segments; ok if you trust the index.
+            lambda: SegmentedFaissStore(index_dir, index_name=index_name).load(embeddings),
+        )
+        if vs is None:
+            return None
+        if not with_bm25:
+            return vs, None
+        bm25 = VECTORSTORE_CACHE.get_or_load(
+            index_dir, f"{index_name}.bm25",
+            # Indexes built before BM25 existed get it from the docstore, locally.
+            lambda: BM25Index.load(index_dir) or BM25Index.from_documents(docstore_items(vs)),
+        )
+        return vs, bm25
+
+    if len(index_dirs) > 1:
+        loaded = list(get_executor("search").map(load, index_dirs))
+    else:
+        loaded = [load(d) for d in index_dirs]
+    return [shard for shard in loaded if shard is not None]
@@ -0,0 +1,143 @@
+from __future__ import annotations
+import os
+import gzip
+import json
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from logger.custom_logger import CustomLogger
+from utils.config_loader import load_config_cached
+
+log = CustomLogger().get_logger(__name__)
+
+
+class ExtractedTextCache:
+    """
+    On-disk cache of per-page extracted text, keyed by file content hash and
+    extractor version. Entries are gzip'd JSON files; an entry's mtime is bumped on
+    every hit, and the least recently used entries are evicted over the disk quota.
+    """
+
+    SUFFIX = ".json.gz"
+    TMP_PREFIX = ".tmp_"
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._bytes = sum(p.stat().st_size for p in self._entries())
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _entries(self) -> List[Path]:
+        # In-flight writes (see put) are not entries yet.
+        return [p for p in self.cache_dir.glob(f"*{self.SUFFIX}") if not p.name.startswith(self.TMP_PREFIX)]
+
+    def _path(self, content_hash: str, version: str) -> Path:
+        return self.cache_dir / f"{content_hash}_{version}{self.SUFFIX}"
+
+    def get(self, content_hash: str, version: str) -> Optional[Dict[str, Any]]:
+        """Return {"pages": [...], "encrypted": bool} for a cached file, or None."""
+        path = self._path(content_hash, version)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)  # LRU: mark as recently used
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except (OSError, ValueError, EOFError):
+            # Truncated or corrupt entry: drop it and treat as a miss.
+            log.warning("Corrupt extracted-text cache entry removed", file=path.name)
+            with self._lock:
+                self.misses += 1
+                try:
+                    size = path.stat().st_size
+                    path.unlink()
+                    self._bytes -= size
+                except FileNotFoundError:
+                    pass
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    def put(self, content_hash: str, version: str, pages: List[str], encrypted: bool = False):
+        """Store a file's pages. Best effort: a failed write is logged, never raised."""
+        path = self._path(content_hash, version)
+        tmp = None
+        try:
+            # One temp file per writer, so concurrent puts of the same key don't collide.
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix=f"{self.TMP_PREFIX}{path.name}.")
+            with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8", compresslevel=6) as f:
+                json.dump({"pages": pages, "encrypted": encrypted}, f, ensure_ascii=False)
+            with self._lock:
+                old = path.stat().st_size if path.exists() else 0
+                os.replace(tmp, path)
+                tmp = None
+                self._bytes += path.stat().st_size - old
+                self._evict()
+        except OSError as e:
+            log.warning("Extracted text not cached", file=path.name, error=str(e))
+        finally:
+            if tmp is not None:
+                try:
+                    os.unlink(tmp)
+                except FileNotFoundError:
+                    pass
+
+    def _evict(self):
+        if self._bytes <= self.max_bytes:
+            return
+        entries = []
+        for p in self._entries():
+            try:
+                entries.append((p.stat().st_mtime, p))
+            except FileNotFoundError:
+                continue  # removed concurrently
+        entries.sort(key=lambda e: e[0])
+        for _, p in entries:
+            if self._bytes <= self.max_bytes:
+                break
+            try:
+                size = p.stat().st_size
+                p.unlink()
+            except FileNotFoundError:
+                continue
+            self._bytes -= size
+            self.evictions += 1
+            log.info("Extracted text evicted from cache", file=p.name)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_CACHE: Optional[ExtractedTextCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_text_cache() -> ExtractedTextCache:
+    """Return the process-wide extracted-text cache (`text_cache` block of config.yaml)."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            cfg = load_config_cached().get("text_cache", {})
+            _CACHE = ExtractedTextCache(
+                cfg.get("dir", os.path.join("cache", "extracted_text")),
+                int(float(cfg.get("max_disk_mb", 512)) * 1024 * 1024),
+            )
+        return _CACHE
@@ -0,0 +1,11 @@
+from __future__ import annotations
+import math
+
+# Provider tokenizers differ (Gemini, Groq-hosted models, OpenAI), so budgets use a
+# provider-neutral estimate: ~4 characters per token for English prose.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of `text` for budgeting prompt size."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
@@ -0,0 +1,145 @@
+from __future__ import annotations
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from logger.custom_logger import CustomLogger
+
+log = CustomLogger().get_logger(__name__)
+
+INDEX_FILE_SUFFIXES = (".faiss", ".pkl")
+
+
+def index_footprint(index_dir: Path) -> Tuple[int, float]:
+    """Return (total bytes, newest mtime) of the FAISS files of index_dir.
+
+    Only the directory itself and its delta segments count; nested session or
+    shard directories are separate indexes with their own cache entries.
+    """
+    total, newest = 0, 0.0
+    for folder in (Path(index_dir), Path(index_dir) / "segments"):
+        try:
+            entries = list(os.scandir(folder))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if not entry.name.endswith(INDEX_FILE_SUFFIXES) or not entry.is_file():
+                continue
+            st = entry.stat()
+            total += st.st_size
+            newest = max(newest, st.st_mtime)
+    return total, newest
+
+
+class VectorStoreCache:
+    """
+    Process-wide LRU cache of loaded FAISS vectorstores.
+
+    Entries are keyed by (resolved index directory, index name) and bounded both by
+    entry count and by the on-disk size of the index files they were loaded from.
+    An entry whose files changed on disk since it was loaded is treated as a miss.
+    """
+
+    def __init__(self, max_entries: int = 16, max_bytes: int = 1024 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(index_dir, index_name: str) -> Tuple[str, str]:
+        return str(Path(index_dir).resolve()), index_name
+
+    def get_or_load(self, index_dir, index_name: str, loader: Callable[[], Any]) -> Any:
+        """Return the cached vectorstore for index_dir/index_name, loading it on a miss.
+
+        Args:
+            index_dir: Directory the index was saved to.
+            index_name (str): Name passed to save_local()/load_local().
+            loader (Callable[[], Any]): Zero-arg callable that loads the vectorstore.
+
+        Returns:
+            Any: The loaded vectorstore.
+        """
+        key = self._key(index_dir, index_name)
+        size, mtime = index_footprint(Path(key[0]))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["mtime"] == mtime and entry["bytes"] == size:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["store"]
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+
+        # Load outside the lock so a slow deserialization does not block other indexes.
+        store = loader()
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if size <= self.max_bytes:
+                self._entries[key] = {"store": store, "bytes": size, "mtime": mtime}
+                self._bytes += size
+                self._evict()
+            log.info("Vectorstore cached", index_dir=key[0], index_name=index_name,
+                     bytes=size, entries=len(self._entries))
+        return store
+
+    def invalidate(self, index_dir, index_name: Optional[str] = None) -> int:
+        """Drop cached entries for index_dir (all index names unless one is given)."""
+        resolved = str(Path(index_dir).resolve())
+        with self._lock:
+            keys = [k for k in self._entries
+                    if k[0] == resolved and (index_name is None or k[1] == index_name)]
+            for k in keys:
+                self._drop(k)
+            self.invalidations += len(keys)
+        if keys:
+            log.info("Vectorstore cache invalidated", index_dir=resolved, dropped=len(keys))
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry["bytes"]
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            key, _ = next(iter(self._entries.items()))
+            self._drop(key)
+            self.evictions += 1
+            log.info("Vectorstore evicted from cache", index_dir=key[0], index_name=key[1])
+
+
+VECTORSTORE_CACHE = VectorStoreCache(
+    max_entries=int(os.getenv("VECTORSTORE_CACHE_MAX_ENTRIES", "16")),
+    max_bytes=int(os.getenv("VECTORSTORE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024))),
+)